@@ -0,0 +1,208 @@
+import csv
+
+import frappe
+from frappe import _
+from frappe.utils import now
+
+from bs_space.bulk_naming import get_series, reserve_names
+
+ACTIVITY_DOCTYPE = "Business Activity"
+BATCH_SIZE = 500
+REALTIME_EVENT = "bs_space_activity_catalogue"
+
+# catalogue fields and the column headers authorities use for them (matched case-insensitively)
+COLUMNS = {
+	"activity_code": ("activity_code", "activity code", "code", "isic code", "isic"),
+	"activity_name": ("activity_name", "activity name", "name", "activity"),
+	"activity_group": ("activity_group", "activity group", "group"),
+	"activity_master_number": ("activity_master_number", "activity master number", "master number"),
+	"license_type": ("license_type", "license type", "licence type"),
+	"allowed_facility_type": ("allowed_facility_type", "allowed facility type", "facility type"),
+	"required_documents": ("required_documents", "required documents", "required documents or approvals"),
+	"description": ("description",),
+}
+FIELDS = tuple(COLUMNS)
+
+
+# ---- reading ----
+
+
+def _iter_csv(path):
+	with open(path, newline="", encoding="utf-8-sig") as f:
+		yield from csv.reader(f)
+
+
+def _iter_xlsx(path):
+	from openpyxl import load_workbook
+
+	# read-only mode streams rows instead of loading the whole sheet
+	workbook = load_workbook(path, read_only=True, data_only=True)
+	try:
+		yield from workbook.worksheets[0].iter_rows(values_only=True)
+	finally:
+		workbook.close()
+
+
+def _column_positions(header):
+	labels = [str(h or "").strip().lower() for h in header]
+	positions = {}
+	for fieldname, aliases in COLUMNS.items():
+		for alias in aliases:
+			if alias in labels:
+				positions[fieldname] = labels.index(alias)
+				break
+	if "activity_code" not in positions or "activity_name" not in positions:
+		frappe.throw(_("The catalogue needs an activity code and an activity name column."))
+	return positions
+
+
+def iter_catalogue(path):
+	"""Catalogue rows as dicts of FIELDS, read one at a time from a CSV or XLSX file."""
+	rows = _iter_xlsx(path) if path.lower().endswith((".xlsx", ".xlsm")) else _iter_csv(path)
+	positions = None
+	for row in rows:
+		if positions is None:
+			positions = _column_positions(row)
+			continue
+		values = {
+			fieldname: (str(row[i]).strip() or None) if i < len(row) and row[i] is not None else None
+			for fieldname, i in positions.items()
+		}
+		if values["activity_code"]:
+			yield values
+
+
+# ---- loading ----
+
+
+def _existing(legal_authority):
+	return {
+		row.activity_code: row
+		for row in frappe.get_all(
+			ACTIVITY_DOCTYPE,
+			filters={"legal_authority": legal_authority},
+			fields=["name", "enabled", *FIELDS],
+			order_by="creation",
+		)
+	}
+
+
+def _write_batch(legal_authority, batch, existing, seen):
+	"""
+	Upsert one batch with a single multi-row statement; returns (inserted, updated).
+	Only the columns present in the file are written or compared, so a catalogue without
+	e.g. a description column leaves the stored descriptions alone.
+	"""
+	# every row of a file carries the same keys: the columns found in its header
+	fields = [f for f in FIELDS if f in batch[0]]
+	rows, new = [], []
+	for values in batch:
+		current = existing.get(values["activity_code"])
+		if current:
+			seen.add(current.name)
+			if current.enabled and all((current.get(f) or None) == (values.get(f) or None) for f in fields):
+				continue
+			rows.append((current.name, values))
+		else:
+			new.append(values)
+
+	names = reserve_names(get_series(ACTIVITY_DOCTYPE), len(new))
+	for name, values in zip(names, new, strict=True):
+		rows.append((name, values))
+		seen.add(name)
+		existing[values["activity_code"]] = frappe._dict(values, name=name, enabled=1)
+	if not rows:
+		return 0, 0
+
+	timestamp, user = now(), frappe.session.user
+	columns = ["name", *fields, "legal_authority", "enabled", "creation", "modified", "owner", "modified_by"]
+	updates = ", ".join(f"`{c}` = values(`{c}`)" for c in (*fields, "enabled", "modified", "modified_by"))
+	frappe.db.sql(
+		f"""
+		insert into `tab{ACTIVITY_DOCTYPE}` ({", ".join(f"`{c}`" for c in columns)})
+		values {", ".join(["(" + ", ".join(["%s"] * len(columns)) + ")"] * len(rows))}
+		on duplicate key update {updates}
+		""",
+		[
+			v
+			for name, values in rows
+			for v in (
+				name,
+				*(values.get(f) for f in fields),
+				legal_authority,
+				1,
+				timestamp,
+				timestamp,
+				user,
+				user,
+			)
+		],
+	)
+	return len(new), len(rows) - len(new)
+
+
+def _disable_missing(seen, existing):
+	names = [row.name for row in existing.values() if row.enabled and row.name not in seen]
+	for i in range(0, len(names), BATCH_SIZE):
+		frappe.db.sql(
+			f"update `tab{ACTIVITY_DOCTYPE}` set enabled = 0, modified = %s, modified_by = %s where name in %s",
+			(now(), frappe.session.user, tuple(names[i : i + BATCH_SIZE])),
+		)
+	return len(names)
+
+
+def load_catalogue(legal_authority, path):
+	"""
+	Refresh the Business Activities of one licensing authority from a catalogue file.
+	Activities are matched on activity code; ones missing from the file are disabled.
+	Controller validation and Versions are skipped for the loaded rows.
+	"""
+	if not frappe.db.exists("Supplier", legal_authority):
+		frappe.throw(_("Legal Authority {0} not found").format(legal_authority))
+
+	existing = _existing(legal_authority)
+	seen, inserted, updated, batch = set(), 0, 0, []
+	for values in iter_catalogue(path):
+		batch.append(values)
+		if len(batch) >= BATCH_SIZE:
+			counts = _write_batch(legal_authority, batch, existing, seen)
+			inserted, updated, batch = inserted + counts[0], updated + counts[1], []
+	if batch:
+		counts = _write_batch(legal_authority, batch, existing, seen)
+		inserted, updated = inserted + counts[0], updated + counts[1]
+
+	disabled = _disable_missing(seen, existing)
+	frappe.db.commit()
+	return frappe._dict(inserted=inserted, updated=updated, disabled=disabled, total=len(seen))
+
+
+def load_catalogue_file(legal_authority, file_url, user=None):
+	"""Background job: load an uploaded catalogue and push the counts to the requesting user."""
+	file_doc = frappe.get_doc("File", {"file_url": file_url})
+	result = load_catalogue(legal_authority, file_doc.get_full_path())
+	frappe.publish_realtime(
+		REALTIME_EVENT, {"legal_authority": legal_authority, **result}, user=user or frappe.session.user
+	)
+	return result
+
+
+@frappe.whitelist()
+def enqueue_load_catalogue(legal_authority, file_url):
+	"""Queue a catalogue refresh; the inserted / updated / disabled counts arrive over realtime."""
+	for ptype in ("create", "write"):
+		frappe.has_permission(ACTIVITY_DOCTYPE, ptype, throw=True)
+	file_name = frappe.db.get_value("File", {"file_url": file_url}, "name")
+	if not file_name:
+		frappe.throw(_("File {0} not found").format(file_url))
+	frappe.has_permission("File", "read", file_name, throw=True)
+	if not file_url.lower().endswith((".csv", ".xlsx", ".xlsm")):
+		frappe.throw(_("Upload the catalogue as a CSV or XLSX file."))
+
+	job = frappe.enqueue(
+		"bs_space.activity_catalogue.load_catalogue_file",
+		queue="long",
+		legal_authority=legal_authority,
+		file_url=file_url,
+		user=frappe.session.user,
+	)
+	return {"job_id": job.id if job else None}
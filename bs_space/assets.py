@@ -0,0 +1,208 @@
+import gzip
+import hashlib
+import json
+import os
+import re
+
+from markupsafe import Markup, escape
+
+# Static assets served from /assets/bs_space/build/<name>.<hash>.<ext>. Content-hashed
+# names never change meaning, so nginx can serve them with a one year max-age.
+PUBLIC_PATH = os.path.join(os.path.dirname(__file__), "public")
+BUILD_FOLDER = "build"
+BUILD_PATH = os.path.join(PUBLIC_PATH, BUILD_FOLDER)
+MANIFEST_PATH = os.path.join(BUILD_PATH, "manifest.json")
+PUBLIC_URL = "/assets/bs_space"
+
+# source paths relative to public/
+CSS_SOURCES = ("css/bs_space.css",)
+IMAGE_SOURCES = ("images/bs-logo.png",)
+IMAGE_WIDTHS = (160, 320, 640, 1280)
+IMAGE_FORMATS = {
+	# mime type: (extension, Pillow save options)
+	"image/avif": ("avif", {"quality": 55}),
+	"image/webp": ("webp", {"quality": 80, "method": 6}),
+}
+
+_manifest = {"mtime": None, "data": {}}
+
+
+# ---- lookup (kept free of frappe imports, hooks.py imports it) ----
+
+
+def get_manifest() -> dict:
+	try:
+		mtime = os.path.getmtime(MANIFEST_PATH)
+	except OSError:
+		return {}
+	if _manifest["mtime"] != mtime:
+		with open(MANIFEST_PATH) as f:
+			_manifest.update(mtime=mtime, data=json.load(f))
+	return _manifest["data"]
+
+
+def asset_url(path: str) -> str:
+	"""Hashed URL of a built asset, or the plain source URL before the first build."""
+	return get_manifest().get("files", {}).get(path) or f"{PUBLIC_URL}/{path}"
+
+
+def image_srcset(path: str, mime_type: str = "image/webp") -> str:
+	image = get_manifest().get("images", {}).get(path) or {}
+	return image.get("srcset", {}).get(mime_type, "")
+
+
+def picture(path: str, alt: str = "", sizes: str = "100vw", **attrs) -> Markup:
+	"""<picture> with AVIF / WebP sources and the optimized original as fallback (jinja method)."""
+	image = get_manifest().get("images", {}).get(path) or {}
+	sources = "".join(
+		f'<source type="{mime}" srcset="{escape(srcset)}" sizes="{escape(sizes)}">'
+		for mime, srcset in image.get("srcset", {}).items()
+	)
+	size_attrs = f' width="{image["width"]}" height="{image["height"]}"' if image else ""
+	extra = "".join(f' {key.replace("_", "-")}="{escape(value)}"' for key, value in attrs.items())
+	return Markup(
+		f'<picture>{sources}<img src="{escape(asset_url(path))}" alt="{escape(alt)}"'
+		f'{size_attrs} loading="lazy" decoding="async"{extra}></picture>'
+	)
+
+
+def update_website_context(context):
+	"""Hashed portal splash image, resolved per render."""
+	context.splash_image = asset_url("images/bs-logo.png")
+
+
+# ---- build ----
+
+
+_STRINGS = re.compile(r"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*')""", re.S)
+_COMMENTS = re.compile(r"/\*(?!!).*?\*/", re.S)
+
+
+def minify_css(css: str) -> str:
+	"""Conservative minifier: drops comments and whitespace, never touches string literals."""
+	parts = _STRINGS.split(_COMMENTS.sub("", css))
+	for i in range(0, len(parts), 2):
+		code = re.sub(r"\s+", " ", parts[i])
+		code = re.sub(r"\s*([{};,>])\s*", r"\1", code)
+		code = re.sub(r":\s+", ":", code)
+		parts[i] = code.replace(";}", "}")
+	return "".join(parts).strip()
+
+
+def _content_hash(data: bytes) -> str:
+	return hashlib.sha256(data).hexdigest()[:12]
+
+
+def _source_hash(paths) -> str:
+	digest = hashlib.sha256()
+	for path in paths:
+		with open(os.path.join(PUBLIC_PATH, path), "rb") as f:
+			digest.update(path.encode() + b"\0" + f.read())
+	return digest.hexdigest()
+
+
+def _write(name: str, data: bytes, compress=False) -> str:
+	"""Write `data` as <name>.<hash>.<ext> (plus .gz/.br) and return its public URL."""
+	stem, ext = os.path.splitext(os.path.basename(name))
+	file_name = f"{stem}.{_content_hash(data)}{ext}"
+	path = os.path.join(BUILD_PATH, file_name)
+	with open(path, "wb") as f:
+		f.write(data)
+	if compress:
+		with open(path + ".gz", "wb") as f:
+			f.write(gzip.compress(data, compresslevel=9, mtime=0))
+		try:
+			import brotli
+		except ImportError:
+			pass
+		else:
+			with open(path + ".br", "wb") as f:
+				f.write(brotli.compress(data, quality=11))
+	return f"{PUBLIC_URL}/{BUILD_FOLDER}/{file_name}"
+
+
+def _build_css(files):
+	for path in CSS_SOURCES:
+		with open(os.path.join(PUBLIC_PATH, path), encoding="utf-8") as f:
+			files[path] = _write(path, minify_css(f.read()).encode(), compress=True)
+
+
+def _supported_formats():
+	from PIL import Image
+
+	try:
+		# registers the AVIF plugin on older Pillow
+		import pillow_avif
+	except ImportError:
+		pass
+	Image.init()
+	return {mime: spec for mime, spec in IMAGE_FORMATS.items() if spec[0].upper() in Image.SAVE}
+
+
+def _build_images(files, images):
+	import io
+
+	from PIL import Image
+
+	formats = _supported_formats()
+	for path in IMAGE_SOURCES:
+		with Image.open(os.path.join(PUBLIC_PATH, path)) as source:
+			source.load()
+		widths = [w for w in IMAGE_WIDTHS if w < source.width] + [source.width]
+
+		# losslessly re-encoded original for browsers without AVIF / WebP support
+		out = io.BytesIO()
+		source.save(out, format=source.format or "PNG", optimize=True)
+		files[path] = _write(path, out.getvalue())
+
+		srcset = {}
+		for mime, (ext, options) in formats.items():
+			entries = []
+			for width in widths:
+				height = round(source.height * width / source.width)
+				resized = source if width == source.width else source.resize((width, height), Image.LANCZOS)
+				out = io.BytesIO()
+				resized.save(out, format=ext.upper(), **options)
+				stem = os.path.splitext(path)[0]
+				entries.append(f"{_write(f'{stem}-{width}w.{ext}', out.getvalue())} {width}w")
+			srcset[mime] = ", ".join(entries)
+
+		images[path] = {"width": source.width, "height": source.height, "srcset": srcset}
+
+
+def build_assets(force=False):
+	"""
+	Build the hashed CSS and responsive images into public/build and write the manifest.
+	Does nothing when the sources have not changed since the last build.
+	"""
+	source_hash = _source_hash(CSS_SOURCES + IMAGE_SOURCES)
+	manifest = get_manifest()
+	if not force and manifest.get("source_hash") == source_hash:
+		return manifest
+
+	os.makedirs(BUILD_PATH, exist_ok=True)
+	files, images = {}, {}
+	_build_css(files)
+	_build_images(files, images)
+
+	new_manifest = {"source_hash": source_hash, "files": files, "images": images}
+	# keep the previous build too: workers that have not restarted yet still link to it
+	_remove_unreferenced(manifest, new_manifest)
+	with open(MANIFEST_PATH, "w") as f:
+		json.dump(new_manifest, f, indent=1, sort_keys=True)
+	return new_manifest
+
+
+def _remove_unreferenced(*manifests):
+	referenced = {"manifest.json"}
+	for manifest in manifests:
+		urls = list(manifest.get("files", {}).values())
+		for image in manifest.get("images", {}).values():
+			urls.extend(
+				entry.split()[0] for srcset in image["srcset"].values() for entry in srcset.split(", ")
+			)
+		referenced.update(os.path.basename(url) for url in urls)
+
+	for name in os.listdir(BUILD_PATH):
+		if name.removesuffix(".gz").removesuffix(".br") not in referenced:
+			os.remove(os.path.join(BUILD_PATH, name))
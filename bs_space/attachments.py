@@ -0,0 +1,404 @@
+import hashlib
+import io
+import os
+import tempfile
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from bs_space.streaming import iter_rows
+
+CAS_FOLDER = "cas"
+CHUNK_SIZE = 1024 * 1024
+THUMBNAIL_SIZE = (300, 300)
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".gif", ".webp", ".bmp")
+
+# Attachments of these documents (and of their child rows, e.g. Multiple Attachments
+# on Task) are stored once per unique content and shared between File records.
+CAS_DOCTYPES = ("Customer", "Linked Individual", "Task", "ToDo")
+CAS_CHILD_DOCTYPES = ("Multiple Attachments",)
+
+
+def get_blob_name(content_hash: str, is_private) -> str:
+	return f"{content_hash}-{'private' if cint(is_private) else 'public'}"
+
+
+def is_cas_url(file_url: str | None) -> bool:
+	return bool(file_url) and (
+		file_url.startswith(f"/private/files/{CAS_FOLDER}/") or file_url.startswith(f"/files/{CAS_FOLDER}/")
+	)
+
+
+def _files_root(is_private) -> str:
+	return frappe.get_site_path("private" if cint(is_private) else "public", "files")
+
+
+def _url_to_path(file_url: str) -> str | None:
+	if file_url.startswith("/private/files/"):
+		return os.path.join(_files_root(1), file_url[len("/private/files/") :])
+	if file_url.startswith("/files/"):
+		return os.path.join(_files_root(0), file_url[len("/files/") :])
+	return None
+
+
+def _path_to_url(relpath: str, is_private) -> str:
+	return ("/private/files/" if cint(is_private) else "/files/") + relpath.replace(os.sep, "/")
+
+
+def _blob_name_from_url(file_url: str) -> str:
+	content_hash = os.path.splitext(os.path.basename(file_url))[0]
+	return get_blob_name(content_hash, file_url.startswith("/private/"))
+
+
+def store_stream(stream, file_name: str, is_private=1):
+	"""
+	Copy `stream` into the blob store, hashing it chunk by chunk on the way.
+	Returns the Attachment Blob (existing one if the content is already stored).
+	"""
+	max_size = cint(frappe.conf.get("max_file_size")) or 10 * 1024 * 1024
+	# always private, so a partial upload is never served; moved to the public store when done
+	tmp_dir = os.path.join(_files_root(1), CAS_FOLDER, "tmp")
+	os.makedirs(tmp_dir, exist_ok=True)
+
+	sha = hashlib.sha256()
+	size = 0
+	with tempfile.NamedTemporaryFile(dir=tmp_dir, delete=False) as tmp:
+		try:
+			for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+				if isinstance(chunk, str):
+					chunk = chunk.encode()
+				if not chunk:
+					break
+				size += len(chunk)
+				if size > max_size:
+					frappe.throw(
+						_("File size exceeded the maximum allowed size"),
+						frappe.exceptions.MaxFileSizeReachedError,
+					)
+				sha.update(chunk)
+				tmp.write(chunk)
+		except Exception:
+			os.remove(tmp.name)
+			raise
+
+	try:
+		return _ensure_blob(sha.hexdigest(), tmp.name, file_name, size, is_private)
+	finally:
+		if os.path.exists(tmp.name):
+			os.remove(tmp.name)
+
+
+def _ensure_blob(content_hash, tmp_path, file_name, size, is_private):
+	name = get_blob_name(content_hash, is_private)
+	blob = frappe.db.get_value("Attachment Blob", name, ["name", "file_url", "is_private"], as_dict=True)
+	if blob and os.path.exists(_url_to_path(blob.file_url)):
+		return blob
+
+	ext = os.path.splitext(file_name or "")[1].lower()
+	relpath = os.path.join(CAS_FOLDER, content_hash[:2], content_hash + ext)
+	dest = os.path.join(_files_root(is_private), relpath)
+	if blob:
+		# row survived but the file was lost: restore it at its recorded location
+		dest = _url_to_path(blob.file_url)
+	os.makedirs(os.path.dirname(dest), exist_ok=True)
+	os.replace(tmp_path, dest)
+	if blob:
+		return blob
+
+	try:
+		doc = frappe.get_doc(
+			{
+				"doctype": "Attachment Blob",
+				"content_hash": content_hash,
+				"file_name": file_name,
+				"file_url": _path_to_url(relpath, is_private),
+				"is_private": cint(is_private),
+				"file_size": size,
+				"ref_count": 0,
+			}
+		).insert(ignore_permissions=True, set_name=name)
+	except frappe.DuplicateEntryError:
+		# concurrent upload of the same content won the race
+		return frappe.db.get_value("Attachment Blob", name, ["name", "file_url", "is_private"], as_dict=True)
+	return frappe._dict(name=doc.name, file_url=doc.file_url, is_private=doc.is_private)
+
+
+def _adjust_ref_count(blob_name: str, delta: int) -> int:
+	frappe.db.sql(
+		"""update `tabAttachment Blob` set ref_count = greatest(ref_count + %s, 0) where name = %s""",
+		(delta, blob_name),
+	)
+	return cint(frappe.db.get_value("Attachment Blob", blob_name, "ref_count"))
+
+
+def _purge_blob(blob_name: str):
+	"""Delete an unreferenced blob row now and its files once the transaction commits."""
+	blob = frappe.db.get_value("Attachment Blob", blob_name, ["file_url", "thumbnail_url"], as_dict=True)
+	if not blob:
+		return
+	frappe.delete_doc("Attachment Blob", blob_name, ignore_permissions=True, force=True)
+
+	paths = [_url_to_path(url) for url in (blob.file_url, blob.thumbnail_url) if is_cas_url(url)]
+
+	def remove_files():
+		for path in paths:
+			if path and os.path.exists(path):
+				os.remove(path)
+
+	frappe.db.after_commit.add(remove_files)
+
+
+# ---- hooks ----
+
+
+def write_file(file_doc):
+	"""
+	`write_file` hook: store attachments of client documents content-addressed. frappe calls it
+	only after its own File.content_hash lookup found no copy with the same privacy, so the
+	content is hashed into the blob store, which still shares it with files of other documents.
+	"""
+	if file_doc.attached_to_doctype not in CAS_DOCTYPES:
+		return file_doc.save_file_on_filesystem()
+
+	# set by _attach_blob: the content is a blob that was just streamed in
+	blob = file_doc.flags.bs_blob
+	if not blob:
+		content = getattr(file_doc, "_content", None)
+		if content is None:
+			content = file_doc.content
+		if isinstance(content, str):
+			content = content.encode()
+		# frappe hands the content over in memory; it is copied to disk chunk by chunk from there
+		blob = store_stream(io.BytesIO(content or b""), file_doc.file_name, file_doc.is_private)
+
+	file_doc.file_url = blob.file_url
+	return {"file_name": file_doc.file_name, "file_url": blob.file_url}
+
+
+def delete_file_data_content(file_doc, only_thumbnail=False):
+	"""`delete_file_data_content` hook: shared blobs are removed by reference counting only."""
+	if is_cas_url(file_doc.file_url):
+		return
+	file_doc.delete_file_from_filesystem(only_thumbnail=only_thumbnail)
+
+
+def on_file_insert(doc, method=None):
+	if is_cas_url(doc.file_url):
+		_adjust_ref_count(_blob_name_from_url(doc.file_url), 1)
+
+
+def on_file_privacy_change(doc, method=None):
+	"""
+	File before_validate: toggling is_private on a stored blob is copy-on-write. The File moves to
+	the blob of the other privacy; frappe's own handler would move the shared file on disk and
+	repoint every File using it.
+	"""
+	before = None if doc.is_new() else doc.get_doc_before_save()
+	if not before or not is_cas_url(doc.file_url) or cint(before.is_private) == cint(doc.is_private):
+		return
+
+	old_url, old_blob = doc.file_url, _blob_name_from_url(doc.file_url)
+	with open(_url_to_path(old_url), "rb") as stream:
+		blob = store_stream(stream, doc.file_name, doc.is_private)
+	_adjust_ref_count(blob.name, 1)
+	if _adjust_ref_count(old_blob, -1) == 0:
+		_purge_blob(old_blob)
+
+	doc.file_url = blob.file_url
+	doc.thumbnail_url = frappe.db.get_value("Attachment Blob", blob.name, "thumbnail_url")
+	attached = (doc.attached_to_doctype, doc.attached_to_name, doc.attached_to_field)
+	if all(attached) and frappe.db.get_value(*attached) == old_url:
+		frappe.db.set_value(*attached, blob.file_url)
+	# the privacy change is handled: keep File.validate from moving the shared file as well
+	before.is_private = doc.is_private
+
+
+def on_file_trash(doc, method=None):
+	if not is_cas_url(doc.file_url):
+		return
+	blob_name = _blob_name_from_url(doc.file_url)
+	if _adjust_ref_count(blob_name, -1) == 0:
+		_purge_blob(blob_name)
+
+
+# ---- API ----
+
+
+def _attach_blob(blob, file_name, doctype, docname, fieldname=None):
+	file_doc = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": blob.file_url,
+			"is_private": blob.is_private,
+			"attached_to_doctype": doctype,
+			"attached_to_name": docname,
+			"attached_to_field": fieldname,
+		}
+	)
+	# the write_file hook reuses the blob instead of hashing and copying it again
+	file_doc.flags.bs_blob = blob
+	file_doc.insert()
+
+	if fieldname and frappe.get_meta(doctype).get_field(fieldname):
+		frappe.db.set_value(doctype, docname, fieldname, blob.file_url)
+	return file_doc.as_dict()
+
+
+@frappe.whitelist(methods=["POST"])
+def upload_attachment(doctype, docname, fieldname=None, is_private=1):
+	"""Stream the uploaded `file` into the blob store and attach it to the document."""
+	frappe.has_permission(doctype, "write", docname, throw=True)
+
+	upload = frappe.request.files.get("file")
+	if not upload:
+		frappe.throw(_("No file was uploaded."))
+
+	blob = store_stream(upload.stream, upload.filename, cint(is_private))
+	return _attach_blob(blob, upload.filename, doctype, docname, fieldname)
+
+
+@frappe.whitelist()
+def attach_known_file(content_hash, file_name, doctype, docname, fieldname=None, is_private=1):
+	"""
+	Attach content that is already stored, identified by its SHA-256, without
+	re-uploading it. Returns None when the content is unknown or not readable by
+	the user; the client then falls back to upload_attachment.
+	"""
+	frappe.has_permission(doctype, "write", docname, throw=True)
+
+	blob = frappe.db.get_value(
+		"Attachment Blob",
+		get_blob_name(content_hash, is_private),
+		["name", "file_url", "is_private"],
+		as_dict=True,
+	)
+	if not blob:
+		return None
+
+	# knowing a hash is not enough: the user must already be able to read this content
+	holders = frappe.get_all("File", filters={"file_url": blob.file_url}, pluck="name", limit=20)
+	if not any(frappe.has_permission("File", "read", name) for name in holders):
+		return None
+
+	return _attach_blob(blob, file_name, doctype, docname, fieldname)
+
+
+@frappe.whitelist()
+def get_preview_url(file_name):
+	"""Preview URL for a File; thumbnails of stored blobs are generated on first request and reused."""
+	file_doc = frappe.get_doc("File", file_name)
+	file_doc.check_permission("read")
+
+	if not is_cas_url(file_doc.file_url):
+		return file_doc.thumbnail_url or file_doc.file_url
+
+	blob_name = _blob_name_from_url(file_doc.file_url)
+	thumbnail_url = frappe.db.get_value("Attachment Blob", blob_name, "thumbnail_url")
+	if thumbnail_url:
+		return thumbnail_url
+
+	thumbnail_url = _make_thumbnail(file_doc.file_url) or file_doc.file_url
+	frappe.db.set_value("Attachment Blob", blob_name, "thumbnail_url", thumbnail_url, update_modified=False)
+	if thumbnail_url != file_doc.file_url:
+		# every File sharing the blob shares the thumbnail (also lets private downloads authorize it)
+		frappe.db.sql(
+			"""update `tabFile` set thumbnail_url = %s where file_url = %s""",
+			(thumbnail_url, file_doc.file_url),
+		)
+	return thumbnail_url
+
+
+def _make_thumbnail(file_url: str) -> str | None:
+	base, ext = os.path.splitext(file_url)
+	if ext.lower() not in IMAGE_EXTENSIONS:
+		return None
+
+	from PIL import Image, ImageOps
+
+	try:
+		with Image.open(_url_to_path(file_url)) as image:
+			image = ImageOps.exif_transpose(image)
+			image.thumbnail(THUMBNAIL_SIZE)
+			thumbnail_url = f"{base}_small{ext}"
+			image.save(_url_to_path(thumbnail_url))
+	except Exception:
+		frappe.log_error(f"Could not generate thumbnail for {file_url}")
+		return None
+	return thumbnail_url
+
+
+# ---- maintenance ----
+
+
+def rebuild_ref_counts():
+	"""Recompute every blob's reference count from the File table in one set-based update."""
+	frappe.db.sql(
+		"""
+		update `tabAttachment Blob` blob
+		left join (
+			select file_url, count(name) as refs from `tabFile` where file_url like %(pattern)s group by file_url
+		) f on f.file_url = blob.file_url
+		set blob.ref_count = ifnull(f.refs, 0)
+		""",
+		{"pattern": f"%/files/{CAS_FOLDER}/%"},
+	)
+	frappe.db.commit()
+
+
+def _attach_fields():
+	"""(doctype, fieldname) of every Attach field whose value may point at a moved file."""
+	fields = []
+	for doctype in CAS_DOCTYPES + CAS_CHILD_DOCTYPES:
+		for df in frappe.get_meta(doctype).fields:
+			if df.fieldtype in ("Attach", "Attach Image"):
+				fields.append((doctype, df.fieldname))
+	return fields
+
+
+def deduplicate_existing_files():
+	"""Move existing attachments of client documents into the blob store, one copy per content."""
+	attach_fields = _attach_fields()
+	# streamed by File name; later copies of a moved URL are skipped once its file is gone
+	files = iter_rows(
+		"File",
+		fields=["name", "file_url", "is_private", "file_name"],
+		filters={
+			"attached_to_doctype": ["in", CAS_DOCTYPES],
+			"is_folder": 0,
+			"file_url": ["not like", f"%/files/{CAS_FOLDER}/%"],
+		},
+	)
+
+	moved = 0
+	for f in files:
+		path = _url_to_path(f.file_url or "")
+		if not path or not os.path.exists(path):
+			continue
+
+		with open(path, "rb") as stream:
+			blob = store_stream(stream, f.file_name, f.is_private)
+
+		frappe.db.sql(
+			"""update `tabFile` set file_url = %s where file_url = %s""", (blob.file_url, f.file_url)
+		)
+		refs = frappe.db.count("File", {"file_url": blob.file_url})
+		frappe.db.set_value("Attachment Blob", blob.name, "ref_count", refs, update_modified=False)
+		for doctype, fieldname in attach_fields:
+			frappe.db.sql(
+				f"""update `tab{doctype}` set `{fieldname}` = %s where `{fieldname}` = %s""",
+				(blob.file_url, f.file_url),
+			)
+
+		frappe.db.after_commit.add(lambda p=path: os.path.exists(p) and os.remove(p))
+		frappe.db.commit()
+		moved += 1
+
+	return moved
+
+
+@frappe.whitelist()
+def enqueue_deduplication():
+	frappe.only_for("System Manager")
+	frappe.enqueue("bs_space.attachments.deduplicate_existing_files", queue="long", timeout=6 * 3600)
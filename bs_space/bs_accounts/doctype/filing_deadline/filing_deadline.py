@@ -0,0 +1,14 @@
+# Copyright (c) 2025, Best Solution® and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class FilingDeadline(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("Filing Deadline", ["due_date", "status"])
+	frappe.db.add_index("Filing Deadline", ["customer", "tax_type", "due_date"])
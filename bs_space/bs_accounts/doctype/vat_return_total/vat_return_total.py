@@ -0,0 +1,13 @@
+# Copyright (c) 2025, Best Solution® and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class VATReturnTotal(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("VAT Return Total", ["company", "period_start"])
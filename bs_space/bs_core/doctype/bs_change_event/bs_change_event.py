@@ -0,0 +1,13 @@
+# Copyright (c) 2025, Best Solution® and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class BSChangeEvent(Document):
+	pass
+
+
+def on_doctype_update():
+	frappe.db.add_index("BS Change Event", ["ref_name", "ref_doctype"])
@@ -0,0 +1,15 @@
+# Copyright (c) 2025, Best Solution® and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class BSLinkChange(Document):
+	pass
+
+
+def on_doctype_update():
+	# history of either side of a link
+	frappe.db.add_index("BS Link Change", ["entity", "entity_doctype"])
+	frappe.db.add_index("BS Link Change", ["linked_name", "linked_doctype"])
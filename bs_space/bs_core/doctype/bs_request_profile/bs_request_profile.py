@@ -0,0 +1,28 @@
+# Copyright (c) 2025, Best Solution® and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+from frappe.utils import add_days, now_datetime
+
+
+class BSRequestProfile(Document):
+	@staticmethod
+	def clear_old_logs(days=7):
+		"""Log Settings retention: drop old profiles together with their attached files."""
+		names = frappe.get_all(
+			"BS Request Profile", filters={"started_at": ["<", add_days(now_datetime(), -days)]}, pluck="name"
+		)
+		delete_profiles(names)
+
+
+def delete_profiles(names):
+	if not names:
+		return
+	for file_name in frappe.get_all(
+		"File",
+		filters={"attached_to_doctype": "BS Request Profile", "attached_to_name": ["in", names]},
+		pluck="name",
+	):
+		frappe.delete_doc("File", file_name, ignore_permissions=True)
+	frappe.db.delete("BS Request Profile", {"name": ["in", names]})
@@ -0,0 +1,8 @@
+// Copyright (c) 2025, Best Solution® and contributors
+// For license information, please see license.txt
+
+// frappe.ui.form.on("Name Search Token", {
+// 	refresh(frm) {
+
+// 	},
+// });
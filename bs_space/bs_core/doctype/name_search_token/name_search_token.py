@@ -0,0 +1,17 @@
+# Copyright (c) 2025, Best Solution® and contributors
+# For license information, please see license.txt
+
+import frappe
+from frappe.model.document import Document
+
+
+class NameSearchToken(Document):
+	pass
+
+
+def on_doctype_update():
+	# covers rank_names entirely (filter, group by and sum), so it never reads the table rows
+	frappe.db.add_index("Name Search Token", ["ref_doctype", "gram", "ref_name", "weight"])
+	# superseded by the covering index above
+	if frappe.db.has_index("tabName Search Token", "ref_doctype_gram_index"):
+		frappe.db.sql_ddl("alter table `tabName Search Token` drop index `ref_doctype_gram_index`")
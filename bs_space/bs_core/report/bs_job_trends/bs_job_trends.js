@@ -0,0 +1,31 @@
+// Copyright (c) 2025, Best Solution® and contributors
+// For license information, please see license.txt
+
+frappe.query_reports["BS Job Trends"] = {
+	filters: [
+		{
+			fieldname: "from_date",
+			label: __("From Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.add_days(frappe.datetime.get_today(), -90),
+		},
+		{
+			fieldname: "to_date",
+			label: __("To Date"),
+			fieldtype: "Date",
+			default: frappe.datetime.get_today(),
+		},
+		{
+			fieldname: "job",
+			label: __("Job"),
+			fieldtype: "Data",
+		},
+		{
+			fieldname: "period",
+			label: __("Group By"),
+			fieldtype: "Select",
+			options: ["day", "week", "month"],
+			default: "week",
+		},
+	],
+};
@@ -0,0 +1,57 @@
+# Copyright (c) 2025, Best Solution® and contributors
+# For license information, please see license.txt
+
+from frappe import _
+from frappe.utils import flt
+
+from bs_space.job_runs import get_job_trends
+from bs_space.replica import read_from_replica
+
+
+@read_from_replica()
+def execute(filters=None):
+	filters = filters or {}
+	data = get_job_trends(
+		from_date=filters.get("from_date"),
+		to_date=filters.get("to_date"),
+		job=filters.get("job"),
+		period=filters.get("period") or "week",
+	)
+	for row in data:
+		row.avg_duration = flt(row.avg_duration, 2)
+		row.avg_rows_scanned = flt(row.avg_rows_scanned, 0)
+	return get_columns(), data, None, get_chart(data)
+
+
+def get_columns():
+	return [
+		{"fieldname": "job", "label": _("Job"), "fieldtype": "Data", "width": 320},
+		{"fieldname": "period", "label": _("Period"), "fieldtype": "Date", "width": 110},
+		{"fieldname": "runs", "label": _("Runs"), "fieldtype": "Int", "width": 70},
+		{"fieldname": "failed", "label": _("Failed"), "fieldtype": "Int", "width": 70},
+		{"fieldname": "skipped", "label": _("Skipped (overlap)"), "fieldtype": "Int", "width": 120},
+		{"fieldname": "avg_duration", "label": _("Avg Duration (s)"), "fieldtype": "Float", "width": 120},
+		{"fieldname": "max_duration", "label": _("Max Duration (s)"), "fieldtype": "Float", "width": 120},
+		{"fieldname": "avg_rows_scanned", "label": _("Avg Rows Scanned"), "fieldtype": "Int", "width": 130},
+		{"fieldname": "rows_updated", "label": _("Rows Updated"), "fieldtype": "Int", "width": 110},
+		{"fieldname": "emails_queued", "label": _("Emails Queued"), "fieldtype": "Int", "width": 110},
+		{"fieldname": "errors", "label": _("Errors"), "fieldtype": "Int", "width": 70},
+	]
+
+
+def get_chart(data):
+	"""Average duration per job over time: a growing line is a job that scales with the client book."""
+	periods = sorted({str(row.period) for row in data})
+	by_job = {}
+	for row in data:
+		by_job.setdefault(row.job, {})[str(row.period)] = row.avg_duration or 0
+	return {
+		"data": {
+			"labels": periods,
+			"datasets": [
+				{"name": job.rsplit(".", 1)[-1], "values": [values.get(p, 0) for p in periods]}
+				for job, values in by_job.items()
+			],
+		},
+		"type": "line",
+	}
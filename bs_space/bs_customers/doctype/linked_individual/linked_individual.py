@@ -6,6 +6,11 @@ from frappe.model.document import Document
 from frappe.utils import add_days, today, getdate
 from datetime import date
 from frappe import _
+from bs_space.household import invalidate_for_individual
+from bs_space.job_runs import track, tracked_job
+from bs_space.link_changes import log_link_change, save_derived
+from bs_space.relationships import get_relationship, get_table_field, remove_links
+from bs_space.streaming import iter_rows
 
 class LinkedIndividual(Document):
     def validate(self):
@@ -18,31 +23,13 @@ def validate_linked_individual(doc, method=None):
     validate_dependents(doc)
     validate_owned_companies(doc)
 
-CUSTOMER_VISA_HOLDERS_CHILD_DOTYPE = "Visa Holders of Client"
-DEPENDENTS_CHILD_DOTYPE = "Dependents of Individual"
-
-def _resolve_customer_visa_holders_fieldname() -> str | None:
-    """Return the child Table fieldname on Customer that points to Visa Holders of Client."""
-    try:
-        meta = frappe.get_meta("Customer")
-        # exact match by child doctype
-        for df in meta.get_table_fields():
-            if (df.options or "").strip() == CUSTOMER_VISA_HOLDERS_CHILD_DOTYPE:
-                return df.fieldname
-        # common fallback if you actually named it custom_visa_holders
-        if meta.get_field("custom_visa_holders"):
-            return "custom_visa_holders"
-        # last resort: None (we'll log and skip)
-    except Exception:
-        pass
-    return None
-    
-
 def after_save_linked_individual(doc, method=None):
     if getattr(frappe.flags, "li_after_save_ran", False):
         return
     frappe.flags.li_after_save_ran = True
 
+    invalidate_for_individual(doc)
+
     # If visa tracking is off, remove from both sides and stop
     if not getattr(doc, "has_visa", 0):
         _remove_dependent_from_all_li_parents(doc.name)
@@ -101,6 +88,21 @@ def validate_parent_relationship(doc):
         if parents_parent == doc.name:
             frappe.throw(_("Circular visa parent relationship is not allowed."))
 
+        # chain check: someone who sponsors dependents cannot become a dependent (max one level)
+        sponsored = [r.dependent for r in (doc.get(get_table_field("dependents")) or []) if r.dependent]
+        sponsored += frappe.get_all(
+            "Linked Individual",
+            filters={"visa_parent": doc.name, "parent_type": "Linked Individual", "visa_type": "Dependent"},
+            pluck="name",
+            limit=1,
+        )
+        if sponsored:
+            frappe.throw(
+                _("{0} sponsors dependents (e.g. {1}) and cannot be a Dependent as well.").format(
+                    doc.name, sponsored[0]
+                )
+            )
+
     else:
         # Non-dependent → must be under a Customer
         if parent_type != "Customer":
@@ -135,7 +137,7 @@ def update_document_status(doc):
 def validate_dependents(doc):
     """Check for duplicate dependents in child table"""
     seen = set()
-    for row in doc.dependents or []:
+    for row in doc.get(get_table_field("dependents")) or []:
         if row.dependent in seen:
             frappe.throw(f"Dependent '{row.dependent}' is listed more than once.")
         seen.add(row.dependent)
@@ -143,7 +145,7 @@ def validate_dependents(doc):
 def validate_owned_companies(doc):
     """Check for duplicate companies and total shareholding %"""
     seen = set()
-    for row in doc.owned_companies or []:
+    for row in doc.get(get_table_field("owned_companies")) or []:
         if row.company in seen:
             frappe.throw(f"Company '{row.company}' is listed more than once in Owned Companies.")
         seen.add(row.company)
@@ -180,13 +182,63 @@ def update_document_status(doc, method=None):
     doc.status = "Expired" if expiry < today else "Active"
 
 
+STATUS_RECOMPUTED_KEY = "bs_li_status_recomputed_on"
+
+
+@tracked_job()
+def recompute_visa_statuses(full=False):
+    """
+    Daily: flip Linked Individual status (and the visa_status copies on Customers' visa
+    holder rows) for visas that expired since the last run, with one set-based UPDATE.
+    The first run, or full=True, reconciles every record. Same rules as update_document_status.
+    The UPDATE bypasses the document API: `modified` is left unchanged, and no outbox event,
+    household cache invalidation or other consumer notice is sent for the changed records.
+    """
+    current_date = today()
+    since = None if full else frappe.db.get_global(STATUS_RECOMPUTED_KEY)
+    rel = get_relationship("visa_holders")
+
+    status = """case
+        when ifnull(li.has_visa, 0) = 0 then 'Not Applicable'
+        when li.visa_expiry_date < %(today)s then 'Expired'
+        else 'Active' end"""
+    if since:
+        # only visas that crossed their expiry date since the last run (indexed range)
+        scope = "li.visa_expiry_date >= %(since)s and li.visa_expiry_date < %(today)s"
+    else:
+        # without an expiry date the status is left as the user set it
+        scope = "(ifnull(li.has_visa, 0) = 0 or li.visa_expiry_date is not null)"
+
+    tables = f"""`tabLinked Individual` li
+        left join `tab{rel.child_doctype}` vh
+            on vh.visa_holder = li.name and vh.parenttype = %(parenttype)s and vh.parentfield = %(parentfield)s"""
+    # only rows whose values actually change
+    conditions = f"""{scope}
+            and (not (li.status <=> {status}) or (vh.name is not null and not (vh.visa_status <=> {status})))"""
+    values = {
+        "today": current_date,
+        "since": since,
+        "parenttype": rel.parent_doctype,
+        "parentfield": rel.table_field,
+    }
+
+    # counted up front: the driver's affected-rows count is not part of frappe.db's API
+    changed = frappe.db.sql(f"select count(*) from {tables} where {conditions}", values)[0][0]
+    if changed:
+        frappe.db.sql(f"update {tables} set li.status = {status}, vh.visa_status = {status} where {conditions}", values)
+    track(scanned=changed, updated=changed)
+    frappe.db.set_global(STATUS_RECOMPUTED_KEY, current_date)
+    frappe.db.commit()
+
+
+@tracked_job()
 def send_expiry_notifications():
     """Daily job to notify about upcoming document expiries."""
     days_before_expiry = 30  # notify 30 days before
     notification_date = add_days(today(), days_before_expiry)
 
-    # Fetch Linked Individuals with notifications enabled
-    individuals = frappe.get_all(
+    # Stream Linked Individuals with notifications enabled; queued emails are committed per batch
+    individuals = iter_rows(
         "Linked Individual",
         filters={"enabled": 1, "need_expiry_notifications": 1},
         fields=[
@@ -196,7 +248,9 @@ def send_expiry_notifications():
             "visa_expiry_date",
             "passport_expiry_date",
             "emirates_id_expiry_date"
-        ]
+        ],
+        commit=True,
+        progress=lambda count, done: track(scanned=count),
     )
 
     for ind in individuals:
@@ -243,7 +297,9 @@ def send_expiry_email(ind, messages):
             subject=subject,
             message=message
         )
+        track(emails=1)
     except Exception as e:
+        track(errors=1)
         frappe.log_error(f"Failed to send expiry email to {ind.email}: {str(e)}")
 
 
@@ -318,7 +374,7 @@ def sync_linked_individual_visa_parent(doc, method=None):
     if not (doc.visa_parent or "").strip():
         return
 
-    fieldname = _resolve_customer_visa_holders_fieldname()
+    fieldname = get_table_field("visa_holders")
     if not fieldname:
         frappe.log_error(
             title="Customer visa-holders table not found",
@@ -336,7 +392,7 @@ def sync_linked_individual_visa_parent(doc, method=None):
             return
 
         # 1) Remove this holder from ALL other customers via row-level delete
-        child_dt = CUSTOMER_VISA_HOLDERS_CHILD_DOTYPE
+        child_dt = get_relationship("visa_holders").child_doctype
         rows_elsewhere = frappe.get_all(
             child_dt,
             filters={"visa_holder": doc.name, "parenttype": "Customer"},
@@ -365,31 +421,25 @@ def sync_linked_individual_visa_parent(doc, method=None):
             "emirates_id": getattr(doc, "emirates_id_number", None),
         })
         _normalize_child_idx(current_parent, fieldname)
-        current_parent.save(ignore_permissions=True)
+        save_derived(current_parent, "visa_holders", "Added", doc.name, origin=doc)
 
     finally:
         frappe.flags.skip_visa_holder_sync = False
 
 
 
-def cleanup_on_trash(doc, method):
-    # Remove from visa_parent
-    if doc.visa_parent:
-        try:
-            parent = frappe.get_doc("Customer", doc.visa_parent)
-            parent.custom_visa_holders = [row for row in parent.custom_visa_holders if row.visa_holder != doc.name]
-            parent.save(ignore_permissions=True)
-        except:
-            pass
-
-    # Remove from shareholders
-    for cust in frappe.get_all("Customer", pluck="name"):
-        customer_doc = frappe.get_doc("Customer", cust)
-        customer_doc.custom_shareholders = [
-            row for row in customer_doc.custom_shareholders
-            if not (row.shareholder_type == "Individual" and row.shareholder == doc.name)
-        ]
-        customer_doc.save(ignore_permissions=True)
+def cleanup_on_trash(doc, method=None):
+    """Remove the individual from every visa holder, dependent and shareholder table before deletion."""
+    invalidate_for_individual(doc)
+    for relationship, parent in remove_links(doc.doctype, doc.name):
+        if not relationship.resave:
+            # no full save: e.g. a cap table left below 100% must not block the delete
+            parent_ref = frappe._dict(doctype=relationship.parent_doctype, name=parent)
+            log_link_change(parent_ref, relationship.name, "Removed", doc.name, origin=doc)
+            continue
+        # re-save so validate-computed values (the remaining visa quota) follow the removed rows
+        parent_doc = frappe.get_doc(relationship.parent_doctype, parent)
+        save_derived(parent_doc, relationship.name, "Removed", doc.name, origin=doc)
 
 
 def sync_linked_individual_dependents(doc, method=None):
@@ -429,7 +479,7 @@ def sync_linked_individual_dependents(doc, method=None):
         _remove_visa_holder_from_all_customers(doc.name)
 
         parent_li = frappe.get_doc("Linked Individual", vp)
-        dep_field = _resolve_dependents_fieldname()
+        dep_field = get_table_field("dependents")
         if not dep_field:
             frappe.log_error(
                 title="Dependents table missing on Linked Individual",
@@ -439,10 +489,12 @@ def sync_linked_individual_dependents(doc, method=None):
 
         # Upsert (preserve remarks)
         rows = list(parent_li.get(dep_field) or [])
+        existing = False
         for r in rows:
             if (r.get("dependent") or "").strip() == doc.name:
                 r.relation = doc.relation
                 r.date_of_birth = doc.date_of_birth
+                existing = True
                 break
         else:
             parent_li.append(dep_field, {
@@ -452,7 +504,7 @@ def sync_linked_individual_dependents(doc, method=None):
             })
 
         _normalize_child_idx(parent_li, dep_field)
-        parent_li.save(ignore_permissions=True)
+        save_derived(parent_li, "dependents", "Updated" if existing else "Added", doc.name, origin=doc)
         frappe.logger().info(f"[LI Dep Sync] Upserted {doc.name} → {vp}.{dep_field}")
 
     finally:
@@ -460,41 +512,6 @@ def sync_linked_individual_dependents(doc, method=None):
 
 
 
-def _resolve_dependents_fieldname() -> str | None:
-    """Return the child Table fieldname on 'Linked Individual' that points to 'Dependents of Individual'."""
-    try:
-        meta = frappe.get_meta("Linked Individual")
-        for df in meta.get_table_fields():
-            if (df.options or "").strip() == DEPENDENTS_CHILD_DOTYPE:
-                return df.fieldname
-        if meta.get_field("dependents"):
-            return "dependents"
-        tfs = meta.get_table_fields()
-        if tfs:
-            return tfs[0].fieldname
-    except Exception:
-        pass
-    return None
-
-
-CUSTOMER_VISA_HOLDERS_CHILD_DOTYPE = "Visa Holders of Client"  # child DocType name
-
-def _resolve_customer_visa_holders_fieldname() -> str | None:
-    """Return the child Table fieldname on Customer that points to 'Visa Holders of Client'."""
-    try:
-        meta = frappe.get_meta("Customer")
-        # Prefer exact child doctype match
-        for df in meta.get_table_fields():
-            if (df.options or "").strip() == CUSTOMER_VISA_HOLDERS_CHILD_DOTYPE:
-                return df.fieldname
-        # Fallback to a common custom fieldname if you used it
-        if meta.get_field("custom_visa_holders"):
-            return "custom_visa_holders"
-    except Exception:
-        pass
-    return None
-
-
 # def _remove_visa_holder_from_all_customers(visa_holder: str, skip_customer: str | None = None):
 #     """Remove this LI from ALL Customers’ visa-holders tables (idempotent)."""
 #     fieldname = _resolve_customer_visa_holders_fieldname()
@@ -527,16 +544,15 @@ def _resolve_customer_visa_holders_fieldname() -> str | None:
 
 def _remove_visa_holder_from_all_customers(visa_holder: str, skip_customer: str | None = None):
     """Remove this LI from ALL Customers’ visa-holders tables (row-level delete, no list rewrites)."""
-    fieldname = _resolve_customer_visa_holders_fieldname()
+    fieldname = get_table_field("visa_holders")
+    child_dt = get_relationship("visa_holders").child_doctype
     if not fieldname:
         frappe.log_error(
             title="Customer visa-holders table not found (cleanup)",
-            message=f"Could not resolve Customer child table for '{CUSTOMER_VISA_HOLDERS_CHILD_DOTYPE}'."
+            message=f"Could not resolve Customer child table for '{child_dt}'."
         )
         return
 
-    child_dt = CUSTOMER_VISA_HOLDERS_CHILD_DOTYPE
-
     if getattr(frappe.flags, "skip_visa_holder_cleanup", False):
         return
 
@@ -559,7 +575,7 @@ def _remove_visa_holder_from_all_customers(visa_holder: str, skip_customer: str
             try:
                 cdoc = frappe.get_doc("Customer", parent)
                 _normalize_child_idx(cdoc, fn)
-                cdoc.save(ignore_permissions=True)
+                save_derived(cdoc, "visa_holders", "Removed", visa_holder, origin=_individual(visa_holder))
             except Exception:
                 # Non-fatal; rows are already deleted
                 pass
@@ -572,7 +588,7 @@ def _remove_visa_holder_from_all_customers(visa_holder: str, skip_customer: str
 def _remove_dependent_from_all_li_parents(dependent_name: str, skip_parent: str | None = None):
     """Remove this dependent row from ALL Linked Individuals' dependents tables."""
     rows = frappe.get_all(
-        DEPENDENTS_CHILD_DOTYPE,
+        get_relationship("dependents").child_doctype,
         filters={"dependent": dependent_name, "parenttype": "Linked Individual"},
         fields=["name", "parent"],
     )
@@ -585,7 +601,7 @@ def _remove_dependent_from_all_li_parents(dependent_name: str, skip_parent: str
             continue
         parents.setdefault(r.parent, []).append(r.name)
 
-    dep_field = _resolve_dependents_fieldname()
+    dep_field = get_table_field("dependents")
     if not dep_field:
         frappe.log_error(
             title="Dependents cleanup skipped (field missing)",
@@ -603,9 +619,13 @@ def _remove_dependent_from_all_li_parents(dependent_name: str, skip_parent: str
         if len(cleaned) != len(current):
             li.set(dep_field, cleaned)
             _normalize_child_idx(li, dep_field)
-            li.save(ignore_permissions=True)
+            save_derived(li, "dependents", "Removed", dependent_name, origin=_individual(dependent_name))
             frappe.logger().info(f"[LI Dep Sync] Cleaned {dependent_name} from {parent_name}.{dep_field}")
 
+def _individual(name: str):
+    """Reference to the Linked Individual whose save caused a cleanup (the origin of the change)."""
+    return frappe._dict(doctype="Linked Individual", name=name)
+
 def _normalize_child_idx(parent_doc, child_fieldname: str) -> None:
     """Ensure child table rows have sequential idx starting at 1."""
     rows = list(parent_doc.get(child_fieldname) or [])
@@ -0,0 +1,15 @@
+// Copyright (c) 2025, Best Solution® and contributors
+// For license information, please see license.txt
+
+// Expiry and filing due dates; events come from bs_space.expiry_calendar
+frappe.views.calendar["Linked Individual"] = {
+	field_map: {
+		start: "start",
+		end: "end",
+		id: "name",
+		title: "title",
+		allDay: "allDay",
+		color: "color",
+	},
+	get_events_method: "bs_space.expiry_calendar.get_calendar_events",
+};
@@ -0,0 +1,52 @@
+// Copyright (c) 2025, Best Solution® and contributors
+// For license information, please see license.txt
+
+frappe.listview_settings["Business Activity"] = {
+	onload(listview) {
+		if (!frappe.model.can_create("Business Activity")) return;
+
+		listview.page.add_inner_button(__("Load Catalogue"), () => {
+			const dialog = new frappe.ui.Dialog({
+				title: __("Load Authority Catalogue"),
+				fields: [
+					{
+						fieldname: "legal_authority",
+						fieldtype: "Link",
+						options: "Supplier",
+						label: __("Legal Authority"),
+						reqd: 1,
+					},
+					{
+						fieldname: "file_url",
+						fieldtype: "Attach",
+						label: __("Catalogue (CSV / XLSX)"),
+						reqd: 1,
+					},
+				],
+				primary_action_label: __("Load"),
+				primary_action(values) {
+					frappe
+						.xcall("bs_space.activity_catalogue.enqueue_load_catalogue", values)
+						.then(() => {
+							dialog.hide();
+							frappe.show_alert(__("Catalogue queued for loading"));
+						});
+				},
+			});
+			dialog.show();
+		});
+
+		frappe.realtime.on("bs_space_activity_catalogue", (result) => {
+			frappe.msgprint(
+				__("{0}: {1} inserted, {2} updated, {3} disabled", [
+					result.legal_authority,
+					result.inserted,
+					result.updated,
+					result.disabled,
+				]),
+				__("Catalogue Loaded")
+			);
+			listview.refresh();
+		});
+	},
+};
@@ -0,0 +1,33 @@
+import frappe
+from frappe.model.naming import parse_naming_series
+from frappe.utils import cint
+
+
+def get_series(doctype):
+	"""Naming series new `doctype` records get by default (autoname or the first naming_series option)."""
+	meta = frappe.get_meta(doctype)
+	autoname = meta.autoname or ""
+	if autoname.startswith("naming_series:") or not autoname:
+		return (meta.get_field("naming_series").options or "").split("\n")[0]
+	return autoname
+
+
+def reserve_names(series, count):
+	"""`count` consecutive names of a naming series, reserved with a single counter update."""
+	if not count:
+		return []
+	prefix, digits = None, 0
+
+	def capture(partial_series, number_of_digits):
+		nonlocal prefix, digits
+		prefix, digits = partial_series, number_of_digits
+		return "\0"
+
+	template = parse_naming_series(series, number_generator=capture)
+	frappe.db.sql(
+		"insert into `tabSeries` (name, current) values (%s, 0) on duplicate key update name = name", prefix
+	)
+	# the row lock taken by the update holds back other inserts until the caller commits
+	frappe.db.sql("update `tabSeries` set current = current + %s where name = %s", (count, prefix))
+	last = cint(frappe.db.sql("select current from `tabSeries` where name = %s", prefix)[0][0])
+	return [template.replace("\0", str(n).zfill(digits)) for n in range(last - count + 1, last + 1)]
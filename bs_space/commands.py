@@ -0,0 +1,124 @@
+import click
+import frappe
+from frappe.commands import get_site, pass_context
+
+
+@click.command("bs-sync-fixtures")
+@click.option(
+	"--force",
+	is_flag=True,
+	default=False,
+	help="Compare every record even if the fixture files did not change",
+)
+@pass_context
+def sync_fixtures(context, force=False):
+	"""Apply changed Custom Fields / Property Setters from bs_space/fixture_data."""
+	from bs_space.fixture_sync import sync_fixtures
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		changed = sync_fixtures(force=force)
+		click.echo(f"Updated: {', '.join(changed)}" if changed else "Fixtures up to date")
+	finally:
+		frappe.destroy()
+
+
+@click.command("bs-export-fixtures")
+@pass_context
+def export_fixtures(context):
+	"""Export the site's Custom Fields / Property Setters to bs_space/fixture_data."""
+	from bs_space.fixture_sync import export_fixtures
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		export_fixtures()
+	finally:
+		frappe.destroy()
+
+
+@click.command("bs-build-assets")
+@click.option("--force", is_flag=True, default=False, help="Rebuild even if the sources did not change")
+def build_assets(force=False):
+	"""Build hashed, minified CSS and responsive branding images into public/build."""
+	from bs_space.assets import build_assets
+
+	manifest = build_assets(force=force)
+	for path, url in sorted(manifest.get("files", {}).items()):
+		click.echo(f"{path} -> {url}")
+
+
+@click.command("bs-index-advisor")
+@click.option(
+	"--strict", is_flag=True, default=False, help="Exit with an error if a query has no usable index"
+)
+@pass_context
+def index_advisor(context, strict=False):
+	"""EXPLAIN the app's hot query patterns and report full table scans."""
+	from bs_space.index_advisor import explain_patterns, get_regressions
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		results = explain_patterns()
+	finally:
+		frappe.destroy()
+
+	for r in results:
+		if r.verdict == "error":
+			click.secho(f"[error] {r.label}: {r.detail}", fg="red")
+			continue
+		color = {"ok": "green", "full scan": "yellow"}.get(r.verdict, "red")
+		click.secho(
+			f"[{r.verdict}] {r.label} - {r.table}: access={r.access} key={r.key} rows={r.rows}", fg=color
+		)
+
+	regressions = get_regressions(results)
+	if strict and regressions:
+		raise SystemExit(1)
+
+
+@click.command("bs-replica-status")
+@pass_context
+def replica_status(context):
+	"""Show whether read-only methods and reports are currently routed to the read replica."""
+	from bs_space.replica import get_status
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		status = get_status()
+	finally:
+		frappe.destroy()
+
+	click.echo(f"enabled: {status.enabled} (replica_host: {status.replica_host or '-'})")
+	if status.error:
+		click.secho(f"replica unreachable: {status.error}", fg="red")
+	elif status.lag is None:
+		click.secho("no heartbeat on the replica yet (is the scheduler running on the primary?)", fg="yellow")
+	else:
+		click.echo(f"lag: {status.lag:.1f}s (tolerance {status.max_lag:.0f}s)")
+	if status.down:
+		click.secho(f"marked down: {status.down}", fg="yellow")
+	click.secho(f"routed to replica: {status.routed}", fg="green" if status.routed else "yellow")
+
+
+@click.command("bs-load-activities")
+@click.argument("legal_authority")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@pass_context
+def load_activities(context, legal_authority, path):
+	"""Refresh an authority's Business Activities from a CSV / XLSX catalogue."""
+	from bs_space.activity_catalogue import load_catalogue
+
+	frappe.init(site=get_site(context))
+	frappe.connect()
+	try:
+		result = load_catalogue(legal_authority, path)
+	finally:
+		frappe.destroy()
+	click.echo(f"inserted: {result.inserted}, updated: {result.updated}, disabled: {result.disabled}")
+
+
+commands = [sync_fixtures, export_fixtures, build_assets, index_advisor, replica_status, load_activities]
@@ -1,7 +1,11 @@
 import frappe
 from datetime import datetime
-from frappe.utils import now_datetime, getdate
+from frappe.utils import add_to_date, now_datetime, getdate
 from frappe.model.document import Document
+from bs_space.filing_deadlines import mark_filings_pending
+from bs_space.job_runs import tracked_job
+from bs_space.link_changes import save_derived
+from bs_space.relationships import find_parents, get_table_field
 
 def validate(doc, method=None):
     is_tax_user(doc, method)
@@ -25,10 +29,11 @@ def before_insert(doc, method):
 
 def before_save(doc, method):
     # ensure child table is ordered, then assign sr_no = 1..n
-    if getattr(doc, "visa_holders", None):
+    visa_field = get_table_field("visa_holders")
+    if visa_field and doc.get(visa_field):
         # sort by existing idx to keep current order
-        doc.visa_holders = sorted(doc.visa_holders, key=lambda d: d.idx or 0)
-        for i, row in enumerate(doc.visa_holders, start=1):
+        doc.set(visa_field, sorted(doc.get(visa_field), key=lambda d: d.idx or 0))
+        for i, row in enumerate(doc.get(visa_field), start=1):
             row.sr_no = i
 
 
@@ -56,7 +61,7 @@ def validate_license_notification_setting(doc, method):
 def validate_no_self_shareholder(doc, method=None):
     """Prevent a company from being its own shareholder and duplicate rows."""
     seen = set()
-    for row in (doc.custom_shareholders or []):
+    for row in (doc.get(get_table_field("shareholders")) or []):
         # Block self as shareholder for Corporate
         if row.shareholder_type == "Corporate" and (row.shareholder or "").strip() == (doc.name or "").strip():
             frappe.throw("A company cannot be its own shareholder.")
@@ -93,7 +98,8 @@ def validate_parent_company(doc, method):
 
 def validate_shareholders(doc, method):
     """Ensure at least one of each required role is present if shareholders are listed."""
-    if not doc.custom_shareholders:
+    shareholders = doc.get(get_table_field("shareholders"))
+    if not shareholders:
         return  # No shareholders → skip validation
 
     required_roles = {
@@ -105,7 +111,7 @@ def validate_shareholders(doc, method):
 
     missing_roles = []
     for field, label in required_roles.items():
-        if not any(getattr(row, field) for row in doc.custom_shareholders):
+        if not any(getattr(row, field) for row in shareholders):
             missing_roles.append(label)
 
     if missing_roles:
@@ -118,6 +124,7 @@ def sync_channel_partner_sub_company(doc, method):
     if not doc.custom_parent_company:
         return
 
+    sub_field = get_table_field("sub_companies")
     new_parent = frappe.get_doc("Customer", doc.custom_parent_company)
 
     if new_parent.customer_group != "Channel Partner":
@@ -130,18 +137,18 @@ def sync_channel_partner_sub_company(doc, method):
             try:
                 old_parent = frappe.get_doc("Customer", old_parent_name)
                 # Remove this doc from old parent's sub_companies if exists
-                old_parent.custom_sub_companies = [
-                    row for row in old_parent.custom_sub_companies
+                old_parent.set(sub_field, [
+                    row for row in old_parent.get(sub_field)
                     if row.sub_company != doc.name
-                ]
-                old_parent.save(ignore_permissions=True)
+                ])
+                save_derived(old_parent, "sub_companies", "Removed", doc.name, origin=doc)
             except Exception as e:
                 frappe.log_error(f"Error removing sub_company from old parent: {e}")
 
     # Add to new parent if not already there
-    if not any(row.sub_company == doc.name for row in new_parent.custom_sub_companies):
-        new_parent.append("custom_sub_companies", {"sub_company": doc.name})
-        new_parent.save(ignore_permissions=True)
+    if not any(row.sub_company == doc.name for row in new_parent.get(sub_field)):
+        new_parent.append(sub_field, {"sub_company": doc.name})
+        save_derived(new_parent, "sub_companies", "Added", doc.name, origin=doc)
 
 
 
@@ -151,17 +158,20 @@ def sync_client_shareholders(doc, method):
         return
     frappe.flags.skip_client_shareholder_sync = True
 
+    owned_field = get_table_field("owned_companies")
+    sub_field = get_table_field("sub_companies")
+
     # Track currently linked shareholders
     current_individuals = set()
     current_corporates = set()
 
-    for row in doc.custom_shareholders or []:
+    for row in doc.get(get_table_field("shareholders")) or []:
         if row.shareholder_type == "Individual":
             current_individuals.add(row.shareholder)
             target = frappe.get_doc("Linked Individual", row.shareholder)
 
             updated = False
-            for r in target.owned_companies:
+            for r in target.get(owned_field):
                 if r.company == doc.name:
                     # Update shareholding_pct if needed
                     if r.shareholding_pct != row.shareholding_pct:
@@ -169,18 +179,18 @@ def sync_client_shareholders(doc, method):
                     updated = True
                     break
             if not updated:
-                target.append("owned_companies", {
+                target.append(owned_field, {
                     "company": doc.name,
                     "shareholding_pct": row.shareholding_pct
                 })
-            target.save(ignore_permissions=True)
+            save_derived(target, "owned_companies", "Updated" if updated else "Added", doc.name, origin=doc)
 
         elif row.shareholder_type == "Corporate":
             current_corporates.add(row.shareholder)
             target = frappe.get_doc("Customer", row.shareholder)
 
             updated = False
-            for r in target.custom_sub_companies:
+            for r in target.get(sub_field):
                 if r.sub_company == doc.name:
                     # Update shareholding_pct if needed
                     if r.shareholding_pct != row.shareholding_pct:
@@ -188,48 +198,41 @@ def sync_client_shareholders(doc, method):
                     updated = True
                     break
             if not updated:
-                target.append("custom_sub_companies", {
+                target.append(sub_field, {
                     "sub_company": doc.name,
                     "shareholding_pct": row.shareholding_pct
                 })
-            target.save(ignore_permissions=True)
+            save_derived(target, "sub_companies", "Updated" if updated else "Added", doc.name, origin=doc)
 
-    # Cleanup: Remove outdated links
+    # Cleanup: Remove outdated links, loading only the records that still point at this client
 
     # 1. For Individuals
-    individual_names = [r.shareholder for r in doc.custom_shareholders if r.shareholder_type == "Individual"]
-    for li_name in frappe.get_all("Linked Individual", pluck="name"):
+    for li_name in find_parents("owned_companies", doc.name):
+        if li_name in current_individuals:
+            continue
         li_doc = frappe.get_doc("Linked Individual", li_name)
-        before = len(li_doc.owned_companies)
-        li_doc.owned_companies = [
-            r for r in li_doc.owned_companies
-            if not (r.company == doc.name and li_name not in current_individuals)
-        ]
-        if len(li_doc.owned_companies) != before:
-            li_doc.save(ignore_permissions=True)
+        li_doc.set(owned_field, [r for r in li_doc.get(owned_field) if r.company != doc.name])
+        save_derived(li_doc, "owned_companies", "Removed", doc.name, origin=doc)
 
     # 2. For Corporates
-    corporate_names = [r.shareholder for r in doc.custom_shareholders if r.shareholder_type == "Corporate"]
-    for corp_name in frappe.get_all("Customer", pluck="name"):
+    for corp_name in find_parents("sub_companies", doc.name):
+        if corp_name in current_corporates:
+            continue
         corp_doc = frappe.get_doc("Customer", corp_name)
-        before = len(corp_doc.custom_sub_companies)
-        corp_doc.custom_sub_companies = [
-            r for r in corp_doc.custom_sub_companies
-            if not (r.sub_company == doc.name and corp_name not in current_corporates)
-        ]
-        if len(corp_doc.custom_sub_companies) != before:
-            corp_doc.save(ignore_permissions=True)
+        corp_doc.set(sub_field, [r for r in corp_doc.get(sub_field) if r.sub_company != doc.name])
+        save_derived(corp_doc, "sub_companies", "Removed", doc.name, origin=doc)
 
     frappe.flags.skip_client_shareholder_sync = False
 
 
 def validate_shareholding_total(doc, method):
     """Ensure total shareholding adds up to 100%."""
-    if not doc.custom_shareholders:
+    shareholders = doc.get(get_table_field("shareholders"))
+    if not shareholders:
         # No shareholders to validate
         return
 
-    total = sum(row.shareholding_pct or 0 for row in doc.custom_shareholders)
+    total = sum(row.shareholding_pct or 0 for row in shareholders)
     
     if round(total, 2) != 100.0:
         frappe.throw(f"Total shareholding must be exactly 100%. Current total: {total}%")
@@ -241,7 +244,7 @@ def update_remaining_quota(doc, method=None):
         return
     frappe.flags.skip_quota_update = True
     
-    used = len(doc.custom_visa_holders or [])
+    used = len(doc.get(get_table_field("visa_holders")) or [])
     quota = doc.custom_no_of_visa_quota or 0
     remaining = quota - used
     
@@ -275,23 +278,11 @@ def set_tax_filing_status(doc):
         # Reset if year changed
         doc.custom_corporate_tax_status = None
 
+@tracked_job()
 def update_all_tax_statuses():
-    """Weekly check for all customers"""
-    current_year = now_datetime().year
-    
-    customers = frappe.get_all("Customer", 
-        filters={
-            "custom_corporate_tax_next_filing_due_date": ["is", "set"],
-            "custom_corporate_tax_status": ["not in", ["Filing Pending", "Filing In Progress"]]
-        },
-        fields=["name", "custom_corporate_tax_next_filing_due_date"]
-    )
-    
-    for cust in customers:
-        due_date = getdate(cust.custom_corporate_tax_next_filing_due_date)
-        if due_date.year == current_year:
-            frappe.db.set_value("Customer", cust.name, 
-                "custom_corporate_tax_status", "Filing Pending")
+    """Weekly: customers with a corporate tax deadline open this year become Filing Pending"""
+    year_end = getdate(f"{now_datetime().year}-12-31")
+    mark_filings_pending("Corporate Tax", year_end)
 
 def set_vat_filing_status(doc):
     """Auto-set VAT status if due date month/year matches current month/year"""
@@ -309,19 +300,8 @@ def set_vat_filing_status(doc):
     elif doc.custom_vat_status == "Filing Pending":
         doc.custom_vat_status = None  # Reset if no longer current
 
+@tracked_job()
 def update_all_vat_statuses():
-    """Weekly check for VAT filings"""
-    current_date = now_datetime()
-    next_week = add_to_date(current_date, days=7, as_string=True)
-    
-    customers = frappe.get_all("Customer", 
-        filters=[
-            ["custom_vat_next_filing_due_date", "between", [current_date, next_week]],
-            ["custom_vat_status", "not in", ["Filing Pending", "Filing In Progress"]]
-        ],
-        fields=["name", "custom_vat_next_filing_due_date"]
-    )
-    
-    for cust in customers:
-        frappe.db.set_value("Customer", cust.name, 
-            "custom_vat_status", "Filing Pending")
\ No newline at end of file
+    """Weekly: customers with a VAT deadline open within the next week become Filing Pending"""
+    next_week = add_to_date(now_datetime(), days=7).date()
+    mark_filings_pending("VAT", next_week)
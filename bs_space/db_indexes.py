@@ -0,0 +1,43 @@
+import frappe
+
+from bs_space.relationships import RELATIONSHIPS
+
+# Columns the app's hooks, jobs and APIs filter on, as (doctype, columns). Child tables
+# of the relationship registry lead with parenttype because every lookup is scoped to one
+# parent doctype.
+INDEXES = (
+	*((spec["child_doctype"], ("parenttype", spec["link_field"])) for spec in RELATIONSHIPS.values()),
+	("Customer", ("custom_parent_company",)),
+	("Customer", ("custom_license_expiry_date",)),
+	("Customer", ("custom_vat_next_filing_due_date",)),
+	("Customer", ("custom_corporate_tax_next_filing_due_date",)),
+	("Linked Individual", ("visa_parent", "parent_type")),
+	("Linked Individual", ("visa_expiry_date",)),
+	("Linked Individual", ("passport_expiry_date",)),
+	("Linked Individual", ("emirates_id_expiry_date",)),
+	("Project", ("custom_renewal_for", "custom_renewal_of")),
+	("Business Activity", ("legal_authority", "activity_code")),
+)
+
+
+def get_index_name(columns) -> str:
+	return "bs_" + "_".join(columns)[:56] + "_index"
+
+
+def ensure_indexes():
+	"""
+	Create the missing indexes of INDEXES. Indexes on custom fields that do not exist yet
+	are skipped; this also runs after migrate, once the fixtures have added those columns.
+	"""
+	created = []
+	for doctype, columns in INDEXES:
+		if not frappe.db.table_exists(doctype):
+			continue
+		if not all(frappe.db.has_column(doctype, column) for column in columns):
+			continue
+		index_name = get_index_name(columns)
+		if frappe.db.has_index(f"tab{doctype}", index_name):
+			continue
+		frappe.db.add_index(doctype, list(columns), index_name=index_name)
+		created.append(f"{doctype}: {index_name}")
+	return created
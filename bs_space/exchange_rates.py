@@ -0,0 +1,160 @@
+from collections import OrderedDict
+
+import frappe
+from frappe.utils import flt, getdate, nowdate
+
+# Upper bound for memoized (from, to, date) rates held by one worker
+RATE_CACHE_SIZE = 4096
+RATE_CACHE_VERSION_KEY = "bs_space:exchange_rate_version"
+
+_rate_cache: "OrderedDict[tuple[str, str, str], float]" = OrderedDict()
+_rate_cache_version = None
+
+
+def _sync_cache_version():
+	"""Drop the local cache when a Currency Exchange changed in any worker (checked once per request)."""
+	global _rate_cache_version
+	if getattr(frappe.local, "bs_exchange_rate_version_checked", False):
+		return
+	frappe.local.bs_exchange_rate_version_checked = True
+
+	version = frappe.cache.get_value(RATE_CACHE_VERSION_KEY)
+	if version != _rate_cache_version:
+		_rate_cache.clear()
+		_rate_cache_version = version
+
+
+def _cache_get(key):
+	rate = _rate_cache.get(key)
+	if rate is not None:
+		_rate_cache.move_to_end(key)
+	return rate
+
+
+def _cache_set(key, rate):
+	_rate_cache[key] = rate
+	_rate_cache.move_to_end(key)
+	while len(_rate_cache) > RATE_CACHE_SIZE:
+		_rate_cache.popitem(last=False)
+
+
+def clear_exchange_rate_cache(doc=None, method=None):
+	"""Currency Exchange on_update / on_trash: invalidate memoized rates on every worker."""
+	_rate_cache.clear()
+	frappe.cache.set_value(RATE_CACHE_VERSION_KEY, frappe.generate_hash(length=10))
+
+
+def get_exchange_rate(from_currency, to_currency, date=None):
+	"""Rate to convert one unit of from_currency into to_currency on date (memoized)."""
+	date = str(getdate(date or nowdate()))
+	return get_exchange_rates([(from_currency, date)], to_currency).get((from_currency, date), 0.0)
+
+
+def get_exchange_rates(pairs, to_currency):
+	"""
+	Resolve rates for many (from_currency, date) pairs into to_currency.
+
+	Pairs already memoized are served from the LRU cache; the rest are resolved
+	with ONE query over Currency Exchange that reads only the latest direct and inverse
+	quote on or before each date. Returns {(from_currency, "YYYY-MM-DD"): rate}; rates
+	that could not be found are 0.0 and are not memoized.
+	"""
+	_sync_cache_version()
+
+	result = {}
+	missing = set()
+	for from_currency, date in pairs:
+		if not from_currency:
+			continue
+		date = str(getdate(date or nowdate()))
+		if from_currency == to_currency:
+			result[(from_currency, date)] = 1.0
+			continue
+		rate = _cache_get((from_currency, to_currency, date))
+		if rate is None:
+			missing.add((from_currency, date))
+		else:
+			result[(from_currency, date)] = rate
+
+	if not missing:
+		return result
+
+	latest = _latest_quotes(sorted(missing), to_currency)
+	unquoted = sorted(key for key in missing if key not in latest)
+	if unquoted:
+		latest.update(_fetch_rates_fallback(unquoted, to_currency))
+	for from_currency, date in missing:
+		rate = latest.get((from_currency, date), 0.0)
+		if rate:
+			# a missing rate may be entered later without touching the cache version
+			_cache_set((from_currency, to_currency, date), rate)
+		result[(from_currency, date)] = rate
+
+	return result
+
+
+def _latest_quotes(requested, to_currency):
+	"""
+	{(from_currency, date): rate into to_currency} from the newest direct or inverse
+	quote on or before each date; only those quotes are read, never a currency's history.
+	"""
+	values = {"to_currency": to_currency}
+	selects = []
+	for i, (currency, date) in enumerate(requested):
+		values[f"currency_{i}"], values[f"date_{i}"] = currency, date
+		selects.append(f"select %(currency_{i})s as currency, %(date_{i})s as req_date")
+
+	quotes = frappe.db.sql(
+		f"""
+		select r.currency, r.req_date, q.from_currency, q.date, q.exchange_rate
+		from ({" union all ".join(selects)}) r
+		join `tabCurrency Exchange` q
+			on ((q.from_currency = r.currency and q.to_currency = %(to_currency)s)
+				or (q.from_currency = %(to_currency)s and q.to_currency = r.currency))
+			and q.exchange_rate != 0
+			and q.date = (
+				select max(x.date) from `tabCurrency Exchange` x
+				where x.from_currency = q.from_currency and x.to_currency = q.to_currency
+					and x.exchange_rate != 0 and x.date <= r.req_date
+			)
+		""",
+		values,
+		as_dict=True,
+	)
+
+	# (currency, date) -> (quote date, is direct, rate): the newer quote wins, direct on a tie
+	best = {}
+	for q in quotes:
+		direct = q.from_currency == q.currency
+		rate = flt(q.exchange_rate) if direct else 1 / flt(q.exchange_rate)
+		candidate = (str(q.date), direct, rate)
+		key = (q.currency, str(getdate(q.req_date)))
+		if key not in best or candidate[:2] > best[key][:2]:
+			best[key] = candidate
+	return {key: rate for key, (_date, _direct, rate) in best.items()}
+
+
+def _fetch_rates_fallback(requested, to_currency):
+	"""
+	No stored quote: defer to ERPNext (Currency Exchange Settings / external API). Rates it
+	fetched before are read from its redis cache in one round trip; only the others are
+	requested one pair at a time, and all failures are logged together.
+	"""
+	from erpnext.setup.utils import get_exchange_rate as erpnext_exchange_rate
+
+	# ERPNext caches API rates under these raw keys for six hours
+	keys = [f"currency_exchange_rate_{date}:{currency}:{to_currency}" for currency, date in requested]
+	rates, failed = {}, []
+	for (currency, date), cached in zip(requested, frappe.cache.mget(keys), strict=True):
+		try:
+			rate = flt(cached) if cached else flt(erpnext_exchange_rate(currency, to_currency, date))
+		except Exception:
+			rate = 0.0
+		if rate:
+			rates[(currency, date)] = rate
+		else:
+			failed.append(f"{currency} → {to_currency} on {date}")
+
+	if failed:
+		frappe.log_error("Exchange rates not found", "\n".join(failed))
+	return rates
@@ -0,0 +1,198 @@
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, format_datetime, get_url, getdate, now_datetime, today
+from werkzeug.wrappers import Response
+
+from bs_space.replica import read_from_replica
+
+CALENDAR_VERSION_KEY = "bs_space:expiry_calendar_version"
+FEED_TOKEN_KEY = "bs_space_calendar_token"
+# global default per token naming its user, so a feed poll is one keyed (cached) lookup
+FEED_TOKEN_OWNER_KEY = "bs_feed_token:{}"
+# the ICS feed covers recently missed dates and the year ahead
+FEED_PAST_DAYS = 30
+FEED_FUTURE_DAYS = 365
+
+# (doctype, date field, title field, event label, color)
+EVENT_SOURCES = (
+	("Customer", "custom_license_expiry_date", "customer_name", "Licence expiry", "#cc8667"),
+	("Customer", "custom_vat_next_filing_due_date", "customer_name", "VAT return due", "#14253e"),
+	(
+		"Customer",
+		"custom_corporate_tax_next_filing_due_date",
+		"customer_name",
+		"Corporate tax return due",
+		"#14253e",
+	),
+	("Linked Individual", "visa_expiry_date", "full_name", "Visa expiry", "#e24c4c"),
+	("Linked Individual", "passport_expiry_date", "full_name", "Passport expiry", "#ecad4b"),
+	("Linked Individual", "emirates_id_expiry_date", "full_name", "Emirates ID expiry", "#ecad4b"),
+)
+
+
+# ---- invalidation ----
+
+
+def bump_calendar_version():
+	"""Give every feed a new ETag, e.g. after due dates were changed with plain SQL."""
+	frappe.cache.set_value(CALENDAR_VERSION_KEY, frappe.generate_hash(length=10))
+
+
+def consume_changes(events):
+	"""Outbox consumer: new ETag when a Customer / Linked Individual calendar date or title changed."""
+	watched = {}
+	for source_doctype, date_field, title_field, *_rest in EVENT_SOURCES:
+		watched.setdefault(source_doctype, set()).update((date_field, title_field))
+	for event in events:
+		fields = watched.get(event.ref_doctype)
+		if fields and (event.action != "Update" or fields.intersection(event.changed_fields)):
+			bump_calendar_version()
+			return
+
+
+# ---- events ----
+
+
+def get_events(start, end, doctype=None):
+	"""Expiry and due date events between start and end, one indexed range query per source."""
+	events = []
+	for source_doctype, date_field, title_field, label, color in EVENT_SOURCES:
+		if doctype and source_doctype != doctype:
+			continue
+		if not frappe.has_permission(source_doctype, "read"):
+			continue
+		for row in frappe.get_list(
+			source_doctype,
+			filters={date_field: ["between", [start, end]]},
+			fields=["name", f"{title_field} as title", f"{date_field} as date"],
+			order_by=f"{date_field} asc",
+		):
+			events.append(
+				frappe._dict(
+					uid=f"{frappe.scrub(source_doctype)}-{row.name}-{date_field}",
+					doctype=source_doctype,
+					name=row.name,
+					title=f"{_(label)}: {row.title or row.name}",
+					start=row.date,
+					end=row.date,
+					allDay=1,
+					color=color,
+				)
+			)
+	return sorted(events, key=lambda e: e.start)
+
+
+@frappe.whitelist()
+@read_from_replica()
+def get_calendar_events(doctype, start, end, filters=None, field_map=None):
+	"""Calendar view data source for Customer and Linked Individual."""
+	return get_events(getdate(start), getdate(end), doctype=doctype)
+
+
+# ---- iCalendar feed ----
+
+
+def _escape(text):
+	return str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line):
+	"""Fold content lines longer than 75 octets as RFC 5545 requires."""
+	if len(line.encode()) <= 75:
+		return line
+	parts, chunk = [], b""
+	for char in line:
+		b = char.encode()
+		if len(chunk) + len(b) > (75 if not parts else 74):
+			parts.append(chunk.decode())
+			chunk = b""
+		chunk += b
+	parts.append(chunk.decode())
+	return "\r\n ".join(parts)
+
+
+def build_ics(events, calendar_name):
+	stamp = format_datetime(now_datetime(), "yyyyMMdd'T'HHmmss")
+	lines = [
+		"BEGIN:VCALENDAR",
+		"VERSION:2.0",
+		"PRODID:-//Best Solution//BS Space//EN",
+		"CALSCALE:GREGORIAN",
+		f"X-WR-CALNAME:{_escape(calendar_name)}",
+	]
+	for event in events:
+		day = getdate(event.start)
+		route = frappe.scrub(event.doctype).replace("_", "-")
+		lines += [
+			"BEGIN:VEVENT",
+			f"UID:{event.uid}@{frappe.local.site}",
+			f"DTSTAMP:{stamp}",
+			f"DTSTART;VALUE=DATE:{day:%Y%m%d}",
+			f"DTEND;VALUE=DATE:{add_days(day, 1):%Y%m%d}",
+			f"SUMMARY:{_escape(event.title)}",
+			f"URL:{get_url(f'/app/{route}/{event.name}')}",
+			"TRANSP:TRANSPARENT",
+			"END:VEVENT",
+		]
+	lines.append("END:VCALENDAR")
+	return "\r\n".join(_fold(line) for line in lines) + "\r\n"
+
+
+def _user_from_token(token):
+	if not token:
+		return None
+	return frappe.db.get_global(FEED_TOKEN_OWNER_KEY.format(token))
+
+
+def set_feed_token(user, token):
+	"""Store `token` as the user's feed token, replacing (and invalidating) the previous one."""
+	previous = frappe.defaults.get_user_default(FEED_TOKEN_KEY, user)
+	if previous and previous != token:
+		frappe.defaults.clear_default(FEED_TOKEN_OWNER_KEY.format(previous), parent="__global")
+	frappe.defaults.set_user_default(FEED_TOKEN_KEY, token, user)
+	frappe.db.set_global(FEED_TOKEN_OWNER_KEY.format(token), user)
+
+
+@frappe.whitelist()
+def get_feed_url(reset=False):
+	"""Personal ICS subscription URL of the current user (a new token invalidates the old URL)."""
+	if frappe.session.user == "Guest":
+		frappe.throw(_("Log in to get a calendar feed"), frappe.PermissionError)
+	token = frappe.defaults.get_user_default(FEED_TOKEN_KEY)
+	if not token or frappe.parse_json(reset):
+		token = frappe.generate_hash(length=32)
+		set_feed_token(frappe.session.user, token)
+	return get_url(f"/api/method/bs_space.expiry_calendar.feed?token={token}")
+
+
+@frappe.whitelist(allow_guest=True, methods=["GET"])
+def feed(token=None):
+	"""
+	ICS feed of the token owner's expiry dates. The ETag changes only when a calendar date
+	changes (or the day rolls over), so polling clients mostly get an empty 304.
+	"""
+	user = _user_from_token(token)
+	if not user:
+		raise frappe.PermissionError
+
+	version = frappe.cache.get_value(CALENDAR_VERSION_KEY) or ""
+	etag = '"{}"'.format(hashlib.sha1(f"{user}|{version}|{today()}".encode()).hexdigest())
+	headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+	if etag in (frappe.request.headers.get("If-None-Match") or ""):
+		return Response(status=304, headers=headers)
+
+	session_user = frappe.session.user
+	frappe.set_user(user)
+	try:
+		# read on the primary: the ETag names the current version, so the body must match it
+		events = get_events(add_days(today(), -FEED_PAST_DAYS), add_days(today(), FEED_FUTURE_DAYS))
+	finally:
+		frappe.set_user(session_user)
+
+	return Response(
+		build_ics(events, _("BS Space expiries")),
+		headers=headers,
+		content_type="text/calendar; charset=utf-8",
+	)
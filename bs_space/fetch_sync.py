@@ -0,0 +1,186 @@
+import frappe
+from frappe import _
+
+FETCH_RULES_CACHE_KEY = "bs_space:fetch_rules"
+
+
+def _build_fetch_rules():
+	rules = []
+	for cf in frappe.get_all(
+		"Custom Field",
+		filters={"fetch_from": ["is", "set"]},
+		fields=["dt", "fieldname", "fetch_from"],
+		order_by="dt, fieldname",
+	):
+		link_field, _sep, source_field = (cf.fetch_from or "").partition(".")
+		if not source_field or "." in source_field:
+			continue
+		meta = frappe.get_meta(cf.dt)
+		link_df = meta.get_field(link_field)
+		if not link_df or link_df.fieldtype != "Link":
+			continue
+		rules.append(
+			{
+				"target_doctype": cf.dt,
+				"target_field": cf.fieldname,
+				"link_field": link_field,
+				"source_doctype": link_df.options,
+				"source_field": source_field,
+				"is_child": meta.istable,
+			}
+		)
+	return rules
+
+
+def get_fetch_rules(source_doctype=None) -> list[frappe._dict]:
+	"""fetch_from copies defined by custom fields, optionally only those reading `source_doctype`."""
+	rules = frappe.cache.get_value(FETCH_RULES_CACHE_KEY, generator=_build_fetch_rules)
+	return [
+		frappe._dict(rule) for rule in rules if not source_doctype or rule["source_doctype"] == source_doctype
+	]
+
+
+def clear_fetch_rules(doc=None, method=None):
+	"""Custom Field on_update / on_trash."""
+	frappe.cache.delete_value(FETCH_RULES_CACHE_KEY)
+
+
+class FetchResolver:
+	"""
+	Resolve fetch_from values for documents built in bulk. Each source record is
+	read once per request, and the records a document needs are read together.
+	"""
+
+	def __init__(self):
+		if not hasattr(frappe.local, "bs_space_fetch_cache"):
+			frappe.local.bs_space_fetch_cache = {}
+		self.cache = frappe.local.bs_space_fetch_cache
+		self.rules_by_target = {}
+		for rule in get_fetch_rules():
+			self.rules_by_target.setdefault(rule.target_doctype, []).append(rule)
+
+	def prefetch(self, source_doctype, names, fields):
+		"""Load `fields` of every not-yet-cached record in one query."""
+		missing = [n for n in set(names) if n and (source_doctype, n) not in self.cache]
+		if not missing:
+			return
+		for row in frappe.get_all(
+			source_doctype, filters={"name": ["in", missing]}, fields=["name", *sorted(set(fields))]
+		):
+			self.cache[(source_doctype, row.name)] = row
+		for name in missing:
+			self.cache.setdefault((source_doctype, name), frappe._dict())
+
+	def _rows_by_doctype(self, doc):
+		rows = {doc.doctype: [doc]}
+		for df in frappe.get_meta(doc.doctype).get_table_fields():
+			for row in doc.get(df.fieldname) or []:
+				rows.setdefault(df.options, []).append(row)
+		return rows
+
+	def _collect(self, rows_by_doctype, wanted):
+		for doctype, rows in rows_by_doctype.items():
+			for rule in self.rules_by_target.get(doctype, []):
+				names, fields = wanted.setdefault(rule.source_doctype, (set(), set()))
+				names.update(row.get(rule.link_field) for row in rows)
+				fields.add(rule.source_field)
+		return wanted
+
+	def prefetch_for(self, docs):
+		"""Load what a batch of documents links to with one query per source doctype."""
+		wanted = {}
+		for doc in docs:
+			self._collect(self._rows_by_doctype(doc), wanted)
+		for source_doctype, (names, fields) in wanted.items():
+			self.prefetch(source_doctype, names, fields)
+
+	def apply(self, doc, overwrite=False):
+		"""Fill the fetch_from fields of `doc` and its child rows (empty fields only unless overwrite)."""
+		rows_by_doctype = self._rows_by_doctype(doc)
+
+		# one query per source doctype for everything this document links to
+		for source_doctype, (names, fields) in self._collect(rows_by_doctype, {}).items():
+			self.prefetch(source_doctype, names, fields)
+
+		for doctype, rows in rows_by_doctype.items():
+			for rule in self.rules_by_target.get(doctype, []):
+				for row in rows:
+					if row.get(rule.target_field) and not overwrite:
+						continue
+					source = self.cache.get((rule.source_doctype, row.get(rule.link_field))) or {}
+					row.set(rule.target_field, source.get(rule.source_field))
+		return doc
+
+
+# ---- propagation ----
+
+
+def queue_fetch_propagation(doc, method=None):
+	"""on_update of a source record: push changed fetched values to open drafts in the background."""
+	changed = sorted(
+		{r.source_field for r in get_fetch_rules(doc.doctype) if doc.has_value_changed(r.source_field)}
+	)
+	if not changed or doc.is_new():
+		return
+	frappe.enqueue(
+		"bs_space.fetch_sync.propagate_fetch_values",
+		queue="short",
+		enqueue_after_commit=True,
+		source_doctype=doc.doctype,
+		source_name=doc.name,
+		fields=changed,
+	)
+
+
+def propagate_fetch_values(source_doctype, source_name, fields=None):
+	"""Set-based UPDATE of every draft document (and draft child row) copying the source's fields."""
+	rules = [r for r in get_fetch_rules(source_doctype) if not fields or r.source_field in fields]
+	if not rules:
+		return
+
+	# read the current values at run time so out-of-order jobs cannot write stale data
+	values = frappe.db.get_value(
+		source_doctype, source_name, sorted({r.source_field for r in rules}), as_dict=True
+	)
+	if not values:
+		return
+
+	for rule in rules:
+		value = values.get(rule.source_field)
+		frappe.db.sql(
+			f"""
+			update `tab{rule.target_doctype}`
+			set `{rule.target_field}` = %(value)s
+			where `{rule.link_field}` = %(source_name)s
+				and docstatus = 0
+				and not (`{rule.target_field}` <=> %(value)s)
+			""",
+			{"value": value, "source_name": source_name},
+		)
+	frappe.db.commit()
+
+
+@frappe.whitelist()
+def enqueue_full_propagation(source_doctype):
+	"""Re-sync every draft copy of `source_doctype` values (e.g. after a bulk import of Items)."""
+	frappe.only_for("System Manager")
+	if not get_fetch_rules(source_doctype):
+		frappe.throw(_("No fetched fields read from {0}").format(source_doctype))
+	frappe.enqueue(
+		"bs_space.fetch_sync.propagate_all_fetch_values", queue="long", source_doctype=source_doctype
+	)
+
+
+def propagate_all_fetch_values(source_doctype):
+	"""One joined UPDATE per fetch rule instead of one per source record."""
+	source_table = f"tab{source_doctype}"
+	for rule in get_fetch_rules(source_doctype):
+		frappe.db.sql(
+			f"""
+			update `tab{rule.target_doctype}` t
+			join `{source_table}` s on s.name = t.`{rule.link_field}`
+			set t.`{rule.target_field}` = s.`{rule.source_field}`
+			where t.docstatus = 0 and not (t.`{rule.target_field}` <=> s.`{rule.source_field}`)
+			"""
+		)
+		frappe.db.commit()
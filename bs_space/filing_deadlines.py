@@ -0,0 +1,344 @@
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils import add_days, add_months, cint, get_first_day, get_last_day, getdate, now, today
+
+from bs_space.expiry_calendar import bump_calendar_version
+from bs_space.job_runs import track, tracked_job
+from bs_space.replica import read_from_replica
+from bs_space.streaming import iter_batches
+
+DEADLINE_DOCTYPE = "Filing Deadline"
+# future deadlines kept per customer and tax type
+DEFAULT_COUNT = 4
+# customers re-projected (and committed) together by the full rebuild
+REBUILD_BATCH_SIZE = 500
+
+TAX_TYPES = {
+	"VAT": frappe._dict(
+		registration_field="custom_vat_registration_date",
+		status_field="custom_vat_status",
+		due_field="custom_vat_next_filing_due_date",
+		frequency_field="custom_vat_filing_frequency",
+		# return and payment due 28 days after the end of the tax period
+		due_days=28,
+		due_months=0,
+	),
+	"Corporate Tax": frappe._dict(
+		registration_field="custom_corporate_tax_registration_date",
+		status_field="custom_corporate_tax_status",
+		due_field="custom_corporate_tax_next_filing_due_date",
+		frequency_field=None,
+		# return due within 9 months from the end of the (annual) tax period
+		due_days=0,
+		due_months=9,
+	),
+}
+PERIOD_MONTHS = {"Monthly": 1, "Quarterly": 3, "Annually": 12}
+ACTIVE_FILING_STATUSES = ("Filing Pending", "Filing In Progress")
+
+
+def _period_months(tax_type, frequency):
+	if tax_type == "Corporate Tax":
+		return 12
+	return PERIOD_MONTHS.get(frequency or "Quarterly", 3)
+
+
+def _due_date(tax_type, period_end):
+	spec = TAX_TYPES[tax_type]
+	if spec.due_months:
+		return get_last_day(add_months(period_end, spec.due_months))
+	return add_days(period_end, spec.due_days)
+
+
+def _deadline_name(customer, tax_type, period_start):
+	return hashlib.md5(f"{customer}|{tax_type}|{period_start}".encode()).hexdigest()[:20]
+
+
+def project_deadlines(customer, tax_type, registration_date, frequency, after, from_date, count):
+	"""
+	Tax periods of one customer, from the first period due after `after` (the last filed or
+	known deadline) through the next `count` deadlines falling on or after `from_date`.
+	"""
+	months = _period_months(tax_type, frequency)
+	first_start = get_first_day(getdate(registration_date))
+	after = getdate(after) if after else None
+
+	# jump straight to the period around `after` / `from_date` instead of walking from registration
+	anchor = min(after, from_date) if after else from_date
+	elapsed = (anchor.year - first_start.year) * 12 + anchor.month - first_start.month
+	k = max(0, elapsed // months - 12 // months - 1)
+
+	rows, upcoming = [], 0
+	while upcoming < count:
+		period_start = add_months(first_start, k * months)
+		period_end = add_days(add_months(period_start, months), -1)
+		due_date = _due_date(tax_type, period_end)
+		k += 1
+		if after and due_date <= after:
+			continue
+		if not after and due_date < from_date:
+			continue
+		rows.append(
+			frappe._dict(
+				name=_deadline_name(customer, tax_type, period_start),
+				customer=customer,
+				tax_type=tax_type,
+				period_start=period_start,
+				period_end=period_end,
+				due_date=due_date,
+			)
+		)
+		if due_date >= from_date:
+			upcoming += 1
+	return rows
+
+
+def _registered_customers(tax_type, customers=None):
+	"""Customers registered for `tax_type` with the anchors of their projection, in one query."""
+	spec = TAX_TYPES[tax_type]
+	frequency = f"c.`{spec.frequency_field}`" if spec.frequency_field else "null"
+	condition = "and c.name in %(customers)s" if customers else ""
+	return frappe.db.sql(
+		f"""
+		select c.name, c.`{spec.registration_field}` as registration_date, {frequency} as frequency,
+			greatest(
+				coalesce(max(fd.due_date), '1900-01-01'),
+				coalesce(date_sub(c.`{spec.due_field}`, interval 1 day), '1900-01-01')
+			) as last_due
+		from `tabCustomer` c
+		left join `tab{DEADLINE_DOCTYPE}` fd
+			on fd.customer = c.name and fd.tax_type = %(tax_type)s and fd.status = 'Filed'
+		where c.`{spec.registration_field}` is not null
+			and ifnull(c.custom_tax_account_type, '') in ('', %(tax_type)s, 'Both')
+			and ifnull(c.`{spec.status_field}`, '') != 'Not filing through us'
+			{condition}
+		group by c.name
+		""",
+		{"tax_type": tax_type, "customers": tuple(customers or ())},
+		as_dict=True,
+	)
+
+
+def _upsert_deadlines(rows):
+	"""Insert projected deadlines in one statement; filed deadlines keep their status."""
+	if not rows:
+		return
+	timestamp, user = now(), frappe.session.user
+	values = []
+	for r in rows:
+		values.extend(
+			(
+				r.name,
+				r.customer,
+				r.tax_type,
+				"Open",
+				r.period_start,
+				r.period_end,
+				r.due_date,
+				timestamp,
+				timestamp,
+				user,
+				user,
+			)
+		)
+	placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+	frappe.db.sql(
+		f"""
+		insert into `tab{DEADLINE_DOCTYPE}`
+			(name, customer, tax_type, status, period_start, period_end, due_date,
+			creation, modified, owner, modified_by)
+		values {placeholders}
+		on duplicate key update
+			period_end = values(period_end), due_date = values(due_date), modified = values(modified)
+		""",
+		values,
+	)
+
+
+def sync_next_due_dates(customers=None):
+	"""Copy the earliest open deadline into the Customer's next filing due date fields."""
+	condition = "and c.name in %(customers)s" if customers else ""
+	for tax_type, spec in TAX_TYPES.items():
+		frappe.db.sql(
+			f"""
+			update `tabCustomer` c
+			join (
+				select customer, min(due_date) as due_date
+				from `tab{DEADLINE_DOCTYPE}`
+				where tax_type = %(tax_type)s and status = 'Open'
+				group by customer
+			) fd on fd.customer = c.name
+			set c.`{spec.due_field}` = fd.due_date
+			where not (c.`{spec.due_field}` <=> fd.due_date) {condition}
+			""",
+			{"tax_type": tax_type, "customers": tuple(customers or ())},
+		)
+
+
+def _rebuild(customers=None, count=DEFAULT_COUNT):
+	from_date = getdate(today())
+	rows, scanned = [], 0
+	for tax_type in TAX_TYPES:
+		for c in _registered_customers(tax_type, customers):
+			scanned += 1
+			after = None if str(c.last_due) == "1900-01-01" else c.last_due
+			rows.extend(
+				project_deadlines(c.name, tax_type, c.registration_date, c.frequency, after, from_date, count)
+			)
+
+	# open deadlines are pure projections: replace them, filed ones stay as history
+	filters = {"status": "Open"}
+	if customers:
+		filters["customer"] = ["in", customers]
+	frappe.db.delete(DEADLINE_DOCTYPE, filters)
+	_upsert_deadlines(rows)
+	sync_next_due_dates(customers)
+	# due dates were written with plain SQL, so the Customer hooks did not refresh the feed
+	bump_calendar_version()
+	track(scanned=scanned, updated=len(rows))
+	return rows
+
+
+@tracked_job()
+def rebuild_filing_deadlines(count=DEFAULT_COUNT):
+	"""
+	Daily: project the next `count` VAT and Corporate Tax deadlines of every customer, one
+	committed batch of customers at a time so the projected rows never span the whole book.
+	"""
+	for batch in iter_batches("Customer", batch_size=REBUILD_BATCH_SIZE, commit=True):
+		_rebuild([c.name for c in batch], cint(count) or DEFAULT_COUNT)
+	_delete_orphaned_deadlines()
+
+
+def _delete_orphaned_deadlines():
+	"""Open deadlines of customers no batch covered (deleted or renamed away), once per run."""
+	frappe.db.sql(
+		f"""
+		delete fd
+		from `tab{DEADLINE_DOCTYPE}` fd
+		left join `tabCustomer` c on c.name = fd.customer
+		where fd.status = 'Open' and c.name is null
+		"""
+	)
+
+
+@frappe.whitelist()
+def enqueue_rebuild_filing_deadlines(count=DEFAULT_COUNT):
+	frappe.only_for(("Accounts Manager", "System Manager"))
+	frappe.enqueue("bs_space.filing_deadlines.rebuild_filing_deadlines", queue="long", count=count)
+
+
+# ---- statuses ----
+
+
+def mark_filings_pending(tax_type, until):
+	"""
+	Set the filing status to Filing Pending for customers with an open deadline due by `until`
+	and return how many customers were changed (int). The UPDATE bypasses the document API: the customers' `modified` is left unchanged, and no
+	outbox event, Version or other consumer notice is sent for them.
+	"""
+	spec = TAX_TYPES[tax_type]
+	tables = f"""`tabCustomer` c
+		join (
+			select distinct customer
+			from `tab{DEADLINE_DOCTYPE}`
+			where tax_type = %(tax_type)s and status = 'Open' and due_date <= %(until)s
+		) fd on fd.customer = c.name"""
+	condition = f"ifnull(c.`{spec.status_field}`, '') not in %(active)s"
+	values = {"tax_type": tax_type, "until": until, "active": ACTIVE_FILING_STATUSES}
+
+	# counted up front: the driver's affected-rows count is not part of frappe.db's API
+	updated = frappe.db.sql(f"select count(*) from {tables} where {condition}", values)[0][0]
+	if updated:
+		# one set-based UPDATE: the matching customers are never loaded into the worker
+		frappe.db.sql(
+			f"update {tables} set c.`{spec.status_field}` = 'Filing Pending' where {condition}", values
+		)
+	track(scanned=updated, updated=updated)
+	return updated
+
+
+# ---- hooks ----
+
+
+def roll_forward_completed_filing(doc, method=None):
+	"""
+	Customer validate (before the status checks): when a filing is marked completed, close
+	its deadline and move the next filing due date to the following period.
+	"""
+	if doc.is_new():
+		return
+	for tax_type, spec in TAX_TYPES.items():
+		if doc.get(spec.status_field) != "Filing Completed" or not doc.has_value_changed(spec.status_field):
+			continue
+		if not frappe.db.exists(
+			DEADLINE_DOCTYPE, {"customer": doc.name, "tax_type": tax_type, "status": "Open"}
+		):
+			_rebuild([doc.name])
+
+		open_deadlines = frappe.get_all(
+			DEADLINE_DOCTYPE,
+			filters={"customer": doc.name, "tax_type": tax_type, "status": "Open"},
+			fields=["name", "due_date"],
+			order_by="due_date asc",
+			limit=2,
+		)
+		if not open_deadlines:
+			continue
+		frappe.db.set_value(
+			DEADLINE_DOCTYPE, open_deadlines[0].name, {"status": "Filed", "filed_on": today()}
+		)
+		doc.set(spec.due_field, open_deadlines[1].due_date if len(open_deadlines) > 1 else None)
+
+
+def update_customer_deadlines(doc, method=None):
+	"""Customer on_update: re-project when registration, frequency or filing status changed."""
+	watched = [
+		f
+		for spec in TAX_TYPES.values()
+		for f in (spec.registration_field, spec.frequency_field, spec.status_field, "custom_tax_account_type")
+		if f
+	]
+	if doc.is_new() or any(doc.has_value_changed(f) for f in watched):
+		_rebuild([doc.name])
+
+
+# ---- calendar ----
+
+
+@frappe.whitelist()
+@read_from_replica()
+def get_filing_calendar(from_date=None, months=12, tax_type=None, status=None):
+	"""Deadlines of the whole portfolio for the next `months` months in a single query."""
+	frappe.has_permission(DEADLINE_DOCTYPE, "read", throw=True)
+	if tax_type and tax_type not in TAX_TYPES:
+		frappe.throw(_("Unknown tax type {0}").format(tax_type))
+
+	from_date = getdate(from_date or today())
+	conditions = ["fd.due_date between %(from_date)s and %(to_date)s"]
+	values = {
+		"from_date": from_date,
+		"to_date": add_days(add_months(from_date, cint(months) or 12), -1),
+		"tax_type": tax_type,
+		"status": status,
+	}
+	if tax_type:
+		conditions.append("fd.tax_type = %(tax_type)s")
+	if status:
+		conditions.append("fd.status = %(status)s")
+
+	return frappe.db.sql(
+		f"""
+		select fd.due_date, fd.tax_type, fd.customer, c.customer_name,
+			fd.period_start, fd.period_end, fd.status, fd.filed_on,
+			date_format(fd.due_date, '%%Y-%%m') as month
+		from `tab{DEADLINE_DOCTYPE}` fd
+		join `tabCustomer` c on c.name = fd.customer
+		where {" and ".join(conditions)}
+		order by fd.due_date, fd.tax_type, c.customer_name
+		""",
+		values,
+		as_dict=True,
+	)
@@ -0,0 +1,137 @@
+import hashlib
+import json
+import os
+
+import frappe
+from frappe.utils import cstr
+
+# Customizations shipped with the app. They live outside the standard `fixtures` folder so
+# `bench migrate` does not re-import every record on every run; sync_fixtures() below is the
+# only import path and re-applies just the records whose content differs from the database.
+FIXTURE_DOCTYPES = {
+	# doctype: field holding the customized DocType
+	"Custom Field": "dt",
+	"Property Setter": "doc_type",
+}
+FIXTURE_FOLDER = "fixture_data"
+DIGEST_KEY = "bs_space_fixture_digest"
+
+# Not part of a record's content: differ between file and database without meaning anything
+IGNORED_KEYS = {"doctype", "modified", "creation", "owner", "modified_by", "idx", "docstatus"}
+
+# Property Setters for these properties change the table definition, not just the meta
+SCHEMA_PROPERTIES = {"fieldtype", "length", "precision", "unique", "search_index", "options"}
+
+
+def get_fixture_path(doctype: str) -> str:
+	return frappe.get_app_path("bs_space", FIXTURE_FOLDER, frappe.scrub(doctype) + ".json")
+
+
+def _normalize(value) -> str:
+	if value is None:
+		return ""
+	if isinstance(value, bool):
+		return str(int(value))
+	if isinstance(value, int | float) or type(value).__name__ == "Decimal":
+		number = float(value)
+		return str(int(number)) if number.is_integer() else repr(number)
+	return cstr(value)
+
+
+def record_hash(record: dict, columns) -> str:
+	payload = "\x1f".join(f"{key}={_normalize(record.get(key))}" for key in columns)
+	return hashlib.sha1(payload.encode()).hexdigest()
+
+
+def _load(doctype):
+	path = get_fixture_path(doctype)
+	if not os.path.exists(path):
+		return None, []
+	with open(path, "rb") as f:
+		raw = f.read()
+	return hashlib.sha1(raw).hexdigest(), json.loads(raw)
+
+
+def _columns(doctype, records) -> list[str]:
+	keys = set()
+	for record in records:
+		keys.update(record)
+	table_columns = set(frappe.db.get_table_columns(doctype))
+	return sorted((keys - IGNORED_KEYS) & table_columns)
+
+
+def _changed_records(doctype, records, columns) -> tuple[list[dict], set[str]]:
+	"""Records whose content hash differs from the stored row, and the names already stored (one read)."""
+	stored = {
+		row.name: record_hash(row, columns)
+		for row in frappe.get_all(
+			doctype, filters={"name": ["in", [r["name"] for r in records]]}, fields=columns
+		)
+	}
+	return [r for r in records if stored.get(r["name"]) != record_hash(r, columns)], set(stored)
+
+
+def _upsert(doctype, records, columns, existing):
+	"""Save the changed records through their controllers (validation included)."""
+	for record in records:
+		values = {c: record.get(c) for c in columns}
+		if record["name"] in existing:
+			doc = frappe.get_doc(doctype, record["name"])
+			doc.update(values)
+			doc.save(ignore_permissions=True)
+		else:
+			frappe.get_doc({"doctype": doctype, **values}).insert(ignore_permissions=True)
+
+
+def _sync(force, meta_changed, schema_changed):
+	for doctype, target_field in FIXTURE_DOCTYPES.items():
+		digest, records = _load(doctype)
+		if not records:
+			continue
+		state_key = f"{DIGEST_KEY}:{frappe.scrub(doctype)}"
+		if not force and frappe.db.get_global(state_key) == digest:
+			continue
+
+		columns = _columns(doctype, records)
+		changed, existing = _changed_records(doctype, records, columns)
+		if changed:
+			_upsert(doctype, changed, columns, existing)
+			for record in changed:
+				meta_changed.add(record[target_field])
+				if doctype == "Custom Field" or record.get("property") in SCHEMA_PROPERTIES:
+					schema_changed.add(record[target_field])
+
+		frappe.db.set_global(state_key, digest)
+
+
+def sync_fixtures(force=False):
+	"""
+	after_migrate / after_install: bring Custom Fields and Property Setters in line
+	with the app's fixture files, saving only the records that changed. Meta caches are
+	cleared and table definitions synced once per affected DocType, not once per record.
+	"""
+	meta_changed, schema_changed = set(), set()
+	# Custom Field.on_update skips its per-record cache clear / updatedb under this flag
+	in_create_custom_fields = frappe.flags.in_create_custom_fields
+	frappe.flags.in_create_custom_fields = True
+	try:
+		_sync(force, meta_changed, schema_changed)
+	finally:
+		frappe.flags.in_create_custom_fields = in_create_custom_fields
+
+	for dt in sorted(meta_changed):
+		frappe.clear_cache(doctype=dt)
+	for dt in sorted(schema_changed):
+		# one schema sync per DocType: frappe groups its column/index changes into the ALTERs
+		frappe.db.updatedb(dt)
+
+	frappe.db.commit()
+	return sorted(meta_changed)
+
+
+def export_fixtures():
+	"""Write the site's Custom Fields and Property Setters to the app's fixture files."""
+	from frappe.core.doctype.data_import.data_import import export_json
+
+	for doctype in FIXTURE_DOCTYPES:
+		export_json(doctype, get_fixture_path(doctype), order_by="name asc")
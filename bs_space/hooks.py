@@ -1,3 +1,5 @@
+from bs_space.assets import asset_url as _asset_url
+
 app_name = "bs_space"
 app_title = "BS Space"
 app_publisher = "Best Solution®"
@@ -28,24 +30,34 @@ email_brand_image = "/assets/erpnext/images/bs-logo.png"
 # website
 webform_list_context = "erpnext.controllers.website_list_for_contact.get_webform_list_context"
 
-calendars = ["Task", "Work Order", "Sales Order", "Holiday List", "ToDo"]
+calendars = ["Task", "Work Order", "Sales Order", "Holiday List", "ToDo", "Customer", "Linked Individual"]
 
 website_generators = ["BOM", "Sales Partner"]
 
 website_context = {
 	"favicon": "/assets/bs_space/images/bs-favicon.webp",
+	# replaced by the hashed build per render (bs_space.assets.update_website_context)
 	"splash_image": "/assets/bs_space/images/bs-logo.png",
     "footer_powered": "All rights reserved. Best Solution® Business Setup Consultancy © 2025"
 }
 
 # Fixtures
-fixtures = ["Custom Field", "Property Setter"]
+# Custom Fields and Property Setters live in bs_space/fixture_data, outside the standard
+# importer, which re-saves every record on every migrate. sync_fixtures (after_migrate) is the
+# only import path and applies just the changed records; export with `bs-export-fixtures`.
+fixtures = []
+
+# Content-addressed storage for client document attachments
+write_file = "bs_space.attachments.write_file"
+delete_file_data_content = "bs_space.attachments.delete_file_data_content"
 
 # Includes in <head>
 # ------------------
 
 # include js, css files in header of desk.html
-app_include_css = "/assets/bs_space/css/bs_space.css?v=1"
+# hashed build from public/build/manifest.json, read when the hooks are loaded: the migrate that
+# rebuilds it clears the hooks cache, and the previous build stays on disk for running workers
+app_include_css = _asset_url("css/bs_space.css")
 # app_include_js = "/assets/bs_space/js/bs_space.js"
 
 # include js, css files in header of web template
@@ -63,10 +75,13 @@ app_include_css = "/assets/bs_space/css/bs_space.css?v=1"
 # page_js = {"page" : "public/js/file.js"}
 
 # include js in doctype views
-# doctype_js = {"doctype" : "public/js/doctype.js"}
+doctype_js = {
+	"Customer": "public/js/link_history.js",
+	"Linked Individual": "public/js/link_history.js",
+}
 # doctype_list_js = {"doctype" : "public/js/doctype_list.js"}
 # doctype_tree_js = {"doctype" : "public/js/doctype_tree.js"}
-# doctype_calendar_js = {"doctype" : "public/js/doctype_calendar.js"}
+doctype_calendar_js = {"Customer": "public/js/customer_calendar.js"}
 
 # Svg Icons
 # ------------------
@@ -94,16 +109,23 @@ app_include_css = "/assets/bs_space/css/bs_space.css?v=1"
 # ----------
 
 # add methods and filters to jinja environment
-# jinja = {
-# 	"methods": "bs_space.utils.jinja_methods",
-# 	"filters": "bs_space.utils.jinja_filters"
-# }
+jinja = {
+	"methods": ["bs_space.assets.asset_url", "bs_space.assets.image_srcset", "bs_space.assets.picture"],
+}
+
+update_website_context = ["bs_space.assets.update_website_context"]
 
 # Installation
 # ------------
 
 # before_install = "bs_space.install.before_install"
-# after_install = "bs_space.install.after_install"
+after_install = "bs_space.fixture_sync.sync_fixtures"
+after_migrate = [
+	"bs_space.fixture_sync.sync_fixtures",
+	# again after the fixtures, for indexes on custom fields the patch could not create yet
+	"bs_space.db_indexes.ensure_indexes",
+	"bs_space.assets.build_assets",
+]
 
 # Uninstallation
 # ------------
@@ -145,6 +167,15 @@ app_include_css = "/assets/bs_space/css/bs_space.css?v=1"
 # 	"Event": "frappe.desk.doctype.event.event.has_permission",
 # }
 
+# Link field queries
+# ------------------
+# Ranked bilingual name search for Customer / Supplier link fields
+
+standard_queries = {
+	"Customer": "bs_space.name_search.customer_query",
+	"Supplier": "bs_space.name_search.supplier_query",
+}
+
 # DocType Class
 # ---------------
 # Override standard doctype classes
@@ -159,19 +190,46 @@ app_include_css = "/assets/bs_space/css/bs_space.css?v=1"
 
 doc_events = {
     "Item": {
-        "before_validate": "bs_space.bs_space.item_hooks.set_item_code"
+        "before_validate": "bs_space.bs_space.item_hooks.set_item_code",
+        "on_update": "bs_space.fetch_sync.queue_fetch_propagation"
+    },
+
+    "Company": {
+        "on_update": "bs_space.fetch_sync.queue_fetch_propagation"
+    },
+
+    "Address": {
+        "on_update": "bs_space.fetch_sync.queue_fetch_propagation"
+    },
+
+    "Custom Field": {
+        "on_update": [
+            "bs_space.fetch_sync.clear_fetch_rules",
+            "bs_space.relationships.clear_relationship_registry"
+        ],
+        "on_trash": [
+            "bs_space.fetch_sync.clear_fetch_rules",
+            "bs_space.relationships.clear_relationship_registry"
+        ]
+    },
+
+    "DocType": {
+        "on_update": "bs_space.relationships.clear_relationship_registry",
+        "on_trash": "bs_space.relationships.clear_relationship_registry"
     },
 
     "Customer": {
         "before_insert": "bs_space.customer.before_insert",
         
         "validate": [
+            "bs_space.filing_deadlines.roll_forward_completed_filing",
             "bs_space.customer.validate",
             "bs_space.customer.validate_shareholding_total",
             "bs_space.customer.validate_parent_company",
             "bs_space.customer.validate_license_notification_setting",
             "bs_space.customer.validate_legal_authorities",
-            "bs_space.customer.validate_shareholders"
+            "bs_space.customer.validate_shareholders",
+            "bs_space.recurring_invoicing.validate_recurring_services"
         ],
         "before_save": [
             "bs_space.customer.before_save",
@@ -179,15 +237,102 @@ doc_events = {
             "bs_space.customer.update_license_status",
             "bs_space.customer.sync_client_shareholders",
             "bs_space.customer.sync_channel_partner_sub_company"
+        ],
+        "on_update": [
+            "bs_space.name_search.update_search_index",
+            "bs_space.household.invalidate_for_customer",
+            "bs_space.fetch_sync.queue_fetch_propagation",
+            "bs_space.filing_deadlines.update_customer_deadlines",
+            "bs_space.outbox.record_change"
+        ],
+        "on_trash": [
+            "bs_space.name_search.remove_from_search_index",
+            "bs_space.outbox.record_change"
+        ],
+        "after_rename": [
+            "bs_space.name_search.rename_in_search_index",
+            "bs_space.outbox.record_rename"
         ]
     },
 
+    "Sales Invoice": {
+        "validate": "bs_space.line_tax.compute_line_taxes",
+        "on_submit": "bs_space.vat_return.on_submit",
+        "on_cancel": "bs_space.vat_return.on_cancel"
+    },
+
+    "POS Invoice": {
+        "validate": "bs_space.line_tax.compute_line_taxes",
+        "on_submit": "bs_space.vat_return.on_submit",
+        "on_cancel": "bs_space.vat_return.on_cancel"
+    },
+
+    "Purchase Invoice": {
+        "validate": "bs_space.line_tax.compute_line_taxes",
+        "on_submit": "bs_space.vat_return.on_submit",
+        "on_cancel": "bs_space.vat_return.on_cancel"
+    },
+
+    "Quotation": {
+        "validate": "bs_space.line_tax.compute_line_taxes"
+    },
+
+    "Sales Order": {
+        "validate": "bs_space.line_tax.compute_line_taxes"
+    },
+
+    "Delivery Note": {
+        "validate": "bs_space.line_tax.compute_line_taxes"
+    },
+
+    "Supplier Quotation": {
+        "validate": "bs_space.line_tax.compute_line_taxes"
+    },
+
+    "Purchase Order": {
+        "validate": "bs_space.line_tax.compute_line_taxes"
+    },
+
+    "Purchase Receipt": {
+        "validate": "bs_space.line_tax.compute_line_taxes"
+    },
+
+    "Supplier": {
+        "on_update": [
+            "bs_space.name_search.update_search_index",
+            "bs_space.fetch_sync.queue_fetch_propagation"
+        ],
+        "on_trash": "bs_space.name_search.remove_from_search_index",
+        "after_rename": "bs_space.name_search.rename_in_search_index"
+    },
+
     "Linked Individual": {
-        "validate":   "bs_space.bs_customers.doctype.linked_individual.linked_individual.validate_linked_individual",
+        "validate":   [
+            "bs_space.bs_customers.doctype.linked_individual.linked_individual.validate_linked_individual",
+            "bs_space.identity.set_identity_keys",
+        ],
         # Fire aggregator on both signals; it will guard against double-run
-        "on_update":  "bs_space.bs_customers.doctype.linked_individual.linked_individual.after_save_linked_individual",
+        "on_update":  [
+            "bs_space.bs_customers.doctype.linked_individual.linked_individual.after_save_linked_individual",
+            "bs_space.outbox.record_change",
+        ],
         "after_save": "bs_space.bs_customers.doctype.linked_individual.linked_individual.after_save_linked_individual",
-        "on_trash":   "bs_space.bs_customers.doctype.linked_individual.linked_individual.cleanup_dependent_rows_on_trash",
+        "on_trash":   [
+            "bs_space.bs_customers.doctype.linked_individual.linked_individual.cleanup_on_trash",
+            "bs_space.outbox.record_change",
+        ],
+        "after_rename": "bs_space.outbox.record_rename",
+    },
+
+    "Currency Exchange": {
+        "on_update": "bs_space.exchange_rates.clear_exchange_rate_cache",
+        "on_trash":  "bs_space.exchange_rates.clear_exchange_rate_cache",
+    },
+
+    "File": {
+        "before_validate": "bs_space.attachments.on_file_privacy_change",
+        "after_insert": "bs_space.attachments.on_file_insert",
+        "on_trash":     "bs_space.attachments.on_file_trash",
     }
 }
 
@@ -207,13 +352,27 @@ scheduler_events = {
 	# 	"bs_space.tasks.all"
 	# ],
 
+    # lag probe for read replica routing (no-op unless bs_read_from_replica is set)
+    "cron": {
+        "* * * * *": [
+            "bs_space.replica.write_heartbeat",
+            "bs_space.outbox.process_outbox"
+        ]
+    },
+    # runs are recorded in BS Job Run (see bs_space.job_runs.tracked_job)
     "daily": [
-        {"doctype": "Customer", "event": "daily", "method": "update_all_license_statuses"},
-        {"doctype": "Linked Individual", "event": "daily", "method": "send_expiry_notifications"}
+        "bs_space.filing_deadlines.rebuild_filing_deadlines",
+        "bs_space.renewals.generate_due_renewals",
+        "bs_space.tasks.update_all_license_statuses",
+        "bs_space.bs_customers.doctype.linked_individual.linked_individual.recompute_visa_statuses",
+        "bs_space.bs_customers.doctype.linked_individual.linked_individual.send_expiry_notifications"
     ],
     "weekly": [
-        {"doctype": "Customer", "event": "weekly", "method": "update_all_tax_statuses"},
-        {"doctype": "Customer", "event": "weekly", "method": "update_all_vat_statuses"}
+        "bs_space.customer.update_all_tax_statuses",
+        "bs_space.customer.update_all_vat_statuses"
+    ],
+    "monthly": [
+        "bs_space.recurring_invoicing.run_recurring_invoicing"
     ],
 	# "hourly": [
 	# 	"bs_space.tasks.hourly"
@@ -256,8 +415,10 @@ scheduler_events = {
 
 # Request Events
 # ----------------
-# before_request = ["bs_space.utils.before_request"]
-# after_request = ["bs_space.utils.after_request"]
+# opt-in profiling of bs_space APIs and Customer / Linked Individual saves (see bs_space.profiler)
+# an auth hook, not before_request: API key / OAuth users are only known after authentication
+auth_hooks = ["bs_space.profiler.start_request_profile"]
+after_request = ["bs_space.profiler.after_request"]
 
 # Job Events
 # ----------
@@ -298,7 +459,15 @@ scheduler_events = {
 # Automatically update python controller files with type annotations for this app.
 # export_python_type_annotations = True
 
-# default_log_clearing_doctypes = {
-# 	"Logging DocType Name": 30  # days to retain logs
-# }
+default_log_clearing_doctypes = {
+	"BS Job Run": 365,
+	"BS Request Profile": 7,
+	"BS Change Event": 30,
+}
+
+# Change stream consumers: each gets batches of BS Change Events recorded for Customer and
+# Linked Individual saves (see bs_space.outbox)
+bs_space_change_consumers = {
+	"expiry_calendar": "bs_space.expiry_calendar.consume_changes",
+}
 
@@ -0,0 +1,191 @@
+import frappe
+from frappe import _
+from frappe.utils import add_days, getdate, today
+
+from bs_space.relationships import get_relationship
+
+HOUSEHOLD_CACHE_PREFIX = "bs_space:household"
+HOUSEHOLD_CACHE_TTL = 6 * 60 * 60
+EXPIRY_WARNING_DAYS = 30
+# Dependents are one level deep by rule; walk a little further to report broken data
+MAX_DEPENDENT_DEPTH = 4
+
+DOCUMENT_EXPIRY_FIELDS = {
+	"Visa": "visa_expiry_date",
+	"Passport": "passport_expiry_date",
+	"Emirates ID": "emirates_id_expiry_date",
+	"Labour Contract": "labour_contract_expiry",
+	"Health Insurance": "health_insurance_expiry",
+	"ILOE": "iloe_expiry",
+}
+
+INDIVIDUAL_COLUMNS = ", ".join(
+	f"li.`{f}`"
+	for f in (
+		"name",
+		"full_name",
+		"enabled",
+		"status",
+		"has_visa",
+		"visa_type",
+		"nationality",
+		"passport_number",
+		"emirates_id_number",
+		*DOCUMENT_EXPIRY_FIELDS.values(),
+	)
+)
+
+
+def _cache_key(doctype, name):
+	# statuses are relative to today, so cached results never outlive the day
+	return f"{HOUSEHOLD_CACHE_PREFIX}:{today()}:{doctype}:{name}"
+
+
+def invalidate_household(doctype, name):
+	if name:
+		frappe.cache.delete_value(_cache_key(doctype, name))
+
+
+def invalidate_for_individual(doc):
+	"""Drop every cached household the saved/deleted Linked Individual appears in."""
+	before = doc.get_doc_before_save() if hasattr(doc, "get_doc_before_save") else None
+	individuals = {doc.name}
+	customers = set()
+	for d in filter(None, (doc, before)):
+		if not d.get("visa_parent"):
+			continue
+		if (d.get("parent_type") or "").strip() == "Customer":
+			customers.add(d.visa_parent)
+		else:
+			individuals.add(d.visa_parent)
+
+	# customers whose household includes these individuals as visa holders
+	customers.update(
+		frappe.get_all(
+			"Linked Individual",
+			filters={"name": ["in", list(individuals)], "parent_type": "Customer"},
+			pluck="visa_parent",
+		)
+	)
+
+	for name in individuals:
+		invalidate_household("Linked Individual", name)
+	for name in customers:
+		invalidate_household("Customer", name)
+
+
+def invalidate_for_customer(doc, method=None):
+	invalidate_household("Customer", doc.name)
+
+
+def _document_statuses(row, today_date, warn_date):
+	documents = []
+	for label, fieldname in DOCUMENT_EXPIRY_FIELDS.items():
+		expiry = row.pop(fieldname, None)
+		if not expiry:
+			status = "Missing"
+		elif getdate(expiry) < today_date:
+			status = "Expired"
+		elif getdate(expiry) <= warn_date:
+			status = "Expiring Soon"
+		else:
+			status = "Valid"
+		documents.append({"document": label, "expiry_date": expiry, "status": status})
+	row.documents = documents
+	return row
+
+
+def _visa_holders_of_customer(customer):
+	rel = get_relationship("visa_holders")
+	return frappe.db.sql(
+		f"""
+		select {INDIVIDUAL_COLUMNS}
+		from `tab{rel.child_doctype}` vh
+		join `tabLinked Individual` li on li.name = vh.`{rel.link_field}`
+		where vh.parenttype = %s and vh.parentfield = %s and vh.parent = %s
+		order by vh.idx
+		""",
+		(rel.parent_doctype, rel.table_field, customer),
+		as_dict=True,
+	)
+
+
+def _dependents_of(sponsors):
+	rel = get_relationship("dependents")
+	return frappe.db.sql(
+		f"""
+		select d.parent as sponsor, d.relation, {INDIVIDUAL_COLUMNS}
+		from `tab{rel.child_doctype}` d
+		join `tabLinked Individual` li on li.name = d.`{rel.link_field}`
+		where d.parenttype = %s and d.parentfield = %s and d.parent in %s
+		order by d.parent, d.idx
+		""",
+		(rel.parent_doctype, rel.table_field, tuple(sponsors)),
+		as_dict=True,
+	)
+
+
+def build_household(doctype, name):
+	"""Visa holders with their dependents and document statuses: one query per household level."""
+	if doctype == "Customer":
+		holders = _visa_holders_of_customer(name)
+	else:
+		holders = frappe.db.sql(
+			f"select {INDIVIDUAL_COLUMNS} from `tabLinked Individual` li where li.name = %s",
+			name,
+			as_dict=True,
+		)
+
+	today_date = getdate(today())
+	warn_date = getdate(add_days(today_date, EXPIRY_WARNING_DAYS))
+	issues = []
+
+	by_name = {}
+	for row in holders:
+		row.dependents = []
+		by_name[row.name] = _document_statuses(row, today_date, warn_date)
+
+	seen = set(by_name)
+	level, depth = list(by_name), 0
+	while level and depth < MAX_DEPENDENT_DEPTH:
+		depth += 1
+		next_level = []
+		for row in _dependents_of(level):
+			sponsor = by_name[row.sponsor]
+			if row.name in seen:
+				issues.append(
+					_(
+						"{0} appears more than once in this household (circular or duplicate dependent)."
+					).format(row.name)
+				)
+				continue
+			if depth > 1:
+				issues.append(
+					_("{0} is a dependent of {1}, who is a dependent too.").format(row.name, row.sponsor)
+				)
+			seen.add(row.name)
+			row.dependents = []
+			by_name[row.name] = _document_statuses(row, today_date, warn_date)
+			sponsor.dependents.append(row)
+			next_level.append(row.name)
+		level = next_level
+
+	return {"doctype": doctype, "name": name, "visa_holders": holders, "issues": issues}
+
+
+@frappe.whitelist()
+def get_household(doctype, name):
+	"""
+	Immigration picture of a Customer or sponsoring Linked Individual in one call (cached).
+	Built on the primary: a lagging replica would put a pre-save household back in the cache.
+	"""
+	if doctype not in ("Customer", "Linked Individual"):
+		frappe.throw(_("Household is available for Customer or Linked Individual only."))
+	frappe.has_permission(doctype, "read", name, throw=True)
+
+	key = _cache_key(doctype, name)
+	household = frappe.cache.get_value(key)
+	if household is None:
+		household = build_household(doctype, name)
+		frappe.cache.set_value(key, household, expires_in_sec=HOUSEHOLD_CACHE_TTL)
+	return household
@@ -0,0 +1,116 @@
+import re
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from bs_space.replica import read_from_replica
+
+IDENTITY_FIELDS = {
+	# key field: source field
+	"passport_key": "passport_number",
+	"emirates_id_key": "emirates_id_number",
+}
+
+LOOKUP_FIELDS = [
+	"name",
+	"full_name",
+	"nationality",
+	"passport_number",
+	"emirates_id_number",
+	"status",
+	"visa_type",
+	"parent_type",
+	"visa_parent",
+	"visa_expiry_date",
+	"passport_expiry_date",
+	"emirates_id_expiry_date",
+]
+
+_NON_ALNUM = re.compile(r"[^0-9A-Z]")
+_EASTERN_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+
+
+def normalize_identity(value: str | None) -> str:
+	"""'784-1990-1234567-1' and '784199012345671' (or 'ab 123 456' / 'AB123456') give one key."""
+	return _NON_ALNUM.sub("", (value or "").translate(_EASTERN_DIGITS).upper())
+
+
+def set_identity_keys(doc, method=None):
+	"""Linked Individual validate: keep the indexed lookup keys in step with the document numbers."""
+	for key_field, source_field in IDENTITY_FIELDS.items():
+		doc.set(key_field, normalize_identity(doc.get(source_field)) or None)
+	warn_duplicate_identity(doc)
+
+
+def warn_duplicate_identity(doc):
+	for key_field, source_field in IDENTITY_FIELDS.items():
+		key = doc.get(key_field)
+		if not key or not doc.has_value_changed(key_field):
+			continue
+		other = frappe.db.get_value("Linked Individual", {key_field: key, "name": ["!=", doc.name]}, "name")
+		if other:
+			frappe.msgprint(
+				_("{0} {1} is already recorded on {2}.").format(
+					frappe.get_meta("Linked Individual").get_label(source_field), doc.get(source_field), other
+				),
+				alert=True,
+				indicator="orange",
+			)
+
+
+@frappe.whitelist()
+def lookup_identity(value, prefix=0, limit=20):
+	"""
+	Resolve a scanned/typed passport or Emirates ID number to Linked Individuals.
+	Exact match by default; prefix=1 matches keys starting with the value.
+	"""
+	key = normalize_identity(value)
+	if not key:
+		return []
+
+	condition = ["like", f"{key}%"] if cint(prefix) else key
+	limit = cint(limit) or 20
+	# one indexed query per key column, rather than an OR the optimizer may turn into a scan
+	results = {}
+	for key_field in IDENTITY_FIELDS:
+		for row in frappe.get_list(
+			"Linked Individual",
+			filters={key_field: condition},
+			fields=LOOKUP_FIELDS,
+			order_by=f"{key_field} asc",
+			limit_page_length=limit,
+		):
+			row.matched_on = IDENTITY_FIELDS[key_field]
+			results.setdefault(row.name, row)
+	return list(results.values())[:limit]
+
+
+@frappe.whitelist()
+@read_from_replica()
+def find_duplicate_identities():
+	"""Every passport / Emirates ID key held by more than one Linked Individual, in one grouped query."""
+	frappe.has_permission("Linked Individual", "read", throw=True)
+
+	duplicates = frappe.db.sql(
+		"""
+		select 'passport_number' as identity_field, passport_key as identity_key,
+			count(*) as occurrences, group_concat(name order by creation separator ',') as individuals
+		from `tabLinked Individual`
+		where ifnull(passport_key, '') != ''
+		group by passport_key
+		having count(*) > 1
+		union all
+		select 'emirates_id_number', emirates_id_key,
+			count(*), group_concat(name order by creation separator ',')
+		from `tabLinked Individual`
+		where ifnull(emirates_id_key, '') != ''
+		group by emirates_id_key
+		having count(*) > 1
+		order by occurrences desc
+		""",
+		as_dict=True,
+	)
+	for row in duplicates:
+		row.individuals = row.individuals.split(",")
+	return duplicates
@@ -0,0 +1,141 @@
+import frappe
+
+# Representative shapes of the queries run by the app's hooks, jobs and APIs. Add the
+# shape of every new hot query here so `bench bs-index-advisor` keeps covering it.
+QUERY_PATTERNS = (
+	(
+		"Customers holding a visa holder",
+		"select parent from `tabVisa Holders of Client` where parenttype = 'Customer' and visa_holder = %s",
+		("LI-0001",),
+	),
+	(
+		"Sponsors of a dependent",
+		"select parent from `tabDependents of Individual` where parenttype = 'Linked Individual' and dependent = %s",
+		("LI-0001",),
+	),
+	(
+		"Individuals owning a company",
+		"select parent from `tabCompanies of Individual` where parenttype = 'Linked Individual' and company = %s",
+		("CUST-0001",),
+	),
+	(
+		"Parents of a sub company",
+		"select parent from `tabSub Companies of Client` where parenttype = 'Customer' and sub_company = %s",
+		("CUST-0001",),
+	),
+	(
+		"Companies held by a shareholder",
+		"select parent from `tabShareholders of Client` where parenttype = 'Customer' and shareholder = %s",
+		("LI-0001",),
+	),
+	(
+		"Sub companies of a parent company",
+		"select name from `tabCustomer` where custom_parent_company = %s",
+		("CUST-0001",),
+	),
+	(
+		"Licenses expiring",
+		"select name from `tabCustomer` where custom_license_expiry_date between %s and %s",
+		("2025-01-01", "2025-01-31"),
+	),
+	(
+		"VAT filings due",
+		"select name from `tabCustomer` where custom_vat_next_filing_due_date between %s and %s",
+		("2025-01-01", "2025-01-07"),
+	),
+	(
+		"Corporate tax filings due",
+		"select name from `tabCustomer` where custom_corporate_tax_next_filing_due_date between %s and %s",
+		("2025-01-01", "2025-12-31"),
+	),
+	(
+		"Dependents of a sponsor",
+		"select name from `tabLinked Individual` where visa_parent = %s and parent_type = 'Linked Individual'",
+		("LI-0001",),
+	),
+	(
+		"Visas expiring",
+		"select name from `tabLinked Individual` where visa_expiry_date between %s and %s",
+		("2025-01-01", "2025-01-31"),
+	),
+	(
+		"Passports expiring",
+		"select name from `tabLinked Individual` where passport_expiry_date between %s and %s",
+		("2025-01-01", "2025-01-31"),
+	),
+	(
+		"Emirates IDs expiring",
+		"select name from `tabLinked Individual` where emirates_id_expiry_date between %s and %s",
+		("2025-01-01", "2025-01-31"),
+	),
+	(
+		"Identity lookup",
+		"select name from `tabLinked Individual` where passport_key = %s",
+		("P1234567",),
+	),
+	(
+		"Name search",
+		"select ref_name, count(*), sum(weight) from `tabName Search Token`"
+		" where ref_doctype = 'Customer' and gram in %s group by ref_name",
+		(("^ab", "abc", "bc$"),),
+	),
+	(
+		"Renewals of an entity",
+		"select name from `tabProject` where custom_renewal_of = 'Customer' and custom_renewal_for = %s",
+		("CUST-0001",),
+	),
+	(
+		"Link history of a document",
+		"select name from `tabBS Link Change` where linked_name = %s and linked_doctype = 'Customer'",
+		("CUST-0001",),
+	),
+	(
+		"Open filing deadlines",
+		"select customer from `tabFiling Deadline` where status = 'Open' and due_date <= %s",
+		("2025-01-31",),
+	),
+	(
+		"VAT return totals",
+		"select box, sum(amount) from `tabVAT Return Total` where company = %s and period_start between %s and %s group by box",
+		("Company", "2025-01-01", "2025-03-01"),
+	),
+)
+
+
+def explain_patterns(patterns=QUERY_PATTERNS):
+	"""
+	EXPLAIN every query pattern and classify each table access:
+	- "missing index": full scan and no usable index at all (a regression to fix)
+	- "full scan": an index exists but the optimizer preferred scanning (usually a small table)
+	- "ok"
+	"""
+	results = []
+	for label, query, values in patterns:
+		try:
+			plan = frappe.db.sql(f"explain {query}", values, as_dict=True)
+		except Exception as e:
+			# e.g. a custom field column that is not on this site
+			results.append(frappe._dict(label=label, table=None, verdict="error", detail=str(e)))
+			continue
+
+		for step in plan:
+			if step.type in ("ALL", "index"):
+				verdict = "full scan" if step.possible_keys else "missing index"
+			else:
+				verdict = "ok"
+			results.append(
+				frappe._dict(
+					label=label,
+					table=step.table,
+					verdict=verdict,
+					access=step.type,
+					key=step.key,
+					rows=step.rows,
+					detail=step.Extra,
+				)
+			)
+	return results
+
+
+def get_regressions(results=None):
+	return [r for r in (results or explain_patterns()) if r.verdict in ("missing index", "error")]
@@ -0,0 +1,208 @@
+import functools
+import time
+import traceback
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import add_days, now_datetime
+
+RUN_DOCTYPE = "BS Job Run"
+LOCK_PREFIX = "bs_space:job_lock"
+# a lock outlives a crashed worker by at most this long
+DEFAULT_LOCK_TIMEOUT = 4 * 60 * 60
+COUNTERS = ("rows_scanned", "rows_updated", "emails_queued", "errors")
+# compare-and-delete in one step, so a lock that expired and was taken over is never released
+_RELEASE_LOCK_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+	return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+# site -> this worker's run log connection, reused across jobs
+_run_log_dbs = {}
+
+
+def _lock_key(job):
+	return frappe.cache.make_key(f"{LOCK_PREFIX}:{job}")
+
+
+def _acquire_lock(job, token, timeout):
+	return bool(frappe.cache.set(_lock_key(job), token, nx=True, ex=timeout))
+
+
+def _release_lock(job, token):
+	frappe.cache.eval(_RELEASE_LOCK_SCRIPT, 1, _lock_key(job), token)
+
+
+def track(scanned=0, updated=0, emails=0, errors=0):
+	"""Add to the counters of the tracked job running in this process (no-op outside one)."""
+	counters = getattr(frappe.local, "bs_job_counters", None)
+	if counters is None:
+		return
+	counters["rows_scanned"] += scanned
+	counters["rows_updated"] += updated
+	counters["emails_queued"] += emails
+	counters["errors"] += errors
+
+
+# ---- run log ----
+
+
+def _connect():
+	"""This worker's second connection to the site database, used only for the run log."""
+	from frappe.database import get_db
+
+	db = _run_log_dbs.get(frappe.local.site)
+	if db is not None:
+		try:
+			db.sql("select 1")
+			return db
+		except Exception:
+			# dropped by the server (e.g. wait_timeout between two jobs): open a new one
+			_run_log_dbs.pop(frappe.local.site, None)
+
+	conf = frappe.conf
+	db = get_db(
+		socket=conf.db_socket,
+		host=conf.db_host,
+		user=conf.db_user or conf.db_name,
+		password=conf.db_password,
+		port=conf.db_port,
+		cur_db_name=conf.db_name,
+	)
+	db.connect()
+	_run_log_dbs[frappe.local.site] = db
+	return db
+
+
+@contextmanager
+def _run_log(db):
+	"""
+	Route frappe.db to the run log connection for the block and commit it there, so recording
+	a run never commits or rolls back the job's own transaction (that is left to the caller).
+	"""
+	job_db = frappe.local.db
+	frappe.local.db = db
+	try:
+		yield
+		db.commit()
+	except Exception:
+		# the connection is reused by the next job: leave no transaction open on it
+		db.rollback()
+		raise
+	finally:
+		frappe.local.db = job_db
+
+
+def _insert_run(db, job, status, **fields):
+	with _run_log(db):
+		run = frappe.get_doc(
+			{"doctype": RUN_DOCTYPE, "job": job, "status": status, "started_at": now_datetime(), **fields}
+		).insert(ignore_permissions=True)
+	return run.name
+
+
+def _finish_run(db, name, status, started, counters, error_log=None):
+	with _run_log(db):
+		frappe.db.set_value(
+			RUN_DOCTYPE,
+			name,
+			{
+				"status": status,
+				"ended_at": now_datetime(),
+				"duration": time.monotonic() - started,
+				"error_log": error_log,
+				**counters,
+			},
+			update_modified=False,
+		)
+
+
+def tracked_job(job=None, lock_timeout=DEFAULT_LOCK_TIMEOUT, exclusive=True):
+	"""
+	Decorator for scheduled / bulk jobs: records a BS Job Run with timings and the
+	counters reported through track(), and skips the run if the previous one still holds the lock.
+	Jobs that run in parallel chunks pass exclusive=False to be recorded without the lock.
+	The run is written on a separate connection kept per worker; the job's transaction is
+	committed or rolled back by its caller (the scheduler / worker) as usual.
+	"""
+
+	def decorator(fn):
+		job_name = job or f"{fn.__module__}.{fn.__qualname__}"
+
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			token = frappe.generate_hash(length=12) if exclusive else None
+			db = _connect()
+			if exclusive and not _acquire_lock(job_name, token, lock_timeout):
+				_insert_run(
+					db,
+					job_name,
+					"Skipped",
+					ended_at=now_datetime(),
+					error_log="Previous run still in progress",
+				)
+				return
+
+			name = _insert_run(db, job_name, "Running")
+			started = time.monotonic()
+			counters = dict.fromkeys(COUNTERS, 0)
+			frappe.local.bs_job_counters = counters
+			try:
+				result = fn(*args, **kwargs)
+			except Exception:
+				counters["errors"] += 1
+				_finish_run(db, name, "Failed", started, counters, traceback.format_exc())
+				raise
+			else:
+				_finish_run(db, name, "Success", started, counters)
+				return result
+			finally:
+				frappe.local.bs_job_counters = None
+				if exclusive:
+					_release_lock(job_name, token)
+
+		return wrapper
+
+	return decorator
+
+
+def get_job_trends(from_date=None, to_date=None, job=None, period="week"):
+	"""Runs grouped per job and day / week / month: counts, durations and row totals."""
+	bucket = {
+		"day": "date(started_at)",
+		"week": "date_sub(date(started_at), interval weekday(started_at) day)",
+		"month": "date_format(started_at, '%%Y-%%m-01')",
+	}[period]
+	conditions, values = (
+		["started_at >= %(from_date)s"],
+		{"from_date": from_date or add_days(now_datetime(), -90)},
+	)
+	if to_date:
+		conditions.append("started_at < %(to_date)s")
+		values["to_date"] = add_days(to_date, 1)
+	if job:
+		conditions.append("job = %(job)s")
+		values["job"] = job
+
+	return frappe.db.sql(
+		f"""
+		select job, {bucket} as period,
+			count(*) as runs,
+			sum(status = 'Failed') as failed,
+			sum(status = 'Skipped') as skipped,
+			avg(case when status = 'Success' then duration end) as avg_duration,
+			max(duration) as max_duration,
+			avg(rows_scanned) as avg_rows_scanned,
+			sum(rows_updated) as rows_updated,
+			sum(emails_queued) as emails_queued,
+			sum(errors) as errors
+		from `tab{RUN_DOCTYPE}`
+		where {" and ".join(conditions)}
+		group by job, period
+		order by job, period
+		""",
+		values,
+		as_dict=True,
+	)
@@ -0,0 +1,203 @@
+import json
+
+import frappe
+from frappe import _
+from frappe.model.meta import get_field_precision
+from frappe.utils import cint, flt
+
+from bs_space.streaming import iter_keyset
+
+STANDARD_VAT_RATE = 5.0
+
+# Rates of known Item tax codes, used only when the document has no tax rows yet;
+# items without a code or with an unknown one get the standard rate
+TAX_CODE_RATES = {
+	"SR": STANDARD_VAT_RATE,
+	"RC": STANDARD_VAT_RATE,
+	"ZR": 0.0,
+	"EX": 0.0,
+	"OS": 0.0,
+}
+
+# Transaction doctype -> date field used to pick historical documents
+TAX_DOCTYPES = {
+	"Quotation": "transaction_date",
+	"Sales Order": "transaction_date",
+	"Delivery Note": "posting_date",
+	"Sales Invoice": "posting_date",
+	"POS Invoice": "posting_date",
+	"Supplier Quotation": "transaction_date",
+	"Purchase Order": "transaction_date",
+	"Purchase Receipt": "posting_date",
+	"Purchase Invoice": "posting_date",
+}
+
+ITEM_TAX_FIELDS = ("tax_code", "is_zero_rated", "is_exempt")
+
+
+def get_item_tax_flags(item_codes) -> dict:
+	"""{item_code: {tax_code, is_zero_rated, is_exempt}} for all codes in one query."""
+	item_codes = list({code for code in item_codes if code})
+	if not item_codes:
+		return {}
+	return {
+		row.name: row
+		for row in frappe.get_all(
+			"Item", filters={"name": ["in", item_codes]}, fields=["name", *ITEM_TAX_FIELDS]
+		)
+	}
+
+
+def _item_tax_rates(item_tax_rate) -> dict:
+	"""{tax account: rate} of a line's Item Tax Template, as ERPNext stores it on the row."""
+	if not item_tax_rate:
+		return {}
+	return json.loads(item_tax_rate) if isinstance(item_tax_rate, str) else item_tax_rate
+
+
+def get_tax_rate(flags, item_tax_rate=None, taxes=None) -> float:
+	"""
+	VAT rate of one line: 0 for exempt / zero-rated items, else the sum of the document's
+	On Net Total tax rows with the line's Item Tax Template rates taking precedence. Documents
+	without tax rows fall back to the Item's tax code, and to the standard rate if it is unknown.
+	"""
+	if flags and (cint(flags.is_exempt) or cint(flags.is_zero_rated)):
+		return 0.0
+	if taxes:
+		overrides = _item_tax_rates(item_tax_rate)
+		return sum(
+			flt(overrides.get(tax.account_head, tax.rate))
+			for tax in taxes
+			if tax.charge_type == "On Net Total"
+		)
+
+	code = ((flags.tax_code if flags else None) or "").strip().upper()
+	if not code:
+		return STANDARD_VAT_RATE
+	if code not in TAX_CODE_RATES:
+		# tax_code is free text: an unknown code must not block saving the document
+		_warn_unknown_tax_code(code)
+		return STANDARD_VAT_RATE
+	return TAX_CODE_RATES[code]
+
+
+def _warn_unknown_tax_code(code):
+	"""Tell the user once per request that an unknown Item tax code was charged the standard rate."""
+	warned = frappe.flags.bs_unknown_tax_codes = frappe.flags.bs_unknown_tax_codes or set()
+	if code in warned:
+		return
+	warned.add(code)
+	frappe.msgprint(
+		_("Unknown tax code {0} charged at the standard rate of {1}%: use one of {2}").format(
+			code, STANDARD_VAT_RATE, ", ".join(TAX_CODE_RATES)
+		),
+		indicator="orange",
+		alert=True,
+	)
+
+
+def compute_line(net_amount, rate, precision) -> tuple[float, float]:
+	"""(tax_amount, total_amount) of one line; the single rounding rule for every path."""
+	tax_amount = flt(flt(net_amount) * rate / 100, precision)
+	return tax_amount, flt(flt(net_amount) + tax_amount, precision)
+
+
+def _copied_flag_fields(child_doctype) -> tuple:
+	meta = frappe.get_meta(child_doctype)
+	return tuple(f for f in ITEM_TAX_FIELDS if meta.has_field(f))
+
+
+def compute_line_taxes(doc, method=None):
+	"""validate: fill tax_rate / tax_amount / total_amount on every line in one pass."""
+	rows = doc.get("items") or []
+	if not rows:
+		return
+
+	# documents built in bulk carry the flags they were resolved with
+	flags_by_item = doc.flags.bs_item_tax_flags or get_item_tax_flags(row.item_code for row in rows)
+	flag_fields = _copied_flag_fields(rows[0].doctype)
+	precision = rows[0].precision("tax_amount")
+
+	for row in rows:
+		flags = flags_by_item.get(row.item_code)
+		for fieldname in flag_fields:
+			row.set(fieldname, flags.get(fieldname) if flags else None)
+		row.tax_rate = get_tax_rate(flags, row.get("item_tax_rate"), doc.get("taxes"))
+		row.tax_amount, row.total_amount = compute_line(
+			row.net_amount if row.net_amount is not None else row.amount, row.tax_rate, precision
+		)
+
+
+def recompute_line_taxes(doctype, from_date=None, to_date=None, batch_size=1000):
+	"""
+	Recompute the line tax fields of draft documents in keyset-paginated batches. Submitted and
+	cancelled documents keep the values they were posted with (and counted in the VAT totals).
+	"""
+	child_doctype = f"{doctype} Item"
+	taxes_doctype = frappe.get_meta(doctype).get_field("taxes").options
+	date_field = TAX_DOCTYPES[doctype]
+	precision = get_field_precision(frappe.get_meta(child_doctype).get_field("tax_amount"))
+	flag_fields = _copied_flag_fields(child_doctype)
+
+	conditions, values = ["item.parenttype = %(doctype)s", "inv.docstatus = 0"], {"doctype": doctype}
+	if from_date:
+		conditions.append(f"inv.`{date_field}` >= %(from_date)s")
+		values["from_date"] = from_date
+	if to_date:
+		conditions.append(f"inv.`{date_field}` <= %(to_date)s")
+		values["to_date"] = to_date
+
+	def fetch(after, limit):
+		return frappe.db.sql(
+			f"""
+			select item.name, item.parent, item.item_code, item.item_tax_rate,
+				ifnull(item.net_amount, item.amount) as net_amount
+			from `tab{child_doctype}` item
+			join `tab{doctype}` inv on inv.name = item.parent
+			where {" and ".join(conditions)} and item.name > %(after)s
+			order by item.name
+			limit %(limit)s
+			""",
+			{**values, "after": after, "limit": limit},
+			as_dict=True,
+		)
+
+	updated = 0
+	for rows in iter_keyset(fetch, batch_size, commit=True):
+		flags_by_item = get_item_tax_flags(row.item_code for row in rows)
+		taxes_by_parent = {}
+		for tax in frappe.get_all(
+			taxes_doctype,
+			filters={"parenttype": doctype, "parent": ["in", list({row.parent for row in rows})]},
+			fields=["parent", "charge_type", "account_head", "rate"],
+		):
+			taxes_by_parent.setdefault(tax.parent, []).append(tax)
+
+		updates = {}
+		for row in rows:
+			flags = flags_by_item.get(row.item_code)
+			rate = get_tax_rate(flags, row.item_tax_rate, taxes_by_parent.get(row.parent))
+			tax_amount, total_amount = compute_line(row.net_amount, rate, precision)
+			updates[row.name] = {"tax_rate": rate, "tax_amount": tax_amount, "total_amount": total_amount}
+			for fieldname in flag_fields:
+				updates[row.name][fieldname] = flags.get(fieldname) if flags else None
+
+		frappe.db.bulk_update(child_doctype, updates, update_modified=False)
+		updated += len(rows)
+
+	return updated
+
+
+@frappe.whitelist()
+def enqueue_recompute_line_taxes(doctype, from_date=None, to_date=None):
+	frappe.only_for(("Accounts Manager", "System Manager"))
+	if doctype not in TAX_DOCTYPES:
+		frappe.throw(_("Line tax recompute is not available for {0}").format(doctype))
+	frappe.enqueue(
+		"bs_space.line_tax.recompute_line_taxes",
+		queue="long",
+		timeout=4 * 3600,
+		doctype=doctype,
+		from_date=from_date,
+		to_date=to_date,
+	)
@@ -0,0 +1,99 @@
+import frappe
+from frappe.utils import cint, now
+
+from bs_space.relationships import get_relationship
+
+LOG_DOCTYPE = "BS Link Change"
+LOG_FIELDS = (
+	"name",
+	"entity_doctype",
+	"entity",
+	"relation",
+	"action",
+	"linked_doctype",
+	"linked_name",
+	"origin_doctype",
+	"origin_name",
+	"user",
+	"timestamp",
+)
+
+
+def is_compact():
+	"""Compact audit mode (default on); `bs_compact_link_audit: 0` in site_config restores full Versions."""
+	return cint(frappe.conf.get("bs_compact_link_audit", 1))
+
+
+def log_link_change(doc, relation, action, link_value, origin=None):
+	"""Queue one change log row; all rows of the transaction are written just before it commits."""
+	pending = getattr(frappe.local, "bs_link_changes", None)
+	if pending is None:
+		pending = frappe.local.bs_link_changes = []
+		frappe.db.before_commit.add(flush_link_changes)
+		frappe.db.after_rollback.add(discard_link_changes)
+
+	linked_doctype = get_relationship(relation).link_doctype
+	if not linked_doctype and origin and origin.name == link_value:
+		# dynamic links (shareholders) point at the originating document
+		linked_doctype = origin.doctype
+	pending.append(
+		(
+			frappe.generate_hash(length=12),
+			doc.doctype,
+			doc.name,
+			relation,
+			action,
+			linked_doctype,
+			link_value,
+			origin.doctype if origin else None,
+			origin.name if origin else None,
+			frappe.session.user,
+			now(),
+		)
+	)
+
+
+def save_derived(doc, relation, action, link_value, origin=None):
+	"""
+	Save a document whose link table was changed on behalf of `origin`. In compact mode this
+	skips the Version document and records one change log row instead.
+	"""
+	if not is_compact():
+		doc.save(ignore_permissions=True)
+		return
+	doc.flags.ignore_version = True
+	doc.save(ignore_permissions=True)
+	log_link_change(doc, relation, action, link_value, origin)
+
+
+def flush_link_changes():
+	pending = getattr(frappe.local, "bs_link_changes", None)
+	frappe.local.bs_link_changes = None
+	if pending:
+		fields = [*LOG_FIELDS, "creation", "modified", "owner", "modified_by", "docstatus"]
+		rows = [(*row, row[-1], row[-1], row[-2], row[-2], 0) for row in pending]
+		frappe.db.bulk_insert(LOG_DOCTYPE, fields, rows)
+
+
+def discard_link_changes():
+	frappe.local.bs_link_changes = None
+
+
+@frappe.whitelist()
+def get_link_history(doctype, name, limit=50):
+	"""Link changes made to `name` or pointing at it, i.e. both sides of every link."""
+	frappe.has_permission(doctype, "read", name, throw=True)
+	return frappe.db.sql(
+		f"""
+		select {", ".join(LOG_FIELDS)}
+		from (
+			select * from `tab{LOG_DOCTYPE}` where entity = %(name)s and entity_doctype = %(doctype)s
+			union
+			select * from `tab{LOG_DOCTYPE}` where linked_name = %(name)s and linked_doctype = %(doctype)s
+		) changes
+		order by timestamp desc
+		limit %(limit)s
+		""",
+		{"doctype": doctype, "name": name, "limit": cint(limit) or 50},
+		as_dict=True,
+	)
@@ -0,0 +1,249 @@
+import re
+import unicodedata
+
+import frappe
+from frappe import _
+from frappe.utils import cint
+
+from bs_space.streaming import iter_batches
+
+INDEX_DOCTYPE = "Name Search Token"
+
+# Indexed name fields per doctype, with the weight a matching gram contributes
+SEARCH_FIELDS = {
+	"Customer": {
+		"customer_name": 3,
+		"custom_company_legal_name": 3,
+		"customer_name_in_arabic": 3,
+		"custom_name": 2,
+	},
+	"Supplier": {
+		"supplier_name": 3,
+		"supplier_name_in_arabic": 3,
+	},
+}
+
+# Extra columns returned by the search API and shown in link dropdowns
+DESCRIPTION_FIELDS = {
+	"Customer": ["customer_name", "customer_name_in_arabic", "customer_group"],
+	"Supplier": ["supplier_name", "supplier_name_in_arabic", "supplier_group"],
+}
+
+# Stock link queries used when the typed text is too short to rank
+FALLBACK_QUERIES = {
+	"Customer": "erpnext.controllers.queries.customer_query",
+	"Supplier": "erpnext.controllers.queries.supplier_query",
+}
+
+GRAM_SIZE = 3
+MIN_QUERY_LENGTH = 2
+# Share of the query's grams a name must contain to be returned
+MATCH_RATIO = 0.6
+CANDIDATE_LIMIT = 200
+
+# Words that carry no identity in a company name (after normalization)
+LEGAL_SUFFIXES = {
+	"llc", "fzco", "fze", "fzc", "fz", "fzllc", "ltd", "limited", "co", "est", "plc", "inc",
+	"شذمم", "ذمم", "مؤسسه", "شركه",
+}  # fmt: skip
+
+_ARABIC_MARKS = re.compile("[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]")
+_ARABIC_LETTERS = str.maketrans(
+	{
+		"أ": "ا", "إ": "ا", "آ": "ا", "ٱ": "ا",  # noqa: RUF001
+		"ى": "ي", "ئ": "ي", "ی": "ي",
+		"ؤ": "و", "ة": "ه", "ک": "ك", "گ": "ك",  # noqa: RUF001
+	}
+)  # fmt: skip
+_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "01234567890123456789")
+_PUNCTUATION = re.compile(r"[\W_]+", re.UNICODE)
+
+
+def normalize_name(text: str | None) -> str:
+	"""Fold Arabic spelling/diacritic and Latin accent/case variants to one searchable form."""
+	text = unicodedata.normalize("NFKC", text or "")
+	text = _ARABIC_MARKS.sub("", text).translate(_ARABIC_LETTERS).translate(_DIGITS)
+	text = "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+	text = _PUNCTUATION.sub(" ", text.casefold().replace(".", ""))
+
+	words = []
+	for word in text.split():
+		if word in LEGAL_SUFFIXES:
+			continue
+		# Arabic definite article: "الخليج" matches "خليج"
+		if word.startswith("ال") and len(word) > 4:
+			word = word[2:]
+		words.append(word)
+	return " ".join(words)
+
+
+def make_grams(text: str | None, partial: bool = False) -> set[str]:
+	"""
+	Boundary-marked character trigrams of the normalized text.
+	With partial=True the last word gets no end marker (the user is still typing it).
+	"""
+	words = normalize_name(text).split()
+	grams = set()
+	for i, word in enumerate(words):
+		end = "" if partial and i == len(words) - 1 else "$"
+		padded = f"^{word}{end}"
+		if len(padded) <= GRAM_SIZE:
+			grams.add(padded)
+			continue
+		for j in range(len(padded) - GRAM_SIZE + 1):
+			grams.add(padded[j : j + GRAM_SIZE])
+	return grams
+
+
+def _token_rows(doctype: str, docs) -> list[tuple]:
+	rows = []
+	for doc in docs:
+		weights = {}
+		for fieldname, weight in SEARCH_FIELDS[doctype].items():
+			for gram in make_grams(doc.get(fieldname)):
+				weights[gram] = max(weights.get(gram, 0), weight)
+		rows.extend(
+			(frappe.generate_hash(length=12), doctype, doc.get("name"), gram, weight)
+			for gram, weight in weights.items()
+		)
+	return rows
+
+
+def index_documents(doctype: str, docs):
+	"""Replace the index entries of `docs` (documents or dicts holding name + SEARCH_FIELDS)."""
+	names = [d.get("name") for d in docs]
+	if not names:
+		return
+	frappe.db.delete(INDEX_DOCTYPE, {"ref_doctype": doctype, "ref_name": ["in", names]})
+	frappe.db.bulk_insert(
+		INDEX_DOCTYPE, ["name", "ref_doctype", "ref_name", "gram", "weight"], _token_rows(doctype, docs)
+	)
+
+
+# ---- hooks ----
+
+
+def update_search_index(doc, method=None):
+	"""Customer / Supplier on_update: reindex only when a searched name changed."""
+	fields = SEARCH_FIELDS.get(doc.doctype)
+	if not fields or not any(doc.has_value_changed(f) for f in fields):
+		return
+	index_documents(doc.doctype, [doc])
+
+
+def remove_from_search_index(doc, method=None):
+	frappe.db.delete(INDEX_DOCTYPE, {"ref_doctype": doc.doctype, "ref_name": doc.name})
+
+
+def rename_in_search_index(doc, method=None, old=None, new=None, merge=False):
+	if merge:
+		frappe.db.delete(INDEX_DOCTYPE, {"ref_doctype": doc.doctype, "ref_name": old})
+		return
+	frappe.db.set_value(
+		INDEX_DOCTYPE, {"ref_doctype": doc.doctype, "ref_name": old}, "ref_name", new, update_modified=False
+	)
+
+
+def rebuild_search_index(doctype=None, batch_size=2000):
+	"""Rebuild the index from scratch, reading records in keyset-paginated batches."""
+	for dt in [doctype] if doctype else list(SEARCH_FIELDS):
+		frappe.db.delete(INDEX_DOCTYPE, {"ref_doctype": dt})
+		for docs in iter_batches(dt, ["name", *SEARCH_FIELDS[dt]], batch_size=batch_size, commit=True):
+			frappe.db.bulk_insert(
+				INDEX_DOCTYPE, ["name", "ref_doctype", "ref_name", "gram", "weight"], _token_rows(dt, docs)
+			)
+
+
+@frappe.whitelist()
+def enqueue_rebuild_search_index(doctype=None):
+	frappe.only_for("System Manager")
+	if doctype and doctype not in SEARCH_FIELDS:
+		frappe.throw(_("Name search is not available for {0}").format(doctype))
+	frappe.enqueue("bs_space.name_search.rebuild_search_index", queue="long", doctype=doctype)
+
+
+# ---- search ----
+
+
+def rank_names(doctype: str, txt: str, limit: int = CANDIDATE_LIMIT) -> list[frappe._dict]:
+	"""Names of `doctype` ranked by how many of the query's grams they contain (index-only query)."""
+	grams = make_grams(txt, partial=True)
+	if not grams:
+		return []
+
+	return frappe.db.sql(
+		"""
+		select ref_name as name, count(*) as hits, sum(weight) as score
+		from `tabName Search Token`
+		where ref_doctype = %(doctype)s and gram in %(grams)s
+		group by ref_name
+		having hits >= %(min_hits)s
+		order by hits desc, score desc, ref_name
+		limit %(limit)s
+		""",
+		{
+			"doctype": doctype,
+			"grams": tuple(grams),
+			"min_hits": max(1, int(len(grams) * MATCH_RATIO)),
+			"limit": cint(limit),
+		},
+		as_dict=True,
+	)
+
+
+def _fetch_ranked(doctype, ranked, filters=None, extra_filters=None):
+	"""Permission-checked rows for the ranked names, in rank order."""
+	if not ranked:
+		return []
+	names = [r.name for r in ranked]
+	if isinstance(filters, list):
+		filters = [*filters, [doctype, "name", "in", names]]
+		filters.extend([doctype, k, "=", v] for k, v in (extra_filters or {}).items())
+	else:
+		filters = {**(filters or {}), **(extra_filters or {}), "name": ["in", names]}
+
+	rows = frappe.get_list(
+		doctype, filters=filters, fields=["name", *DESCRIPTION_FIELDS[doctype]], limit_page_length=0
+	)
+	by_name = {r.name: r for r in rows}
+	return [by_name[n] for n in names if n in by_name]
+
+
+@frappe.whitelist()
+def search(doctype, txt, limit=20):
+	"""Ranked bilingual name search for Customer or Supplier."""
+	if doctype not in SEARCH_FIELDS:
+		frappe.throw(_("Name search is not available for {0}").format(doctype))
+
+	ranked = rank_names(doctype, txt)
+	scores = {r.name: r.score for r in ranked}
+	results = _fetch_ranked(doctype, ranked)[: cint(limit) or 20]
+	for row in results:
+		row.score = scores[row.name]
+	return results
+
+
+def _link_query(doctype, txt, searchfield, start, page_len, filters):
+	if len(normalize_name(txt).replace(" ", "")) >= MIN_QUERY_LENGTH:
+		rows = _fetch_ranked(doctype, rank_names(doctype, txt), filters, {"disabled": 0})
+		if rows:
+			start = cint(start)
+			return [
+				[row.name, *(row.get(f) for f in DESCRIPTION_FIELDS[doctype])]
+				for row in rows[start : start + cint(page_len)]
+			]
+
+	# too short to rank, or nothing indexed matched (e.g. searching by ID): stock query
+	return frappe.get_attr(FALLBACK_QUERIES[doctype])(doctype, txt, searchfield, start, page_len, filters)
+
+
+@frappe.whitelist()
+@frappe.validate_and_sanitize_search_inputs
+def customer_query(doctype, txt, searchfield, start, page_len, filters):
+	return _link_query("Customer", txt, searchfield, start, page_len, filters)
+
+
+@frappe.whitelist()
+@frappe.validate_and_sanitize_search_inputs
+def supplier_query(doctype, txt, searchfield, start, page_len, filters):
+	return _link_query("Supplier", txt, searchfield, start, page_len, filters)
@@ -0,0 +1,248 @@
+import json
+
+import frappe
+from frappe import _
+from frappe.model import no_value_fields
+from frappe.utils import add_to_date, cint, now, now_datetime
+
+from bs_space.job_runs import track, tracked_job
+
+EVENT_DOCTYPE = "BS Change Event"
+CHECKPOINT_PREFIX = "bs_outbox_checkpoint"
+BATCH_SIZE = 500
+# a gap in the event ids younger than this is waited for, so a transaction that took its
+# event id earlier but committed later is not skipped over by a checkpoint; older gaps are
+# ids of rolled back transactions
+SETTLE_SECONDS = 10
+# child row columns that change on every save without being data
+ROW_META_FIELDS = frozenset(("modified", "modified_by", "creation", "owner", "idx", "docstatus"))
+
+# Consumers are registered in hooks.py (any app can add one):
+#     bs_space_change_consumers = {"<consumer name>": "dotted.path.to.consume"}
+# `consume(events)` gets the events of one batch in order, as dicts with ref_doctype,
+# ref_name, action, previous_name, changed_fields (list), changed_rows (dict), user, timestamp.
+# It must be idempotent: after a failure the whole batch is delivered again.
+#
+# Only changes saved through the document API are recorded. The scheduled set-based UPDATEs
+# write no events: recompute_visa_statuses (Linked Individual status and the Customers'
+# visa holder rows) and mark_filings_pending (Customer filing statuses). Consumers that
+# mirror those fields re-read them. remove_links deletes rows with raw SQL too, but
+# cleanup_on_trash re-saves each parent afterwards, which records their Update events.
+
+
+# ---- recording ----
+
+
+def _changed_fields(doc, before):
+	meta = frappe.get_meta(doc.doctype)
+	return [
+		df.fieldname
+		for df in meta.fields
+		if df.fieldtype not in no_value_fields and before.get(df.fieldname) != doc.get(df.fieldname)
+	]
+
+
+def _changed_rows(doc, before):
+	changes = {}
+	for df in frappe.get_meta(doc.doctype).get_table_fields():
+		old = {row.name: row.as_dict() for row in before.get(df.fieldname) or []}
+		new = {row.name: row.as_dict() for row in doc.get(df.fieldname) or []}
+		added = [name for name in new if name not in old]
+		removed = [name for name in old if name not in new]
+		updated = [
+			name
+			for name in new
+			if name in old
+			and any(new[name].get(k) != old[name].get(k) for k in new[name] if k not in ROW_META_FIELDS)
+		]
+		if added or removed or updated:
+			changes[df.fieldname] = {"added": added, "removed": removed, "updated": updated}
+	return changes
+
+
+def _queue(ref_doctype, ref_name, action, changed_fields=None, changed_rows=None, previous_name=None):
+	pending = getattr(frappe.local, "bs_outbox", None)
+	if pending is None:
+		pending = frappe.local.bs_outbox = []
+		frappe.db.before_commit.add(flush_events)
+		frappe.db.after_rollback.add(discard_events)
+	pending.append(
+		(
+			ref_doctype,
+			ref_name,
+			action,
+			previous_name,
+			json.dumps(changed_fields) if changed_fields else None,
+			json.dumps(changed_rows) if changed_rows else None,
+			frappe.session.user,
+			now(),
+		)
+	)
+
+
+def record_change(doc, method=None):
+	"""on_update / on_trash of an outbox doctype (see hooks.py)."""
+	if method == "on_trash":
+		_queue(doc.doctype, doc.name, "Delete")
+		return
+
+	before = doc.get_doc_before_save()
+	if not before:
+		_queue(doc.doctype, doc.name, "Insert")
+		return
+	changed_fields = _changed_fields(doc, before)
+	changed_rows = _changed_rows(doc, before)
+	if changed_fields or changed_rows:
+		_queue(doc.doctype, doc.name, "Update", changed_fields, changed_rows)
+
+
+def record_rename(doc, method=None, old=None, new=None, merge=False):
+	_queue(doc.doctype, new or doc.name, "Rename", previous_name=old)
+
+
+def flush_events():
+	"""
+	Written in the transaction that made the changes, right before it commits. `creation` is
+	the flush time (not the change time) so the settle window starts when the ids are taken.
+	"""
+	pending = getattr(frappe.local, "bs_outbox", None)
+	frappe.local.bs_outbox = None
+	if pending:
+		flushed = now()
+		frappe.db.bulk_insert(
+			EVENT_DOCTYPE,
+			[
+				"ref_doctype",
+				"ref_name",
+				"action",
+				"previous_name",
+				"changed_fields",
+				"changed_rows",
+				"user",
+				"timestamp",
+				"creation",
+				"modified",
+				"owner",
+				"modified_by",
+				"docstatus",
+			],
+			[(*row, flushed, flushed, row[-2], row[-2], 0) for row in pending],
+		)
+
+
+def discard_events():
+	frappe.local.bs_outbox = None
+
+
+# ---- consuming ----
+
+
+def get_consumers() -> dict:
+	return {name: methods[-1] for name, methods in frappe.get_hooks("bs_space_change_consumers").items()}
+
+
+def _checkpoint_key(consumer):
+	return f"{CHECKPOINT_PREFIX}:{consumer}"
+
+
+def get_checkpoint(consumer) -> int:
+	return cint(frappe.db.get_global(_checkpoint_key(consumer)))
+
+
+def set_checkpoint(consumer, event_id):
+	frappe.db.set_global(_checkpoint_key(consumer), str(cint(event_id)))
+
+
+def _settled(events, after, until):
+	"""The leading events up to the first id gap that is younger than the settle window."""
+	expected = cint(after) + 1
+	for i, event in enumerate(events):
+		if cint(event.name) != expected and event.creation > until:
+			# an earlier id may belong to a transaction that has not committed yet
+			return events[:i]
+		expected = cint(event.name) + 1
+	return events
+
+
+def _read_batch(after, until):
+	events = frappe.db.sql(
+		f"""
+		select name, ref_doctype, ref_name, action, previous_name, changed_fields, changed_rows,
+			user, timestamp, creation
+		from `tab{EVENT_DOCTYPE}`
+		where name > %s
+		order by name
+		limit %s
+		""",
+		(after, BATCH_SIZE),
+		as_dict=True,
+	)
+	events = _settled(events, after, until)
+	for event in events:
+		del event["creation"]
+		event.changed_fields = json.loads(event.changed_fields) if event.changed_fields else []
+		event.changed_rows = json.loads(event.changed_rows) if event.changed_rows else {}
+	return events
+
+
+def consume(consumer, method):
+	"""Deliver every settled event after the consumer's checkpoint, one committed batch at a time."""
+	consume_fn = frappe.get_attr(method)
+	until = add_to_date(now_datetime(), seconds=-SETTLE_SECONDS)
+	delivered = 0
+	while True:
+		events = _read_batch(get_checkpoint(consumer), until)
+		if not events:
+			return delivered
+		consume_fn(events)
+		set_checkpoint(consumer, events[-1].name)
+		frappe.db.commit()
+		delivered += len(events)
+		track(scanned=len(events))
+
+
+def _last_event_id():
+	return cint(frappe.db.sql(f"select max(name) from `tab{EVENT_DOCTYPE}`")[0][0])
+
+
+def process_outbox():
+	"""Every minute: hand new change events to the consumers (a job run is recorded only if there are any)."""
+	consumers = get_consumers()
+	last = _last_event_id()
+	if any(get_checkpoint(consumer) < last for consumer in consumers):
+		deliver_events()
+
+
+@tracked_job(lock_timeout=30 * 60)
+def deliver_events():
+	for consumer, method in get_consumers().items():
+		try:
+			consume(consumer, method)
+		except Exception:
+			# the failed batch is retried on the next run; other consumers carry on
+			frappe.db.rollback()
+			track(errors=1)
+			frappe.log_error(title=f"Outbox consumer {consumer} failed")
+
+
+@frappe.whitelist()
+def replay(consumer, from_event=0):
+	"""Re-deliver events to `consumer` starting after `from_event` (0: everything still kept)."""
+	frappe.only_for("System Manager")
+	if consumer not in get_consumers():
+		frappe.throw(_("Unknown outbox consumer {0}").format(consumer))
+	set_checkpoint(consumer, from_event)
+
+
+@frappe.whitelist()
+def get_outbox_status():
+	"""Checkpoint and backlog of every consumer."""
+	frappe.only_for("System Manager")
+	last = _last_event_id()
+	status = []
+	for consumer, method in get_consumers().items():
+		checkpoint = get_checkpoint(consumer)
+		status.append(
+			{"consumer": consumer, "method": method, "checkpoint": checkpoint, "backlog": last - checkpoint}
+		)
+	return status
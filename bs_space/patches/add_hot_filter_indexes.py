@@ -0,0 +1,6 @@
+from bs_space.db_indexes import ensure_indexes
+
+
+def execute():
+	"""Index the child-table links, parent links and expiry dates the app filters on."""
+	ensure_indexes()
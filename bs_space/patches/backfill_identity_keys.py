@@ -0,0 +1,23 @@
+import frappe
+
+from bs_space.identity import IDENTITY_FIELDS, normalize_identity
+from bs_space.streaming import iter_batches
+
+
+def execute():
+	"""
+	Populate the normalized passport / Emirates ID keys for existing Linked Individuals with
+	normalize_identity itself, so the stored keys match the ones lookups compute.
+	"""
+	fields = ["name", *IDENTITY_FIELDS, *IDENTITY_FIELDS.values()]
+	for batch in iter_batches("Linked Individual", fields, commit=True):
+		updates = {}
+		for row in batch:
+			keys = {
+				key_field: normalize_identity(row.get(source_field)) or None
+				for key_field, source_field in IDENTITY_FIELDS.items()
+			}
+			if any(row.get(key_field) != key for key_field, key in keys.items()):
+				updates[row.name] = keys
+		if updates:
+			frappe.db.bulk_update("Linked Individual", updates, update_modified=False)
@@ -0,0 +1,12 @@
+import frappe
+
+from bs_space.expiry_calendar import FEED_TOKEN_KEY, set_feed_token
+
+
+def execute():
+	"""Give the feed tokens issued so far their keyed token -> user entry, so their URLs keep working."""
+	for row in frappe.get_all(
+		"DefaultValue", filters={"defkey": FEED_TOKEN_KEY}, fields=["parent", "defvalue"]
+	):
+		if row.defvalue:
+			set_feed_token(row.parent, row.defvalue)
@@ -0,0 +1,227 @@
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import re
+import time
+import zipfile
+
+import frappe
+from frappe import _
+from frappe.utils import cint, now_datetime
+
+PROFILE_DOCTYPE = "BS Request Profile"
+USER_FLAG_PREFIX = "bs_space:profile_user"
+HEADER = "X-BS-Profile"
+# profiles kept at most; older ones are deleted when a new one is stored (`bs_profiler_keep`)
+DEFAULT_KEEP = 100
+DEFAULT_MINUTES = 15
+
+PROFILED_DOCTYPES = ("Customer", "Linked Individual")
+SAVE_METHODS = (
+	"frappe.desk.form.save.savedocs",
+	"frappe.desk.form.save.cancel",
+	"frappe.client.save",
+	"frappe.client.insert",
+	"frappe.client.set_value",
+	"run_doc_method",
+)
+METHOD_PATH = re.compile(r"^/api/(?:v\d/)?method/([^/]+)")
+RESOURCE_PATH = re.compile(r"^/api/(?:v\d/)?(?:resource|document)/([^/]+)(?:/([^/]+))?")
+
+
+# ---- scope ----
+
+
+def _request_target():
+	"""(method, reference doctype, reference name) when the request is in scope, else None."""
+	request = frappe.request
+	match = METHOD_PATH.match(request.path)
+	if match:
+		method = match.group(1)
+	elif request.method in ("POST", "PUT", "PATCH") and (match := RESOURCE_PATH.match(request.path)):
+		doctype = match.group(1)
+		return (
+			(f"{request.method} {doctype}", doctype, match.group(2)) if doctype in PROFILED_DOCTYPES else None
+		)
+	else:
+		method = frappe.form_dict.get("cmd") or ""
+
+	if method.startswith("bs_space."):
+		return method, None, None
+	if method in SAVE_METHODS:
+		doc = frappe.form_dict.get("doc") or frappe.form_dict.get("docs")
+		doc = frappe.parse_json(doc) if doc else {}
+		doctype = frappe.form_dict.get("doctype") or frappe.form_dict.get("dt") or doc.get("doctype")
+		if doctype in PROFILED_DOCTYPES:
+			return (
+				method,
+				doctype,
+				frappe.form_dict.get("name") or frappe.form_dict.get("dn") or doc.get("name"),
+			)
+	return None
+
+
+def _user_flag_key(user):
+	return f"{USER_FLAG_PREFIX}:{user}"
+
+
+def _triggered():
+	header = frappe.get_request_header(HEADER)
+	if header:
+		token = frappe.conf.get("bs_profiler_token")
+		if token and header == token:
+			return "token"
+		# without the shared token the header is only honoured for System Managers
+		return "header" if "System Manager" in frappe.get_roles() else None
+	return "user" if frappe.cache.get_value(_user_flag_key(frappe.session.user)) else None
+
+
+# ---- request hooks ----
+
+
+def start_request_profile():
+	"""
+	auth_hooks: start profiling when an in-scope request is flagged. Runs after the session,
+	API key and OAuth authentication, so the user flag and the role check see the real user
+	before the profiler is enabled. Everything else returns before any I/O.
+	"""
+	if not frappe.request or frappe.request.method == "OPTIONS":
+		return
+	target = _request_target()
+	if not target:
+		return
+	trigger = _triggered()
+	if not trigger:
+		return
+
+	queries = []
+	db = frappe.local.db
+	sql = db.sql
+
+	def timed_sql(query, *args, **kwargs):
+		start = time.perf_counter()
+		try:
+			return sql(query, *args, **kwargs)
+		finally:
+			queries.append((time.perf_counter() - start, getattr(db, "last_query", None) or query))
+
+	# instance attribute: only this request's connection is instrumented
+	db.sql = timed_sql
+	profiler = cProfile.Profile()
+	frappe.local.bs_profile = frappe._dict(
+		target=target,
+		trigger=trigger,
+		db=db,
+		queries=queries,
+		profiler=profiler,
+		started_at=now_datetime(),
+		start=time.perf_counter(),
+	)
+	profiler.enable()
+
+
+def after_request(response=None, request=None):
+	state = getattr(frappe.local, "bs_profile", None)
+	if not state:
+		return
+	frappe.local.bs_profile = None
+	state.profiler.disable()
+	duration = time.perf_counter() - state.start
+	del state.db.sql
+
+	try:
+		name = store_profile(state, duration)
+		if response is not None:
+			response.headers["X-BS-Profile-Id"] = name
+	except Exception:
+		frappe.db.rollback()
+		frappe.log_error(title="Request profile could not be stored")
+
+
+# ---- storage ----
+
+
+def _artifact(state):
+	state.profiler.create_stats()
+	text = io.StringIO()
+	pstats.Stats(state.profiler, stream=text).sort_stats("cumulative").print_stats(80)
+	queries = [{"seconds": round(d, 6), "query": str(q)} for d, q in state.queries]
+
+	buffer = io.BytesIO()
+	with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+		archive.writestr("profile.prof", marshal.dumps(state.profiler.stats))
+		archive.writestr("profile.txt", text.getvalue())
+		archive.writestr("queries.json", json.dumps(queries, indent=1))
+	return buffer.getvalue(), text.getvalue(), queries
+
+
+def store_profile(state, duration):
+	content, text, queries = _artifact(state)
+	method, reference_doctype, reference_name = state.target
+	slowest = sorted(queries, key=lambda q: q["seconds"], reverse=True)[:20]
+
+	profile = frappe.get_doc(
+		{
+			"doctype": PROFILE_DOCTYPE,
+			"method": method,
+			"user": frappe.session.user,
+			"reference_doctype": reference_doctype,
+			"reference_name": reference_name,
+			"started_at": state.started_at,
+			"duration": duration,
+			"query_count": len(queries),
+			"query_time": sum(q["seconds"] for q in queries),
+			# the head of the pstats report: totals and the most expensive calls
+			"top_functions": "\n".join(text.splitlines()[:60]),
+			"slowest_queries": "\n\n".join(f"{q['seconds']:.4f}s  {q['query']}" for q in slowest),
+		}
+	).insert(ignore_permissions=True)
+
+	file_doc = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": f"profile-{profile.name}.zip",
+			"attached_to_doctype": PROFILE_DOCTYPE,
+			"attached_to_name": profile.name,
+			"attached_to_field": "profile",
+			"is_private": 1,
+			"content": content,
+		}
+	).insert(ignore_permissions=True)
+	profile.db_set("profile", file_doc.file_url)
+
+	_enforce_limit()
+	frappe.db.commit()
+	return profile.name
+
+
+def _enforce_limit():
+	from bs_space.bs_core.doctype.bs_request_profile.bs_request_profile import delete_profiles
+
+	keep = cint(frappe.conf.get("bs_profiler_keep")) or DEFAULT_KEEP
+	delete_profiles(
+		frappe.get_all(
+			PROFILE_DOCTYPE, order_by="started_at desc", limit_start=keep, limit_page_length=100, pluck="name"
+		)
+	)
+
+
+# ---- switches ----
+
+
+@frappe.whitelist()
+def start_profiling(user=None, minutes=DEFAULT_MINUTES):
+	"""Profile the in-scope requests of `user` (default: yourself) for the next `minutes`."""
+	frappe.only_for("System Manager")
+	user = user or frappe.session.user
+	if not frappe.db.exists("User", user):
+		frappe.throw(_("User {0} not found").format(user))
+	frappe.cache.set_value(_user_flag_key(user), 1, expires_in_sec=max(1, cint(minutes)) * 60)
+
+
+@frappe.whitelist()
+def stop_profiling(user=None):
+	frappe.only_for("System Manager")
+	frappe.cache.delete_value(_user_flag_key(user or frappe.session.user))
@@ -0,0 +1,60 @@
+// Copyright (c) 2025, Best Solution® and contributors
+// For license information, please see license.txt
+
+// Compact history of system-generated link changes (BS Link Change) on both sides of a link.
+// Loaded for Customer and Linked Individual; the guard keeps the handlers from registering twice.
+frappe.provide("bs_space");
+
+bs_space.show_link_history = function (frm) {
+	frappe
+		.xcall("bs_space.link_changes.get_link_history", { doctype: frm.doctype, name: frm.docname })
+		.then((rows) => {
+			const body = rows.length
+				? `<table class="table table-bordered table-condensed">
+					<thead><tr>
+						<th>${__("When")}</th><th>${__("Change")}</th>
+						<th>${__("Document")}</th><th>${__("Linked Document")}</th><th>${__("By")}</th>
+					</tr></thead>
+					<tbody>${rows
+						.map(
+							(r) => `<tr>
+								<td>${frappe.datetime.str_to_user(r.timestamp)}</td>
+								<td>${__(r.action)} (${frappe.utils.escape_html(r.relation)})</td>
+								<td>${frappe.utils.get_form_link(r.entity_doctype, r.entity, true)}</td>
+								<td>${frappe.utils.get_form_link(r.linked_doctype, r.linked_name, true)}</td>
+								<td>${frappe.utils.escape_html(r.user)}${
+									r.origin_name
+										? `<br><small>${__("via")} ${frappe.utils.get_form_link(
+												r.origin_doctype,
+												r.origin_name,
+												true
+										  )}</small>`
+										: ""
+								}</td>
+							</tr>`
+						)
+						.join("")}</tbody>
+				</table>`
+				: `<p class="text-muted">${__("No link changes recorded.")}</p>`;
+
+			const dialog = new frappe.ui.Dialog({
+				title: __("Link History"),
+				size: "extra-large",
+				fields: [{ fieldtype: "HTML", fieldname: "history" }],
+			});
+			dialog.fields_dict.history.$wrapper.html(body);
+			dialog.show();
+		});
+};
+
+if (!bs_space.link_history_bound) {
+	bs_space.link_history_bound = true;
+	["Customer", "Linked Individual"].forEach((doctype) => {
+		frappe.ui.form.on(doctype, {
+			refresh(frm) {
+				if (frm.is_new()) return;
+				frm.add_custom_button(__("Link History"), () => bs_space.show_link_history(frm), __("View"));
+			},
+		});
+	});
+}
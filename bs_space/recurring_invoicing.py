@@ -0,0 +1,474 @@
+import frappe
+from frappe import _
+from frappe.utils import add_days, add_months, cint, flt, formatdate, getdate, today
+
+from bs_space.exchange_rates import get_exchange_rates
+from bs_space.fetch_sync import FetchResolver
+from bs_space.job_runs import track, tracked_job
+from bs_space.line_tax import ITEM_TAX_FIELDS
+from bs_space.streaming import iter_keyset
+
+SERVICE_TABLE = "Recurring Services of Client"
+SERVICE_FIELD = "custom_recurring_services"
+SERVICE_ITEM_TYPE = "Accounting & Tax Services"
+# customers invoiced per background job; each job commits once at its end
+CHUNK_SIZE = 50
+FREQUENCY_MONTHS = {"Monthly": 1, "Quarterly": 3, "Yearly": 12}
+SAVEPOINT = "bs_recurring_invoice"
+
+TAX_TEMPLATE_FIELDS = (
+	"charge_type",
+	"account_head",
+	"description",
+	"rate",
+	"cost_center",
+	"included_in_print_rate",
+	"row_id",
+)
+
+
+def get_period_start(frequency, date):
+	"""First day of the calendar month / quarter / year of `date`."""
+	date = getdate(date)
+	months = FREQUENCY_MONTHS[frequency]
+	return date.replace(day=1, month=(date.month - 1) // months * months + 1)
+
+
+def get_period_end(frequency, start):
+	return add_days(add_months(start, FREQUENCY_MONTHS[frequency]), -1)
+
+
+def get_unbilled_periods(line, posting_date):
+	"""
+	Period starts of `line` not invoiced yet, oldest first: from the period after its last
+	invoiced one (or the period of its start date) up to the period of `posting_date`,
+	stopping after its end date.
+	"""
+	months = FREQUENCY_MONTHS[line.frequency]
+	start = get_period_start(line.frequency, line.start_date)
+	if line.last_invoiced_period:
+		start = max(start, getdate(add_months(line.last_invoiced_period, months)))
+	current = get_period_start(line.frequency, posting_date)
+	end = getdate(line.end_date) if line.end_date else None
+	periods = []
+	while start <= current and (not end or start <= end):
+		periods.append(start)
+		start = getdate(add_months(start, months))
+	return periods
+
+
+def validate_recurring_services(doc, method=None):
+	"""Customer validate: recurring lines must be accounting & tax services with a sane date range."""
+	rows = doc.get(SERVICE_FIELD) or []
+	if not rows:
+		return
+	item_types = dict(
+		frappe.get_all(
+			"Item",
+			filters={"name": ["in", list({row.service_item for row in rows})]},
+			fields=["name", "custom_item_type"],
+			as_list=True,
+		)
+	)
+	for row in rows:
+		if item_types.get(row.service_item) != SERVICE_ITEM_TYPE:
+			frappe.throw(
+				_("Row {0}: recurring service {1} is not an {2} item").format(
+					row.idx, row.service_item, _(SERVICE_ITEM_TYPE)
+				)
+			)
+		if row.end_date and getdate(row.end_date) < getdate(row.start_date):
+			frappe.throw(_("Row {0}: the end date is before the start date").format(row.idx))
+
+
+# ---- selection ----
+
+
+def _due_lines(posting_date):
+	"""From / where clause and values of lines with at least one unbilled period (see get_unbilled_periods)."""
+	posting_date = getdate(posting_date)
+	values = {f"period_{f.lower()}": get_period_start(f, posting_date) for f in FREQUENCY_MONTHS}
+	values.update(posting_date=posting_date, item_type=SERVICE_ITEM_TYPE, field=SERVICE_FIELD)
+	period = (
+		"case r.frequency when 'Quarterly' then %(period_quarterly)s "
+		"when 'Yearly' then %(period_yearly)s else %(period_monthly)s end"
+	)
+	months = "case r.frequency when 'Quarterly' then 3 when 'Yearly' then 12 else 1 end"
+	# start of the first period not invoiced yet
+	next_period = f"date_add(r.last_invoiced_period, interval {months} month)"
+	return (
+		f"""
+		from `tab{SERVICE_TABLE}` r
+		join `tabCustomer` c on c.name = r.parent
+		join `tabItem` i on i.name = r.service_item
+		where r.parenttype = 'Customer' and r.parentfield = %(field)s
+			and c.disabled = 0 and i.disabled = 0 and i.custom_item_type = %(item_type)s
+			and r.start_date <= %(posting_date)s
+			and (r.last_invoiced_period is null or r.last_invoiced_period < {period})
+			and (r.end_date is null or r.last_invoiced_period is null or r.end_date >= {next_period})
+	""",
+		values,
+	)
+
+
+def get_due_services(posting_date, customers):
+	"""
+	Recurring service lines of `customers` with a period up to `posting_date` that is not
+	invoiced yet, in one query.
+	"""
+	clause, values = _due_lines(posting_date)
+	return frappe.db.sql(
+		f"""
+		select r.name, r.parent as customer, r.service_item, r.frequency, r.qty, r.rate,
+			r.start_date, r.end_date, r.last_invoiced_period
+		{clause} and r.parent in %(customers)s
+		order by r.parent, r.idx
+		""",
+		{**values, "customers": tuple(customers)},
+		as_dict=True,
+	)
+
+
+def get_due_customers(posting_date, after="", limit=CHUNK_SIZE):
+	"""Enabled customers with a due line, `limit` at a time by name (see iter_keyset)."""
+	clause, values = _due_lines(posting_date)
+	return frappe.db.sql(
+		f"""
+		select distinct r.parent as name
+		{clause} and r.parent > %(after)s
+		order by r.parent
+		limit %(limit)s
+		""",
+		{**values, "after": after, "limit": cint(limit)},
+		as_dict=True,
+	)
+
+
+# ---- pre-resolution ----
+
+
+def _default_company():
+	return frappe.defaults.get_user_default("Company") or frappe.db.get_single_value(
+		"Global Defaults", "default_company"
+	)
+
+
+def _tax_rows(company):
+	template = frappe.db.get_value(
+		"Sales Taxes and Charges Template", {"company": company, "is_default": 1, "disabled": 0}, "name"
+	)
+	if not template:
+		return None, []
+	return template, frappe.get_all(
+		"Sales Taxes and Charges",
+		filters={"parent": template, "parenttype": "Sales Taxes and Charges Template"},
+		fields=list(TAX_TEMPLATE_FIELDS),
+		order_by="idx",
+	)
+
+
+def _prices(item_codes, price_lists, customers, posting_date):
+	"""{(item, price list, customer or None): price_list_rate}, customer-specific prices included."""
+	prices = {}
+	for row in frappe.db.sql(
+		"""
+		select item_code, price_list, customer, price_list_rate
+		from `tabItem Price`
+		where item_code in %(items)s and price_list in %(price_lists)s and selling = 1
+			and (ifnull(customer, '') = '' or customer in %(customers)s)
+			and (valid_from is null or valid_from <= %(date)s)
+			and (valid_upto is null or valid_upto >= %(date)s)
+		order by valid_from desc
+		""",
+		{
+			"items": tuple(item_codes),
+			"price_lists": tuple(price_lists),
+			"customers": tuple(customers),
+			"date": posting_date,
+		},
+		as_dict=True,
+	):
+		prices.setdefault((row.item_code, row.price_list, row.customer or None), row.price_list_rate)
+	return prices
+
+
+def resolve_context(services, posting_date, company=None):
+	"""Everything the invoices of a chunk need, read with one query per source."""
+	company = company or _default_company()
+	customer_names = list({s.customer for s in services})
+	item_codes = list({s.service_item for s in services})
+
+	ctx = frappe._dict(company=company, posting_date=getdate(posting_date))
+	ctx.company_defaults = frappe.get_cached_value(
+		"Company",
+		company,
+		["default_currency", "default_receivable_account", "default_income_account", "cost_center"],
+		as_dict=True,
+	)
+	ctx.customers = {
+		row.name: row
+		for row in frappe.get_all(
+			"Customer",
+			filters={"name": ["in", customer_names]},
+			fields=["name", "customer_name", "default_currency", "default_price_list", "payment_terms"],
+		)
+	}
+	ctx.receivables = dict(
+		frappe.get_all(
+			"Party Account",
+			filters={"parenttype": "Customer", "parent": ["in", customer_names], "company": company},
+			fields=["parent", "account"],
+			as_list=True,
+		)
+	)
+	ctx.items = {
+		row.name: row
+		for row in frappe.get_all(
+			"Item",
+			filters={"name": ["in", item_codes]},
+			fields=["name", "item_name", "description", "stock_uom", *ITEM_TAX_FIELDS],
+		)
+	}
+	ctx.item_defaults = {
+		row.parent: row
+		for row in frappe.get_all(
+			"Item Default",
+			filters={"parenttype": "Item", "parent": ["in", item_codes], "company": company},
+			fields=["parent", "income_account", "selling_cost_center"],
+		)
+	}
+
+	default_price_list = frappe.db.get_single_value("Selling Settings", "selling_price_list")
+	price_lists = {c.default_price_list or default_price_list for c in ctx.customers.values()} - {None}
+	ctx.default_price_list = default_price_list
+	ctx.price_list_currencies = dict(
+		frappe.get_all(
+			"Price List",
+			filters={"name": ["in", list(price_lists)]},
+			fields=["name", "currency"],
+			as_list=True,
+		)
+	)
+	ctx.prices = _prices(item_codes, price_lists, customer_names, ctx.posting_date) if price_lists else {}
+
+	currencies = {c.default_currency for c in ctx.customers.values()} | set(
+		ctx.price_list_currencies.values()
+	)
+	company_currency = ctx.company_defaults.default_currency
+	ctx.exchange_rates = get_exchange_rates(
+		[(currency, ctx.posting_date) for currency in currencies - {None}], company_currency
+	)
+	ctx.taxes_and_charges, ctx.tax_rows = _tax_rows(company)
+	ctx.fetch_resolver = FetchResolver()
+	return ctx
+
+
+def _rate_into_company_currency(ctx, currency):
+	if currency == ctx.company_defaults.default_currency:
+		return 1.0
+	return flt(ctx.exchange_rates.get((currency, str(ctx.posting_date))))
+
+
+# ---- building ----
+
+
+def group_by_period(services, posting_date):
+	"""
+	{customer: [(period start, lines)]} with every unbilled period of each line, oldest period
+	first; each line copy carries the period_start it bills.
+	"""
+	periods = {}
+	for line in services:
+		for period_start in get_unbilled_periods(line, posting_date):
+			periods.setdefault((line.customer, period_start), []).append(
+				frappe._dict(line, period_start=period_start)
+			)
+	by_customer = {}
+	for customer, period_start in sorted(periods):
+		by_customer.setdefault(customer, []).append((period_start, periods[customer, period_start]))
+	return by_customer
+
+
+def build_invoice(ctx, customer, period_start, lines):
+	"""An unsaved Sales Invoice for one customer's lines of one period, from pre-resolved data only."""
+	cust = ctx.customers[customer]
+	defaults = ctx.company_defaults
+	currency = cust.default_currency or defaults.default_currency
+	conversion_rate = _rate_into_company_currency(ctx, currency)
+	price_list = cust.default_price_list or ctx.default_price_list
+	price_list_currency = ctx.price_list_currencies.get(price_list) or currency
+	plc_conversion_rate = _rate_into_company_currency(ctx, price_list_currency)
+	if not conversion_rate or not plc_conversion_rate:
+		frappe.throw(_("No exchange rate for {0} on {1}").format(currency, formatdate(ctx.posting_date)))
+
+	doc = frappe.new_doc("Sales Invoice")
+	doc.update(
+		{
+			"company": ctx.company,
+			"customer": customer,
+			"customer_name": cust.customer_name,
+			"posting_date": ctx.posting_date,
+			"set_posting_time": 1,
+			"currency": currency,
+			"conversion_rate": conversion_rate,
+			"selling_price_list": price_list,
+			"price_list_currency": price_list_currency,
+			"plc_conversion_rate": plc_conversion_rate,
+			"ignore_pricing_rule": 1,
+			"debit_to": ctx.receivables.get(customer) or defaults.default_receivable_account,
+			"payment_terms_template": cust.payment_terms,
+			"taxes_and_charges": ctx.taxes_and_charges,
+			# a month, quarter or year start, following the frequency of the lines billed
+			"custom_recurring_period": period_start,
+		}
+	)
+
+	for line in lines:
+		item = ctx.items[line.service_item]
+		item_defaults = ctx.item_defaults.get(line.service_item) or {}
+		price = ctx.prices.get((item.name, price_list, customer)) or ctx.prices.get(
+			(item.name, price_list, None)
+		)
+		# price list rates are in the price list currency
+		price_list_rate = flt(price) * plc_conversion_rate / conversion_rate
+		rate = flt(line.rate) or price_list_rate
+		if not rate:
+			frappe.throw(_("No rate or {0} price for {1}").format(price_list, item.name))
+
+		period_end = get_period_end(line.frequency, line.period_start)
+		doc.append(
+			"items",
+			{
+				"item_code": item.name,
+				"item_name": item.item_name,
+				"description": _("{0}, {1} to {2}").format(
+					item.description or item.item_name, formatdate(line.period_start), formatdate(period_end)
+				),
+				"uom": item.stock_uom,
+				"stock_uom": item.stock_uom,
+				"conversion_factor": 1,
+				"qty": flt(line.qty) or 1,
+				"price_list_rate": price_list_rate or rate,
+				"rate": rate,
+				"income_account": item_defaults.get("income_account") or defaults.default_income_account,
+				"cost_center": item_defaults.get("selling_cost_center") or defaults.cost_center,
+			},
+		)
+	for tax in ctx.tax_rows:
+		doc.append("taxes", dict(tax))
+
+	# compute_line_taxes reads these instead of querying Item again
+	doc.flags.bs_item_tax_flags = {code: ctx.items[code] for code in {line.service_item for line in lines}}
+	doc.flags.ignore_permissions = True
+	return doc
+
+
+def _mark_invoiced(lines):
+	by_period = {}
+	for line in lines:
+		by_period.setdefault(line.period_start, []).append(line.name)
+	for period_start, names in by_period.items():
+		frappe.db.sql(
+			f"update `tab{SERVICE_TABLE}` set last_invoiced_period = %s where name in %s",
+			(period_start, tuple(names)),
+		)
+
+
+def _log_failure(customer):
+	track(errors=1)
+	frappe.log_error(
+		title=_("Recurring invoice for {0} failed").format(customer),
+		reference_doctype="Customer",
+		reference_name=customer,
+	)
+
+
+# ---- jobs ----
+
+
+@tracked_job(exclusive=False)
+def invoice_customers(customers, posting_date, submit=True):
+	"""
+	Background job for one chunk: build, insert and (optionally) submit one Sales Invoice per
+	customer and unbilled period, oldest period first, so periods missed by earlier runs are
+	caught up. Every invoice runs in its own savepoint: a failing invoice is logged and that
+	client's later periods are left for the next run, without undoing the other invoices. The
+	chunk commits once at the end.
+	"""
+	# the chunk's lines stay locked until it commits: an overlapping run waits, then finds them invoiced
+	frappe.db.sql(
+		f"select name from `tab{SERVICE_TABLE}` where parenttype = 'Customer' and parent in %s for update",
+		(tuple(customers),),
+	)
+	services = get_due_services(posting_date, customers)
+	if not services:
+		return []
+	track(scanned=len(services))
+	ctx = resolve_context(services, posting_date)
+
+	invoices = []
+	for customer, periods in group_by_period(services, posting_date).items():
+		try:
+			invoices.extend((build_invoice(ctx, customer, start, lines), lines) for start, lines in periods)
+		except Exception:
+			_log_failure(customer)
+	ctx.fetch_resolver.prefetch_for(doc for doc, _lines in invoices)
+
+	created, failed = [], set()
+	for doc, lines in invoices:
+		if doc.customer in failed:
+			# last_invoiced_period only moves forward one period at a time
+			continue
+		frappe.db.savepoint(SAVEPOINT)
+		try:
+			ctx.fetch_resolver.apply(doc)
+			doc.insert()
+			if cint(submit):
+				doc.submit()
+			_mark_invoiced(lines)
+		except Exception:
+			frappe.db.rollback(save_point=SAVEPOINT)
+			failed.add(doc.customer)
+			_log_failure(doc.customer)
+		else:
+			created.append(doc.name)
+			track(updated=1)
+
+	frappe.db.commit()
+	return created
+
+
+@tracked_job()
+def run_recurring_invoicing(posting_date=None, submit=True):
+	"""
+	Monthly: queue the invoicing of every customer with a recurring service period due up to
+	`posting_date` (default today), CHUNK_SIZE customers per job on the long queue.
+	"""
+	posting_date = getdate(posting_date or today())
+	queued = 0
+	# customer names are read a chunk at a time, never the whole book
+	for chunk in iter_keyset(lambda after, limit: get_due_customers(posting_date, after, limit), CHUNK_SIZE):
+		frappe.enqueue(
+			"bs_space.recurring_invoicing.invoice_customers",
+			queue="long",
+			timeout=60 * 60,
+			enqueue_after_commit=True,
+			customers=[c.name for c in chunk],
+			posting_date=posting_date,
+			submit=cint(submit),
+		)
+		queued += len(chunk)
+	track(scanned=queued)
+	return queued
+
+
+@frappe.whitelist()
+def enqueue_recurring_invoicing(posting_date=None, submit=1):
+	"""Start a run now (e.g. after adding services mid-month); already invoiced periods are skipped."""
+	frappe.only_for(("Accounts Manager", "System Manager"))
+	frappe.enqueue(
+		"bs_space.recurring_invoicing.run_recurring_invoicing",
+		queue="long",
+		posting_date=posting_date,
+		submit=cint(submit),
+	)
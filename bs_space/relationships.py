@@ -0,0 +1,146 @@
+import frappe
+
+REGISTRY_VERSION_KEY = "bs_space:relationship_registry_version"
+
+# Bidirectional links maintained by the app. Each child table row on `parent_doctype`
+# points through `link_field` to a `link_doctype` record; the other side is either another
+# registered table (`reverse`) or a scalar Link field on the linked record (`reverse_field`).
+# `resave` marks tables the parent derives values from, so parents are re-saved after remove_links.
+RELATIONSHIPS = {
+	"visa_holders": {
+		"parent_doctype": "Customer",
+		"child_doctype": "Visa Holders of Client",
+		"link_field": "visa_holder",
+		"link_doctype": "Linked Individual",
+		"reverse_field": "visa_parent",
+		# the parent's remaining visa quota is computed from this table on validate
+		"resave": True,
+	},
+	"dependents": {
+		"parent_doctype": "Linked Individual",
+		"child_doctype": "Dependents of Individual",
+		"link_field": "dependent",
+		"link_doctype": "Linked Individual",
+		"reverse_field": "visa_parent",
+	},
+	"shareholders": {
+		"parent_doctype": "Customer",
+		"child_doctype": "Shareholders of Client",
+		"link_field": "shareholder",
+		# Dynamic Link: Individual shareholders are Linked Individuals, Corporate ones Customers
+		"link_doctype_field": "shareholder_doctype",
+		"link_doctypes": {"Linked Individual": "owned_companies", "Customer": "sub_companies"},
+	},
+	"owned_companies": {
+		"parent_doctype": "Linked Individual",
+		"child_doctype": "Companies of Individual",
+		"link_field": "company",
+		"link_doctype": "Customer",
+		"reverse": "shareholders",
+	},
+	"sub_companies": {
+		"parent_doctype": "Customer",
+		"child_doctype": "Sub Companies of Client",
+		"link_field": "sub_company",
+		"link_doctype": "Customer",
+		"reverse": "shareholders",
+		"reverse_field": "custom_parent_company",
+	},
+}
+
+_registry = {}
+_registry_version = None
+
+
+def _table_field(parent_doctype, child_doctype):
+	for df in frappe.get_meta(parent_doctype).get_table_fields():
+		if (df.options or "").strip() == child_doctype:
+			return df.fieldname
+	return None
+
+
+def _build_registry():
+	registry = {}
+	for name, spec in RELATIONSHIPS.items():
+		relationship = frappe._dict(spec, name=name)
+		relationship.table_field = _table_field(spec["parent_doctype"], spec["child_doctype"])
+		if not relationship.link_doctypes:
+			relationship.link_doctypes = {spec["link_doctype"]: spec.get("reverse")}
+		registry[name] = relationship
+	return registry
+
+
+def get_relationships() -> dict:
+	"""The resolved registry, built once per worker and rebuilt when a worker sees a new version."""
+	global _registry, _registry_version
+	if not getattr(frappe.local, "bs_relationship_version_checked", False):
+		frappe.local.bs_relationship_version_checked = True
+		version = frappe.cache.get_value(REGISTRY_VERSION_KEY)
+		if version != _registry_version:
+			_registry = {}
+			_registry_version = version
+	if not _registry:
+		_registry = _build_registry()
+	return _registry
+
+
+def get_relationship(name) -> frappe._dict:
+	return get_relationships()[name]
+
+
+def get_table_field(name) -> str | None:
+	"""Fieldname of the relationship's table on its parent (None if the table is not on the form)."""
+	return get_relationship(name).table_field
+
+
+def relationships_linking(doctype) -> list[frappe._dict]:
+	"""Relationships whose rows can point at a `doctype` record."""
+	return [r for r in get_relationships().values() if doctype in r.link_doctypes]
+
+
+def clear_relationship_registry(doc=None, method=None):
+	"""Custom Field / DocType on_update / on_trash: rebuild the registry on every worker."""
+	global _registry
+	_registry = {}
+	frappe.cache.set_value(REGISTRY_VERSION_KEY, frappe.generate_hash(length=10))
+
+
+def find_parents(name, link_value) -> list[str]:
+	"""Parents whose `name` table has a row pointing at `link_value` (one indexed query)."""
+	relationship = get_relationship(name)
+	return frappe.get_all(
+		relationship.child_doctype,
+		filters={
+			relationship.link_field: link_value,
+			"parenttype": relationship.parent_doctype,
+			"parentfield": relationship.table_field,
+		},
+		pluck="parent",
+		distinct=True,
+	)
+
+
+def remove_links(doctype, link_value) -> list[tuple[frappe._dict, str]]:
+	"""
+	Delete every registered child row pointing at a `doctype` record, e.g. before it is deleted.
+	Returns (relationship, parent name) for each parent that lost rows; the rows are removed
+	with a raw delete, so the caller re-saves the parents of `resave` relationships to
+	recompute their derived fields.
+	"""
+	affected = []
+	for relationship in relationships_linking(doctype):
+		if not relationship.table_field:
+			continue
+		filters = {
+			relationship.link_field: link_value,
+			"parenttype": relationship.parent_doctype,
+			"parentfield": relationship.table_field,
+		}
+		if relationship.link_doctype_field:
+			filters[relationship.link_doctype_field] = doctype
+		parents = frappe.get_all(relationship.child_doctype, filters=filters, pluck="parent", distinct=True)
+		if not parents:
+			continue
+		frappe.db.delete(relationship.child_doctype, filters)
+		affected.extend((relationship, parent) for parent in parents)
+	return affected
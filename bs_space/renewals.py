@@ -0,0 +1,398 @@
+import frappe
+from frappe import _
+from frappe.utils import add_days, cint, getdate, now, today
+
+from bs_space.bulk_naming import get_series, reserve_names
+from bs_space.job_runs import track, tracked_job
+from bs_space.streaming import iter_keyset
+
+# entities handled per transaction
+CHUNK_SIZE = 100
+# days ahead of today an expiry is picked up; override with `bs_renewal_window_days` in site_config
+DEFAULT_WINDOW_DAYS = 60
+
+# kind: what expires and the Task Type of the Project Template that renews it. A template
+# can also be pinned per kind with `bs_renewal_templates` in site_config.
+RENEWAL_SOURCES = {
+	"Licence": frappe._dict(
+		doctype="Customer",
+		expiry_field="custom_license_expiry_date",
+		title_field="customer_name",
+		task_type="Licence Renewal",
+		conditions="e.disabled = 0",
+	),
+	"Visa": frappe._dict(
+		doctype="Linked Individual",
+		expiry_field="visa_expiry_date",
+		title_field="full_name",
+		task_type="Visa Renewal",
+		conditions="e.enabled = 1 and e.has_visa = 1",
+	),
+}
+
+TEMPLATE_TASK_FIELDS = (
+	"name",
+	"subject",
+	"description",
+	"type",
+	"is_group",
+	"task_weight",
+	"priority",
+	"color",
+	"start",
+	"duration",
+	"parent_task",
+	"custom_has_payment",
+	"custom_entity_associated",
+)
+
+
+def get_window_days():
+	return cint(frappe.conf.get("bs_renewal_window_days")) or DEFAULT_WINDOW_DAYS
+
+
+def get_template(kind):
+	"""Project Template used for `kind` renewals (None when none is set up)."""
+	pinned = (frappe.conf.get("bs_renewal_templates") or {}).get(kind)
+	if pinned:
+		return pinned
+	return frappe.db.get_value(
+		"Project Template",
+		{"custom_task_type": RENEWAL_SOURCES[kind].task_type},
+		"name",
+		order_by="modified desc",
+	)
+
+
+def get_due_renewals(kind, until, after="", limit=None):
+	"""
+	Entities of `kind` expiring between today and `until`, in one indexed query. Skips those
+	with an open renewal project or one already raised (and maybe cancelled) for this expiry.
+	`after` / `limit` page through them by name (see bs_space.streaming.iter_keyset).
+	"""
+	source = RENEWAL_SOURCES[kind]
+	customer = (
+		"e.name" if source.doctype == "Customer" else "if(e.parent_type = 'Customer', e.visa_parent, null)"
+	)
+	return frappe.db.sql(
+		f"""
+		select e.name, e.`{source.title_field}` as title, e.`{source.expiry_field}` as expiry_date,
+			{customer} as customer
+		from `tab{source.doctype}` e
+		where e.`{source.expiry_field}` between %(today)s and %(until)s and {source.conditions}
+			and e.name > %(after)s
+			and not exists (
+				select 1 from `tabProject` p
+				where p.custom_renewal_of = %(doctype)s and p.custom_renewal_for = e.name
+					and (p.status = 'Open' or p.custom_renewal_expiry_date = e.`{source.expiry_field}`)
+			)
+		order by e.name
+		{"limit %(limit)s" if limit else ""}
+		""",
+		{
+			"today": today(),
+			"until": until,
+			"doctype": source.doctype,
+			"after": after or "",
+			"limit": cint(limit),
+		},
+		as_dict=True,
+	)
+
+
+# ---- generation ----
+
+
+def _template_tasks(template):
+	names = frappe.get_all(
+		"Project Template Task",
+		filters={"parent": template, "parenttype": "Project Template"},
+		pluck="task",
+		order_by="idx",
+	)
+	tasks = {
+		t.name: t
+		for t in frappe.get_all("Task", filters={"name": ["in", names]}, fields=TEMPLATE_TASK_FIELDS)
+	}
+	depends_on = {}
+	for row in frappe.get_all(
+		"Task Depends On", filters={"parent": ["in", names], "parenttype": "Task"}, fields=["parent", "task"]
+	):
+		depends_on.setdefault(row.parent, []).append(row.task)
+	return [tasks[n] for n in names if n in tasks], depends_on
+
+
+def _template_bounds(template_tasks):
+	"""{template task: (lft, rgt)} of one copy of the template's task forest, numbered from 1."""
+	names = {t.name for t in template_tasks}
+	children, roots = {}, []
+	for t in template_tasks:
+		if t.parent_task in names:
+			children.setdefault(t.parent_task, []).append(t.name)
+		else:
+			roots.append(t.name)
+
+	bounds, counter = {}, 0
+
+	def visit(name):
+		nonlocal counter
+		counter += 1
+		lft = counter
+		for child in children.get(name, ()):
+			visit(child)
+		counter += 1
+		bounds[name] = (lft, counter)
+
+	for root in roots:
+		visit(root)
+	return bounds
+
+
+def _reserve_task_bounds(width):
+	"""
+	Highest rgt of the Task tree, locked until the chunk commits: the new subtrees go after it
+	as new roots, so no existing node has to move and concurrent Task inserts wait for the chunk.
+	"""
+	return cint(frappe.db.sql("select max(rgt) from `tabTask` for update")[0][0]) if width else 0
+
+
+def _insert_chunk(kind, template, entities, company, by_project_name):
+	source = RENEWAL_SOURCES[kind]
+	template_tasks, depends_on = _template_tasks(template)
+	project_type = frappe.db.get_value("Project Template", template, "project_type")
+	timestamp, user = now(), frappe.session.user
+	start_date = getdate(today())
+
+	projects = []
+	for e in entities:
+		project_name = f"{_(kind)} renewal - {e.title or e.name} ({e.name}, {e.expiry_date})"
+		projects.append(
+			frappe._dict(
+				project_name=project_name[:140],
+				customer=e.customer,
+				expected_start_date=start_date,
+				expected_end_date=max(getdate(e.expiry_date), start_date),
+				custom_renewal_for=e.name,
+				custom_renewal_expiry_date=e.expiry_date,
+			)
+		)
+	if by_project_name:
+		names = [p.project_name for p in projects]
+	else:
+		names = reserve_names(get_series("Project"), len(projects))
+
+	frappe.db.bulk_insert(
+		"Project",
+		[
+			"name",
+			"project_name",
+			"project_template",
+			"project_type",
+			"status",
+			"is_active",
+			"percent_complete_method",
+			"customer",
+			"company",
+			"expected_start_date",
+			"expected_end_date",
+			"custom_renewal_of",
+			"custom_renewal_for",
+			"custom_renewal_expiry_date",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"docstatus",
+		],
+		[
+			(
+				name,
+				p.project_name,
+				template,
+				project_type,
+				"Open",
+				"Yes",
+				"Task Completion",
+				p.customer,
+				company,
+				p.expected_start_date,
+				p.expected_end_date,
+				source.doctype,
+				p.custom_renewal_for,
+				p.custom_renewal_expiry_date,
+				timestamp,
+				timestamp,
+				user,
+				user,
+				0,
+			)
+			for name, p in zip(names, projects, strict=True)
+		],
+	)
+
+	task_names = reserve_names(get_series("Task"), len(projects) * len(template_tasks))
+	# every project gets a contiguous copy of the template's lft / rgt ranges after the current tree
+	bounds = _template_bounds(template_tasks)
+	per_project = len(template_tasks)
+	width = 2 * per_project
+	base = _reserve_task_bounds(width * len(projects))
+	task_rows, dependency_rows = [], []
+	for i, (project, p) in enumerate(zip(names, projects, strict=True)):
+		reserved = task_names[i * per_project : (i + 1) * per_project]
+		new_names = {t.name: name for t, name in zip(template_tasks, reserved, strict=True)}
+		offset = base + i * width
+		for t in template_tasks:
+			exp_start = add_days(p.expected_start_date, cint(t.start))
+			lft, rgt = bounds[t.name]
+			task_rows.append(
+				(
+					new_names[t.name],
+					t.subject,
+					project,
+					"Open",
+					t.priority,
+					t.type,
+					t.is_group,
+					t.task_weight,
+					t.description,
+					t.color,
+					exp_start,
+					add_days(exp_start, cint(t.duration)),
+					new_names.get(t.parent_task),
+					new_names.get(t.parent_task),
+					offset + lft,
+					offset + rgt,
+					t.name,
+					company,
+					t.custom_has_payment,
+					t.custom_entity_associated,
+					timestamp,
+					timestamp,
+					user,
+					user,
+					0,
+				)
+			)
+			for idx, dependency in enumerate(depends_on.get(t.name, ()), 1):
+				if dependency in new_names:
+					dependency_rows.append(
+						(
+							frappe.generate_hash(length=10),
+							new_names[t.name],
+							"Task",
+							"depends_on",
+							idx,
+							new_names[dependency],
+							project,
+							timestamp,
+							timestamp,
+							user,
+							user,
+							0,
+						)
+					)
+
+	frappe.db.bulk_insert(
+		"Task",
+		[
+			"name",
+			"subject",
+			"project",
+			"status",
+			"priority",
+			"type",
+			"is_group",
+			"task_weight",
+			"description",
+			"color",
+			"exp_start_date",
+			"exp_end_date",
+			"parent_task",
+			"old_parent",
+			"lft",
+			"rgt",
+			"template_task",
+			"company",
+			"custom_has_payment",
+			"custom_entity_associated",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"docstatus",
+		],
+		task_rows,
+	)
+	frappe.db.bulk_insert(
+		"Task Depends On",
+		[
+			"name",
+			"parent",
+			"parenttype",
+			"parentfield",
+			"idx",
+			"task",
+			"project",
+			"creation",
+			"modified",
+			"owner",
+			"modified_by",
+			"docstatus",
+		],
+		dependency_rows,
+	)
+	return names
+
+
+def generate_renewals(window_days=None, kinds=None):
+	"""
+	Create a renewal Project (with the tasks of its template) for every licence and visa
+	expiring within the window that has no open renewal yet. Rows are written with multi-row
+	inserts and committed per chunk of CHUNK_SIZE entities, so Project / Task controller hooks
+	do not run for generated records. Each chunk appends its task subtrees after the highest
+	rgt, read under a lock held until the chunk commits, so the Task tree is never rebuilt.
+	Returns the number of projects created.
+	"""
+	until = add_days(today(), cint(window_days) or get_window_days())
+	company = frappe.defaults.get_user_default("Company") or frappe.db.get_single_value(
+		"Global Defaults", "default_company"
+	)
+	by_project_name = frappe.db.get_single_value("Projects Settings", "project_naming_by") == "Project Name"
+
+	created = 0
+	for kind in kinds or RENEWAL_SOURCES:
+		template = get_template(kind)
+		if not template:
+			frappe.log_error(
+				_("No Project Template with Task Type {0}").format(RENEWAL_SOURCES[kind].task_type),
+				title=_("{0} renewals skipped").format(_(kind)),
+			)
+			track(errors=1)
+			continue
+
+		# one chunk of due entities in memory at a time, committed once its projects are written
+		for chunk in iter_keyset(
+			lambda after, limit, kind=kind: get_due_renewals(kind, until, after, limit),
+			CHUNK_SIZE,
+			commit=True,
+		):
+			track(scanned=len(chunk))
+			created += len(_insert_chunk(kind, template, chunk, company, by_project_name))
+			track(updated=len(chunk))
+
+	return created
+
+
+@tracked_job()
+def generate_due_renewals(window_days=None):
+	"""Daily: renewal projects for licences and visas entering the renewal window."""
+	generate_renewals(window_days)
+
+
+@frappe.whitelist()
+def enqueue_generate_renewals(window_days=None):
+	frappe.only_for(("Projects Manager", "System Manager"))
+	frappe.has_permission("Project", "create", throw=True)
+	frappe.enqueue(
+		"bs_space.renewals.generate_due_renewals", queue="long", timeout=3600, window_days=window_days
+	)
@@ -0,0 +1,197 @@
+import functools
+import time
+from contextlib import contextmanager
+
+import frappe
+from frappe.utils import cint, flt
+
+# site_config: `bs_read_from_replica: 1` turns routing on; the replica is reached with
+# Frappe's own keys (replica_host, replica_db_port, different_credentials_for_replica,
+# replica_db_name, replica_db_password). `bs_replica_max_lag` is the staleness tolerance.
+DEFAULT_MAX_LAG = 300
+HEARTBEAT_KEY = "bs_replica_heartbeat"
+DOWN_KEY = "bs_space:replica_down"
+# after a failed connection or lag check every worker stays on the primary this long
+RETRY_AFTER = 60
+# MariaDB client errors meaning the server went away (can't connect / gone away / lost)
+CONNECTION_ERRORS = (2003, 2006, 2013)
+
+
+def is_enabled():
+	return bool(cint(frappe.conf.get("bs_read_from_replica")) and frappe.conf.get("replica_host"))
+
+
+def get_max_lag():
+	return flt(frappe.conf.get("bs_replica_max_lag")) or DEFAULT_MAX_LAG
+
+
+# ---- heartbeat ----
+
+
+def write_heartbeat():
+	"""Every minute on the primary: the replica's copy of this timestamp measures its lag."""
+	if not is_enabled():
+		return
+	value = str(time.time())
+	if frappe.db.get_global(HEARTBEAT_KEY):
+		# plain update: set_global would also flush the cached global defaults every minute
+		frappe.db.sql(
+			"update `tabDefaultValue` set defvalue = %s where parent = '__global' and defkey = %s",
+			(value, HEARTBEAT_KEY),
+		)
+	else:
+		frappe.db.set_global(HEARTBEAT_KEY, value)
+	frappe.db.commit()
+
+
+def get_lag(db):
+	"""Seconds since the newest heartbeat visible on `db` (None when there is none)."""
+	value = db.sql(
+		"select defvalue from `tabDefaultValue` where parent = '__global' and defkey = %s", HEARTBEAT_KEY
+	)
+	if not value:
+		return None
+	return max(0.0, time.time() - flt(value[0][0]))
+
+
+# ---- connection ----
+
+
+def _connect():
+	from frappe.database import get_db
+
+	conf = frappe.conf
+	user, password = conf.db_name, conf.db_password
+	if conf.different_credentials_for_replica:
+		user, password = conf.replica_db_name, conf.replica_db_password
+	db = get_db(host=conf.replica_host, user=user, password=password, port=conf.replica_db_port)
+	db.connect()
+	# a write sent here by mistake fails instead of diverging the replica
+	db.sql("set session transaction read only")
+	return db
+
+
+def _mark_down(reason):
+	frappe.cache.set_value(DOWN_KEY, reason, expires_in_sec=RETRY_AFTER)
+
+
+def get_replica(max_lag=None):
+	"""A connection to the replica if it is reachable and no staler than `max_lag`, else None."""
+	if not is_enabled() or frappe.cache.get_value(DOWN_KEY):
+		return None
+	max_lag = flt(max_lag) or get_max_lag()
+	try:
+		db = _connect()
+		lag = get_lag(db)
+	except Exception as e:
+		_mark_down(f"connection failed: {e}")
+		frappe.log_error(title="Read replica unavailable, reading from the primary")
+		return None
+
+	if lag is None or lag > max_lag:
+		db.close()
+		if lag is None or lag > get_max_lag():
+			_mark_down(f"lag {lag}")
+		return None
+	return db
+
+
+def _on_replica():
+	return getattr(frappe.local, "bs_primary_db", None) is not None or (
+		getattr(frappe.local, "primary_db", None) is not None
+		and frappe.local.db is not frappe.local.primary_db
+	)
+
+
+@contextmanager
+def replica_reads(max_lag=None):
+	"""
+	Route frappe.db to the replica for the block when it is healthy; otherwise stay on the
+	primary. Yields whether the replica is used. Nested blocks reuse the outer connection.
+	"""
+	if _on_replica():
+		yield True
+		return
+	replica = get_replica(max_lag)
+	if not replica:
+		yield False
+		return
+
+	primary = frappe.local.db
+	frappe.local.bs_primary_db = primary
+	frappe.local.db = replica
+	try:
+		yield True
+	finally:
+		frappe.local.db = primary
+		frappe.local.bs_primary_db = None
+		replica.close()
+
+
+@contextmanager
+def primary_writes():
+	"""Switch back to the primary inside a replica_reads block, e.g. to log or save something."""
+	primary = getattr(frappe.local, "bs_primary_db", None)
+	if primary is None:
+		yield
+		return
+	replica = frappe.local.db
+	frappe.local.db = primary
+	try:
+		yield
+	finally:
+		frappe.local.db = replica
+
+
+def _is_connection_error(e):
+	return bool(e.args) and e.args[0] in CONNECTION_ERRORS
+
+
+def read_from_replica(max_lag=None):
+	"""
+	Decorator for read-only methods, reports and jobs: run on the replica when it is healthy,
+	on the primary otherwise. A replica that drops the connection midway is marked down and
+	the call is run again on the primary. Not for code that fills a shared cache or an ETag:
+	a read up to max_lag seconds old would be stored as current.
+	"""
+
+	def decorator(fn):
+		@functools.wraps(fn)
+		def wrapper(*args, **kwargs):
+			nested, on_replica = _on_replica(), False
+			try:
+				with replica_reads(max_lag) as on_replica:
+					return fn(*args, **kwargs)
+			except Exception as e:
+				if nested or not on_replica or not _is_connection_error(e):
+					raise
+				_mark_down(f"connection lost: {e}")
+			return fn(*args, **kwargs)
+
+		return wrapper
+
+	return decorator
+
+
+def get_status():
+	"""Routing state for `bench bs-replica-status`."""
+	status = frappe._dict(
+		enabled=is_enabled(),
+		replica_host=frappe.conf.get("replica_host"),
+		max_lag=get_max_lag(),
+		down=frappe.cache.get_value(DOWN_KEY),
+		primary_heartbeat=frappe.db.get_global(HEARTBEAT_KEY),
+		lag=None,
+		error=None,
+	)
+	if status.replica_host:
+		try:
+			db = _connect()
+			status.lag = get_lag(db)
+			db.close()
+		except Exception as e:
+			status.error = str(e)
+	status.routed = bool(
+		status.enabled and not status.down and status.lag is not None and status.lag <= status.max_lag
+	)
+	return status
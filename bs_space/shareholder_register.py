@@ -0,0 +1,196 @@
+import csv
+import os
+
+import frappe
+from frappe import _
+from frappe.utils import cint, now_datetime
+
+from bs_space.relationships import get_relationship
+from bs_space.replica import replica_reads
+from bs_space.streaming import iter_query
+
+EXPORT_FOLDER = "registers"
+FILE_FORMATS = ("CSV", "XLSX")
+REALTIME_EVENT = "bs_space_register_export"
+
+COLUMNS = (
+	("customer", "Client"),
+	("customer_name", "Client Name"),
+	("legal_authority", "Legal Authority"),
+	("customer_group", "Customer Group"),
+	("parent_company", "Parent Company"),
+	("shareholder_type", "Shareholder Type"),
+	("shareholder", "Shareholder"),
+	("shareholder_name", "Shareholder Name"),
+	("shareholding_pct", "Shareholding %"),
+	("is_shareholder", "Shareholder"),
+	("is_directormanager", "Director / Manager"),
+	("is_ubo", "UBO"),
+	("is_signatory", "Signatory"),
+	("nationality", "Nationality"),
+	("passport_number", "Passport Number"),
+	("passport_expiry_date", "Passport Expiry"),
+	("emirates_id_number", "Emirates ID"),
+	("emirates_id_expiry_date", "Emirates ID Expiry"),
+)
+
+FILTER_COLUMNS = {
+	"legal_authority": "c.custom_legal_authority",
+	"customer_group": "c.customer_group",
+	"parent_company": "c.custom_parent_company",
+}
+
+
+def _permitted(alias, doctype, user):
+	"""Restrict `alias` to the `doctype` records `user` may read (user permissions / match conditions)."""
+	from frappe.desk.reportview import build_match_conditions
+
+	match = build_match_conditions(doctype, user=user, as_condition=True)
+	if not match:
+		return None
+	return f"{alias}.name in (select `tab{doctype}`.name from `tab{doctype}` where {match})"
+
+
+def _register_query(filters, user=None):
+	conditions, values = ["c.disabled = 0"], {}
+	if customer_match := _permitted("c", "Customer", user):
+		conditions.append(customer_match)
+	if individual_match := _permitted("li", "Linked Individual", user):
+		conditions.append(f"(li.name is null or {individual_match})")
+	for key, column in FILTER_COLUMNS.items():
+		value = filters.get(key)
+		if not value:
+			continue
+		if isinstance(value, list | tuple):
+			conditions.append(f"{column} in %({key})s")
+			values[key] = tuple(value)
+		else:
+			conditions.append(f"{column} = %({key})s")
+			values[key] = value
+	if cint(filters.get("ubo_only")):
+		conditions.append("s.is_ubo = 1")
+
+	rel = get_relationship("shareholders")
+	values.update(parenttype=rel.parent_doctype, parentfield=rel.table_field)
+
+	query = f"""
+		select c.name as customer, c.customer_name, c.custom_legal_authority as legal_authority,
+			c.customer_group, c.custom_parent_company as parent_company,
+			s.shareholder_type, s.shareholder,
+			coalesce(li.full_name, corp.customer_name, s.shareholder) as shareholder_name,
+			s.shareholding_pct, s.is_shareholder, s.is_directormanager, s.is_ubo, s.is_signatory,
+			li.nationality, li.passport_number, li.passport_expiry_date,
+			li.emirates_id_number, li.emirates_id_expiry_date
+		from `tab{rel.child_doctype}` s
+		join `tabCustomer` c on c.name = s.parent
+		left join `tabLinked Individual` li
+			on s.shareholder_type = 'Individual' and li.name = s.shareholder
+		left join `tabCustomer` corp
+			on s.shareholder_type = 'Corporate' and corp.name = s.shareholder
+		where s.parenttype = %(parenttype)s and s.parentfield = %(parentfield)s
+			and {" and ".join(conditions)}
+		order by c.name, s.idx
+	"""
+	return query, values
+
+
+def iter_register_rows(filters, user=None):
+	"""
+	Register rows `user` (default: the session user) may read, as tuples streamed from an
+	unbuffered (server-side) cursor on the replica if healthy.
+	"""
+	query, values = _register_query(filters, user or frappe.session.user)
+	with replica_reads():
+		for batch in iter_query(query, values):
+			yield from batch
+
+
+class _CSVWriter:
+	def __init__(self, path):
+		self.file = open(path, "w", newline="", encoding="utf-8-sig")
+		self.writer = csv.writer(self.file)
+
+	def write(self, row):
+		self.writer.writerow(row)
+
+	def close(self):
+		self.file.close()
+
+
+class _XLSXWriter:
+	"""openpyxl write-only mode streams rows to disk instead of keeping the sheet in memory."""
+
+	def __init__(self, path):
+		from openpyxl import Workbook
+
+		self.path = path
+		self.workbook = Workbook(write_only=True)
+		self.sheet = self.workbook.create_sheet(_("Shareholder Register"))
+
+	def write(self, row):
+		self.sheet.append(row)
+
+	def close(self):
+		self.workbook.save(self.path)
+
+
+def write_register(path, filters, file_format="CSV", user=None):
+	writer = (_XLSXWriter if file_format == "XLSX" else _CSVWriter)(path)
+	count = 0
+	try:
+		writer.write([_(label) for _fieldname, label in COLUMNS])
+		for row in iter_register_rows(filters, user):
+			writer.write(list(row))
+			count += 1
+	finally:
+		writer.close()
+	return count
+
+
+def build_register(filters=None, file_format="CSV", user=None):
+	"""Background job: write the register to a private file and tell the requesting user."""
+	filters = frappe.parse_json(filters) if isinstance(filters, str) else (filters or {})
+	file_name = f"shareholder-register-{now_datetime():%Y%m%d-%H%M%S}.{file_format.lower()}"
+	folder = frappe.get_site_path("private", "files", EXPORT_FOLDER)
+	os.makedirs(folder, exist_ok=True)
+
+	# the job runs as Administrator: rows are restricted to what the requester may read
+	count = write_register(os.path.join(folder, file_name), filters, file_format, user)
+	file_doc = frappe.get_doc(
+		{
+			"doctype": "File",
+			"file_name": file_name,
+			"file_url": f"/private/files/{EXPORT_FOLDER}/{file_name}",
+			"is_private": 1,
+		}
+	)
+	file_doc.flags.ignore_permissions = True
+	file_doc.insert()
+	if user:
+		# the File is owned by the requester so only they (and admins) can download it
+		file_doc.db_set("owner", user)
+	frappe.db.commit()
+
+	frappe.publish_realtime(
+		REALTIME_EVENT, {"file_url": file_doc.file_url, "rows": count}, user=user or frappe.session.user
+	)
+	return file_doc.file_url
+
+
+@frappe.whitelist()
+def export_register(filters=None, file_format="CSV"):
+	"""Queue a shareholder / UBO register export; the file link is pushed over realtime when ready."""
+	frappe.has_permission("Customer", "export", throw=True)
+	frappe.has_permission("Linked Individual", "read", throw=True)
+	if file_format not in FILE_FORMATS:
+		frappe.throw(_("Format must be one of {0}").format(", ".join(FILE_FORMATS)))
+
+	job = frappe.enqueue(
+		"bs_space.shareholder_register.build_register",
+		queue="long",
+		timeout=2 * 3600,
+		filters=frappe.parse_json(filters) if isinstance(filters, str) else filters,
+		file_format=file_format,
+		user=frappe.session.user,
+	)
+	return {"job_id": job.id if job else None}
@@ -0,0 +1,111 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+from itertools import islice
+
+import frappe
+from frappe.utils import cint
+
+DEFAULT_BATCH_SIZE = 1000
+ALIAS = re.compile(r"\s+as\s+`?(\w+)`?\s*$", re.IGNORECASE)
+
+
+def _get(self, key, default=None):
+	return getattr(self, key, default)
+
+
+@lru_cache(maxsize=256)
+def _row_type(columns):
+	"""A namedtuple class (no per-row dict) that also answers `row.get(field)` like frappe._dict."""
+	return type("Row", (namedtuple("Row", columns),), {"__slots__": (), "get": _get})
+
+
+def _column(field):
+	"""Attribute name of a get_all field: its alias, or the bare fieldname."""
+	match = ALIAS.search(field)
+	return match.group(1) if match else field.strip("` ").rsplit(".", 1)[-1].strip("`")
+
+
+def _as_filter_list(filters):
+	if not filters:
+		return []
+	if isinstance(filters, dict):
+		return [
+			[fieldname, *value] if isinstance(value, list | tuple) else [fieldname, "=", value]
+			for fieldname, value in filters.items()
+		]
+	return list(filters)
+
+
+def iter_keyset(fetch, batch_size=DEFAULT_BATCH_SIZE, key="name", commit=False, progress=None):
+	"""
+	Batches from `fetch(after, limit)`, which must return up to `limit` rows whose `key` is
+	greater than `after`, ordered by `key`. Only one batch is held at a time and no OFFSET is
+	used, so memory and per-batch cost stay flat however large the table is. The next batch
+	is read when the caller is done with the current one. At that point the transaction is
+	committed if `commit` is set, and `progress(rows_in_batch, rows_so_far)` is called.
+	"""
+	batch_size = cint(batch_size) or DEFAULT_BATCH_SIZE
+	after, done = "", 0
+	while True:
+		batch = fetch(after, batch_size)
+		if not batch:
+			return
+		yield batch
+		done += len(batch)
+		if commit:
+			frappe.db.commit()
+		if progress:
+			progress(len(batch), done)
+		if len(batch) < batch_size:
+			return
+		after = getattr(batch[-1], key)
+
+
+def iter_batches(
+	doctype, fields=("name",), filters=None, batch_size=DEFAULT_BATCH_SIZE, commit=False, progress=None
+):
+	"""
+	Records of `doctype` matching `filters`, in name order, as lists of lightweight Row
+	namedtuples with one attribute per field. Rows are paginated on name (see iter_keyset).
+	Rows the caller changes between batches are neither skipped nor repeated.
+	"""
+	fields = list(fields)
+	if "name" not in fields:
+		fields.append("name")
+	row_type = _row_type(tuple(_column(f) for f in fields))
+	conditions = _as_filter_list(filters)
+
+	def fetch(after, limit):
+		rows = frappe.get_all(
+			doctype,
+			filters=[*conditions, ["name", ">", after]],
+			fields=fields,
+			order_by="name asc",
+			limit_page_length=limit,
+			as_list=True,
+		)
+		return [row_type(*row) for row in rows]
+
+	return iter_keyset(fetch, batch_size, commit=commit, progress=progress)
+
+
+def iter_rows(
+	doctype, fields=("name",), filters=None, batch_size=DEFAULT_BATCH_SIZE, commit=False, progress=None
+):
+	"""iter_batches, flattened to one Row at a time."""
+	for batch in iter_batches(doctype, fields, filters, batch_size, commit, progress):
+		yield from batch
+
+
+def iter_query(query, values=None, batch_size=DEFAULT_BATCH_SIZE):
+	"""
+	Batches of tuples from a read-only query, streamed through an unbuffered (server-side)
+	cursor. The connection can run no other query until the iterator is exhausted or closed,
+	so use iter_keyset when the caller writes between batches.
+	"""
+	batch_size = cint(batch_size) or DEFAULT_BATCH_SIZE
+	with frappe.db.unbuffered_cursor():
+		rows = iter(frappe.db.sql(query, values, as_iterator=True))
+		while batch := list(islice(rows, batch_size)):
+			yield batch
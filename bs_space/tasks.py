@@ -1,21 +1,28 @@
 import frappe
-from frappe.utils import today, getdate
+from frappe.utils import getdate, today
 
+from bs_space.job_runs import track, tracked_job
+from bs_space.streaming import iter_batches
+
+
+@tracked_job()
 def update_all_license_statuses():
     """Properly update license status with correct date comparison"""
-    customers = frappe.get_all("Customer", 
-        fields=["name", "custom_license_expiry_date", "custom_license_expiry_notifications"])
-    
     current_date = getdate(today())  # Get date object for comparison
-    
-    for c in customers:
-        if not c.custom_license_expiry_notifications:
-            continue
-            
-        if not c.custom_license_expiry_date:
-            continue
-            
-        expiry_date = getdate(c.custom_license_expiry_date)  # Convert to date object
-        status = "Expired" if expiry_date < current_date else "Active"
-        
-        frappe.db.set_value("Customer", c.name, "custom_status", status)
\ No newline at end of file
+
+    # streamed in batches, committed per batch, so memory does not grow with the client book
+    for batch in iter_batches(
+        "Customer",
+        fields=["name", "custom_license_expiry_date", "custom_status"],
+        filters={"custom_license_expiry_notifications": 1, "custom_license_expiry_date": ["is", "set"]},
+        commit=True,
+        progress=lambda count, done: track(scanned=count),
+    ):
+        for c in batch:
+            expiry_date = getdate(c.custom_license_expiry_date)  # Convert to date object
+            status = "Expired" if expiry_date < current_date else "Active"
+            if status == c.custom_status:
+                continue
+
+            frappe.db.set_value("Customer", c.name, "custom_status", status)
+            track(updated=1)
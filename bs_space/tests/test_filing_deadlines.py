@@ -0,0 +1,50 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import getdate
+
+from bs_space.filing_deadlines import project_deadlines
+
+
+def _periods(rows):
+	return [(str(r.period_start), str(r.period_end), str(r.due_date)) for r in rows]
+
+
+class TestProjectDeadlines(FrappeTestCase):
+	def test_quarterly_vat_from_registration(self):
+		rows = project_deadlines("C", "VAT", "2025-01-15", "Quarterly", None, getdate("2026-05-01"), 2)
+		self.assertEqual(
+			_periods(rows),
+			[
+				("2026-04-01", "2026-06-30", "2026-07-28"),
+				("2026-07-01", "2026-09-30", "2026-10-28"),
+			],
+		)
+
+	def test_overdue_periods_after_the_last_filing_are_kept(self):
+		rows = project_deadlines(
+			"C", "VAT", "2025-01-15", "Quarterly", "2026-01-28", getdate("2026-05-01"), 1
+		)
+		# Q1 2026 was due on 28 April and not filed yet; it does not count towards `count`
+		self.assertEqual(
+			_periods(rows),
+			[
+				("2026-01-01", "2026-03-31", "2026-04-28"),
+				("2026-04-01", "2026-06-30", "2026-07-28"),
+			],
+		)
+
+	def test_monthly_vat(self):
+		rows = project_deadlines("C", "VAT", "2024-06-03", "Monthly", None, getdate("2026-02-15"), 3)
+		self.assertEqual([str(r.due_date) for r in rows], ["2026-02-28", "2026-03-28", "2026-04-28"])
+
+	def test_corporate_tax_due_nine_months_after_year_end(self):
+		rows = project_deadlines("C", "Corporate Tax", "2024-03-10", None, None, getdate("2026-01-01"), 1)
+		self.assertEqual(_periods(rows), [("2025-03-01", "2026-02-28", "2026-11-30")])
+
+	def test_names_are_stable(self):
+		first = project_deadlines("C", "VAT", "2025-01-15", "Monthly", None, getdate("2026-05-01"), 2)
+		again = project_deadlines("C", "VAT", "2025-01-15", "Monthly", None, getdate("2026-05-01"), 2)
+		self.assertEqual([r.name for r in first], [r.name for r in again])
+		self.assertEqual(len({r.name for r in first}), 2)
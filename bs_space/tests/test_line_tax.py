@@ -0,0 +1,44 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from bs_space.line_tax import STANDARD_VAT_RATE, compute_line, get_tax_rate
+
+
+def _flags(tax_code=None, is_zero_rated=0, is_exempt=0):
+	return frappe._dict(tax_code=tax_code, is_zero_rated=is_zero_rated, is_exempt=is_exempt)
+
+
+def _tax(account_head, rate, charge_type="On Net Total"):
+	return frappe._dict(account_head=account_head, rate=rate, charge_type=charge_type)
+
+
+class TestGetTaxRate(FrappeTestCase):
+	def test_taxes_present(self):
+		taxes = [_tax("VAT - T", 5), _tax("Levy - T", 2), _tax("Freight - T", 10, "Actual")]
+		self.assertEqual(get_tax_rate(_flags("ZR"), taxes=taxes), 7)
+		# the line's Item Tax Template rate wins over the document row
+		self.assertEqual(get_tax_rate(_flags(), '{"VAT - T": 0}', taxes), 2)
+		self.assertEqual(get_tax_rate(_flags(is_exempt=1), taxes=taxes), 0)
+
+	def test_tax_code_only(self):
+		self.assertEqual(get_tax_rate(_flags(" zr ")), 0)
+		self.assertEqual(get_tax_rate(_flags("RC")), STANDARD_VAT_RATE)
+		self.assertEqual(get_tax_rate(_flags()), STANDARD_VAT_RATE)
+		self.assertEqual(get_tax_rate(None), STANDARD_VAT_RATE)
+		self.assertEqual(get_tax_rate(_flags("SR", is_zero_rated=1)), 0)
+
+	def test_unknown_tax_code_falls_back_to_standard_rate(self):
+		frappe.flags.bs_unknown_tax_codes = None
+		with patch("bs_space.line_tax.frappe.msgprint") as msgprint:
+			self.assertEqual(get_tax_rate(_flags("XX")), STANDARD_VAT_RATE)
+			self.assertEqual(get_tax_rate(_flags("xx")), STANDARD_VAT_RATE)
+		msgprint.assert_called_once()
+
+	def test_compute_line(self):
+		self.assertEqual(compute_line(100.05, 5.0, 2), (5.0, 105.05))
+		self.assertEqual(compute_line(None, 5.0, 2), (0.0, 0.0))
@@ -0,0 +1,33 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import get_datetime
+
+from bs_space.outbox import _settled
+
+UNTIL = get_datetime("2026-05-01 10:00:00")
+OLD = get_datetime("2026-05-01 09:59:00")
+NEW = get_datetime("2026-05-01 10:00:05")
+
+
+def _events(*events):
+	return [frappe._dict(name=name, creation=creation) for name, creation in events]
+
+
+class TestSettled(FrappeTestCase):
+	def test_contiguous_events_are_settled(self):
+		events = _events((5, NEW), (6, NEW), (7, NEW))
+		self.assertEqual(_settled(events, 4, UNTIL), events)
+
+	def test_stops_at_a_recent_gap(self):
+		events = _events((5, OLD), (6, OLD), (8, NEW), (9, NEW))
+		# 7 may still be committed by a slower transaction
+		self.assertEqual(_settled(events, 4, UNTIL), events[:2])
+		self.assertEqual(_settled(events[2:], 6, UNTIL), [])
+
+	def test_old_gaps_are_skipped(self):
+		# a gap older than the settle window is a rolled back transaction
+		events = _events((5, OLD), (7, OLD), (8, NEW))
+		self.assertEqual(_settled(events, 4, UNTIL), events)
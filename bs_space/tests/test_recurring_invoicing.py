@@ -0,0 +1,144 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+from unittest.mock import MagicMock, patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import getdate
+
+from bs_space.recurring_invoicing import (
+	SERVICE_FIELD,
+	SERVICE_ITEM_TYPE,
+	SERVICE_TABLE,
+	get_due_services,
+	get_unbilled_periods,
+	invoice_customers,
+)
+
+POSTING_DATE = "2026-05-01"
+
+
+def _make_item(item_code):
+	if not frappe.db.exists("Item", item_code):
+		frappe.get_doc(
+			{
+				"doctype": "Item",
+				"item_code": item_code,
+				"item_group": "All Item Groups",
+				"stock_uom": "Nos",
+				"is_stock_item": 0,
+				"custom_item_type": SERVICE_ITEM_TYPE,
+			}
+		).insert(ignore_permissions=True)
+	return item_code
+
+
+def _make_customer(customer_name, services):
+	customer = frappe.get_doc(
+		{
+			"doctype": "Customer",
+			"customer_name": customer_name,
+			"customer_group": "All Customer Groups",
+			"territory": "All Territories",
+		}
+	)
+	for service in services:
+		customer.append(SERVICE_FIELD, service)
+	return customer.insert(ignore_permissions=True)
+
+
+def _line(**values):
+	return frappe._dict({"end_date": None, "last_invoiced_period": None, **values})
+
+
+class TestRecurringInvoicing(FrappeTestCase):
+	@classmethod
+	def setUpClass(cls):
+		super().setUpClass()
+		cls.item = _make_item("_Test Recurring Bookkeeping")
+
+	def test_unbilled_periods_catch_up_from_last_invoiced(self):
+		line = _line(frequency="Monthly", start_date="2026-01-15", last_invoiced_period="2026-02-01")
+		self.assertEqual(
+			get_unbilled_periods(line, POSTING_DATE),
+			[getdate("2026-03-01"), getdate("2026-04-01"), getdate("2026-05-01")],
+		)
+
+	def test_unbilled_periods_start_at_start_date_and_stop_after_end_date(self):
+		line = _line(frequency="Quarterly", start_date="2025-11-20", end_date="2026-02-10")
+		self.assertEqual(
+			get_unbilled_periods(line, POSTING_DATE), [getdate("2025-10-01"), getdate("2026-01-01")]
+		)
+
+	def test_due_lines(self):
+		customer = _make_customer(
+			"_Test Recurring Selection",
+			[
+				{"service_item": self.item, "frequency": "Monthly", "start_date": "2026-01-01"},
+				# current period already invoiced
+				{
+					"service_item": self.item,
+					"frequency": "Quarterly",
+					"start_date": "2026-01-01",
+					"last_invoiced_period": "2026-04-01",
+				},
+				# ended within its last invoiced period
+				{
+					"service_item": self.item,
+					"frequency": "Monthly",
+					"start_date": "2025-01-01",
+					"end_date": "2026-03-20",
+					"last_invoiced_period": "2026-03-01",
+				},
+				# not started yet
+				{"service_item": self.item, "frequency": "Monthly", "start_date": "2026-06-01"},
+			],
+		)
+		due = get_due_services(POSTING_DATE, [customer.name])
+		rows = customer.get(SERVICE_FIELD)
+		self.assertEqual([line.name for line in due], [rows[0].name])
+
+	def test_failed_invoice_rolls_back_only_itself(self):
+		good = _make_customer(
+			"_Test Recurring Good",
+			[{"service_item": self.item, "frequency": "Monthly", "start_date": "2026-05-01"}],
+		)
+		bad = _make_customer(
+			"_Test Recurring Bad",
+			[{"service_item": self.item, "frequency": "Monthly", "start_date": "2026-04-01", "qty": 1}],
+		)
+		bad_line = bad.get(SERVICE_FIELD)[0].name
+
+		def build_invoice(ctx, customer, period_start, lines):
+			def insert():
+				if customer == bad.name:
+					# a write made before the failure must be undone with the invoice
+					frappe.db.set_value(SERVICE_TABLE, bad_line, "qty", 99)
+					raise frappe.ValidationError("broken invoice")
+
+			return frappe._dict(
+				name=f"{customer}-{period_start}", customer=customer, insert=insert, submit=lambda: None
+			)
+
+		with (
+			patch(
+				"bs_space.recurring_invoicing.resolve_context",
+				return_value=frappe._dict(fetch_resolver=MagicMock()),
+			),
+			patch("bs_space.recurring_invoicing.build_invoice", side_effect=build_invoice),
+			patch("bs_space.recurring_invoicing.frappe.log_error"),
+			patch.object(frappe.db, "commit"),
+		):
+			created = invoice_customers.__wrapped__([good.name, bad.name], POSTING_DATE)
+
+		self.assertEqual(created, [f"{good.name}-2026-05-01"])
+		self.assertEqual(
+			getdate(
+				frappe.db.get_value(SERVICE_TABLE, good.get(SERVICE_FIELD)[0].name, "last_invoiced_period")
+			),
+			getdate("2026-05-01"),
+		)
+		# April failed, so May was not attempted and nothing of the bad client was kept
+		self.assertIsNone(frappe.db.get_value(SERVICE_TABLE, bad_line, "last_invoiced_period"))
+		self.assertEqual(frappe.db.get_value(SERVICE_TABLE, bad_line, "qty"), 1)
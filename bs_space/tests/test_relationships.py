@@ -0,0 +1,70 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from bs_space.relationships import get_table_field
+
+
+def _make_customer(customer_name, **values):
+	return frappe.get_doc(
+		{
+			"doctype": "Customer",
+			"customer_name": customer_name,
+			"customer_group": "All Customer Groups",
+			"territory": "All Territories",
+			**values,
+		}
+	).insert(ignore_permissions=True)
+
+
+def _make_individual(first_name, sponsor):
+	return frappe.get_doc(
+		{
+			"doctype": "Linked Individual",
+			"first_name": first_name,
+			"last_name": "Test",
+			"passport_number": frappe.generate_hash(length=9).upper(),
+			"parent_type": "Customer",
+			"visa_parent": sponsor,
+			"has_visa": 0,
+		}
+	).insert(ignore_permissions=True)
+
+
+class TestRemoveLinks(FrappeTestCase):
+	def test_deleting_one_of_two_shareholders(self):
+		sponsor = _make_customer("_Test Shareholder Sponsor")
+		first = _make_individual("First", sponsor.name)
+		second = _make_individual("Second", sponsor.name)
+		field = get_table_field("shareholders")
+		company = _make_customer(
+			"_Test Two Shareholder Company",
+			**{
+				field: [
+					{
+						"shareholder_type": "Individual",
+						"shareholder_doctype": "Linked Individual",
+						"shareholder": person.name,
+						"shareholding_pct": 50,
+						"is_shareholder": 1,
+						"is_directormanager": 1,
+						"is_ubo": 1,
+						"is_signatory": 1,
+					}
+					for person in (first, second)
+				]
+			},
+		)
+
+		# the cap table drops to 50%, which a full Customer save would reject
+		frappe.delete_doc("Linked Individual", first.name, ignore_permissions=True, force=True)
+
+		company.reload()
+		self.assertEqual([row.shareholder for row in company.get(field)], [second.name])
+		# the change log rows are queued until the transaction commits
+		self.assertIn(
+			(company.name, "shareholders", "Removed", first.name),
+			[(row[2], row[3], row[4], row[6]) for row in frappe.local.bs_link_changes or []],
+		)
@@ -0,0 +1,76 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+from frappe.utils import add_days, today
+
+from bs_space.renewals import _template_bounds, get_due_renewals
+
+
+def _make_customer(customer_name, expires_in, **values):
+	return frappe.get_doc(
+		{
+			"doctype": "Customer",
+			"customer_name": customer_name,
+			"customer_group": "All Customer Groups",
+			"territory": "All Territories",
+			"custom_license_expiry_date": add_days(today(), expires_in),
+			**values,
+		}
+	).insert(ignore_permissions=True)
+
+
+def _make_renewal(customer, status, expiry_date=None):
+	return frappe.get_doc(
+		{
+			"doctype": "Project",
+			"project_name": f"{customer.name} renewal {frappe.generate_hash(length=6)}",
+			"status": status,
+			"custom_renewal_of": "Customer",
+			"custom_renewal_for": customer.name,
+			"custom_renewal_expiry_date": expiry_date,
+		}
+	).insert(ignore_permissions=True)
+
+
+class TestRenewals(FrappeTestCase):
+	def _due(self):
+		return {row.name for row in get_due_renewals("Licence", add_days(today(), 30))}
+
+	def test_due_renewals_within_window(self):
+		due = _make_customer("_Test Renewal Due", 10)
+		later = _make_customer("_Test Renewal Later", 45)
+		expired = _make_customer("_Test Renewal Expired", -1)
+		disabled = _make_customer("_Test Renewal Disabled", 10, disabled=1)
+
+		selected = self._due()
+		self.assertIn(due.name, selected)
+		self.assertNotIn(later.name, selected)
+		self.assertNotIn(expired.name, selected)
+		self.assertNotIn(disabled.name, selected)
+
+	def test_skips_existing_renewals(self):
+		open_renewal = _make_customer("_Test Renewal Open Project", 10)
+		_make_renewal(open_renewal, "Open")
+		# cancelled renewal for this very expiry: not raised again
+		cancelled = _make_customer("_Test Renewal Cancelled Project", 10)
+		_make_renewal(cancelled, "Cancelled", cancelled.custom_license_expiry_date)
+		# a completed renewal of an earlier expiry does not count
+		renewed_before = _make_customer("_Test Renewal Completed Earlier", 10)
+		_make_renewal(renewed_before, "Completed", add_days(today(), -355))
+
+		selected = self._due()
+		self.assertNotIn(open_renewal.name, selected)
+		self.assertNotIn(cancelled.name, selected)
+		self.assertIn(renewed_before.name, selected)
+
+	def test_template_bounds(self):
+		tasks = [
+			frappe._dict(name="A", parent_task=None),
+			frappe._dict(name="A1", parent_task="A"),
+			frappe._dict(name="A2", parent_task="A"),
+			# parent outside the template: a root of its own
+			frappe._dict(name="B", parent_task="OTHER"),
+		]
+		self.assertEqual(_template_bounds(tasks), {"A": (1, 6), "A1": (2, 3), "A2": (4, 5), "B": (7, 8)})
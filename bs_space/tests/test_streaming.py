@@ -0,0 +1,47 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+from unittest.mock import patch
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from bs_space.streaming import iter_keyset
+
+
+def _fetcher(names, calls):
+	rows = [frappe._dict(name=name) for name in names]
+
+	def fetch(after, limit):
+		calls.append(after)
+		return [row for row in rows if row.name > after][:limit]
+
+	return fetch
+
+
+class TestIterKeyset(FrappeTestCase):
+	def test_batches_follow_the_last_key(self):
+		calls, progress = [], []
+		batches = list(
+			iter_keyset(
+				_fetcher(["a", "b", "c", "d", "e"], calls),
+				batch_size=2,
+				progress=lambda size, done: progress.append((size, done)),
+			)
+		)
+		self.assertEqual([[r.name for r in batch] for batch in batches], [["a", "b"], ["c", "d"], ["e"]])
+		# a short batch ends the scan without another query
+		self.assertEqual(calls, ["", "b", "d"])
+		self.assertEqual(progress, [(2, 2), (2, 4), (1, 5)])
+
+	def test_full_last_batch_needs_one_empty_read(self):
+		calls = []
+		batches = list(iter_keyset(_fetcher(["a", "b", "c", "d"], calls), batch_size=2))
+		self.assertEqual(len(batches), 2)
+		self.assertEqual(calls, ["", "b", "d"])
+
+	def test_commits_after_each_batch(self):
+		with patch.object(frappe.db, "commit") as commit:
+			for _batch in iter_keyset(_fetcher(["a", "b", "c"], []), batch_size=2, commit=True):
+				pass
+		self.assertEqual(commit.call_count, 2)
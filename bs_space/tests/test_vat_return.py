@@ -0,0 +1,63 @@
+# Copyright (c) 2025, Best Solution® and Contributors
+# See license.txt
+
+import frappe
+from frappe.tests.utils import FrappeTestCase
+
+from bs_space.vat_return import build_vat_return
+
+
+def _row(box, amount, vat_amount, emirate=""):
+	return frappe._dict(box=box, emirate=emirate, amount=amount, vat_amount=vat_amount)
+
+
+class TestBuildVatReturn(FrappeTestCase):
+	def test_box_mapping_and_totals(self):
+		lines = build_vat_return(
+			[
+				_row("1", 100, 5, "Dubai"),
+				_row("1", 40, 2, "Dubai"),
+				_row("1", 10, 0.5),
+				_row("4", 50, 0),
+				_row("2", 0, -1),
+				_row("9", 200, 10),
+				_row("10", 30, 1.5),
+			]
+		)
+		by_box = {line.box: line for line in lines}
+
+		self.assertEqual((by_box["1b"].amount, by_box["1b"].vat_amount), (140, 7))
+		self.assertEqual(by_box["1a"].amount, 0)
+		# box 1 lines of invoices without an emirate are reported separately
+		self.assertEqual(by_box["1"].amount, 10)
+		self.assertEqual((by_box["8"].amount, by_box["8"].vat_amount), (200, 6.5))
+		self.assertEqual((by_box["11"].amount, by_box["11"].vat_amount), (230, 11.5))
+		self.assertEqual(by_box["12"].vat_amount, 6.5)
+		self.assertEqual(by_box["13"].vat_amount, 11.5)
+		self.assertEqual(by_box["14"].vat_amount, -5)
+
+	def test_empty_return_lists_every_box(self):
+		boxes = [line.box for line in build_vat_return([])]
+		self.assertEqual(
+			boxes,
+			[
+				"1a",
+				"1b",
+				"1c",
+				"1d",
+				"1e",
+				"1f",
+				"1g",
+				"2",
+				"3",
+				"4",
+				"5",
+				"8",
+				"9",
+				"10",
+				"11",
+				"12",
+				"13",
+				"14",
+			],
+		)
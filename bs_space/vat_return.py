@@ -0,0 +1,272 @@
+import hashlib
+
+import frappe
+from frappe import _
+from frappe.utils import flt, get_first_day, get_last_day, getdate, now
+
+from bs_space.replica import read_from_replica
+
+TOTALS_DOCTYPE = "VAT Return Total"
+
+# VAT 201 box 1 is reported per emirate (1a … 1g)
+EMIRATE_BOXES = {
+	"Abu Dhabi": "1a",
+	"Dubai": "1b",
+	"Sharjah": "1c",
+	"Ajman": "1d",
+	"Umm Al Quwain": "1e",
+	"Ras Al Khaimah": "1f",
+	"Fujairah": "1g",
+}
+
+BOX_LABELS = {
+	"1": "Standard rated supplies",
+	"2": "Tax refunds provided to tourists under the Tax Refunds for Tourists Scheme",
+	"3": "Supplies subject to the reverse charge provisions",
+	"4": "Zero rated supplies",
+	"5": "Exempt supplies",
+	"8": "Totals",
+	"9": "Standard rated expenses",
+	"10": "Supplies subject to the reverse charge provisions",
+	"11": "Totals",
+	"12": "Total value of due tax for the period",
+	"13": "Total value of recoverable tax for the period",
+	"14": "Payable tax for the period",
+}
+
+OUTPUT_BOXES = ("1", "2", "3", "4", "5")
+INPUT_BOXES = ("9", "10")
+
+_PERIOD = "date_format(inv.posting_date, '%%Y-%%m-01')"
+
+
+def _sales_query(doctype, condition):
+	"""Boxes 1/4/5 from item lines and box 2 from the tourist refund, for Sales / POS Invoice."""
+	if doctype == "Sales Invoice":
+		# POS sales are counted from the POS Invoices themselves, not their consolidated invoice
+		condition += " and ifnull(inv.is_consolidated, 0) = 0"
+
+	return f"""
+		select inv.company, {_PERIOD} as period_start,
+			case when item.is_exempt = 1 then '5' when item.is_zero_rated = 1 then '4' else '1' end as box,
+			case when item.is_exempt = 1 or item.is_zero_rated = 1 then '' else ifnull(inv.vat_emirate, '') end
+				as emirate,
+			sum(item.base_net_amount) as amount,
+			sum(ifnull(item.tax_amount, 0) * inv.conversion_rate) as vat_amount
+		from `tab{doctype}` inv
+		join `tab{doctype} Item` item on item.parent = inv.name and item.parenttype = '{doctype}'
+		where {condition}
+		group by inv.company, period_start, box, emirate
+		union all
+		select inv.company, {_PERIOD}, '2', '', 0, -sum(inv.tourist_tax_return)
+		from `tab{doctype}` inv
+		where {condition} and ifnull(inv.tourist_tax_return, 0) != 0
+		group by inv.company, {_PERIOD}
+	"""
+
+
+def _purchase_query(doctype, condition):
+	"""
+	Boxes 3 and 10 (reverse charge) from item lines, box 9 from the standard rated expense lines
+	(zero-rated and exempt purchases carry no tax rate) and the recoverable VAT on the invoice.
+	"""
+	reverse_charge = "inv.reverse_charge = 'Y'"
+	return f"""
+		select inv.company, {_PERIOD} as period_start,
+			case when {reverse_charge} then '3' else '9' end as box, '' as emirate,
+			sum(item.base_net_amount) as amount,
+			sum(case when {reverse_charge} then ifnull(item.tax_amount, 0) * inv.conversion_rate else 0 end)
+				as vat_amount
+		from `tab{doctype}` inv
+		join `tab{doctype} Item` item on item.parent = inv.name and item.parenttype = '{doctype}'
+		where {condition} and ({reverse_charge} or ifnull(item.tax_rate, 0) > 0)
+		group by inv.company, period_start, box
+		union all
+		select inv.company, {_PERIOD}, '10', '',
+			sum(item.base_net_amount),
+			sum(ifnull(item.tax_amount, 0) * inv.conversion_rate * ifnull(inv.recoverable_reverse_charge, 100) / 100)
+		from `tab{doctype}` inv
+		join `tab{doctype} Item` item on item.parent = inv.name and item.parenttype = '{doctype}'
+		where {condition} and {reverse_charge}
+		group by inv.company, {_PERIOD}
+		union all
+		select inv.company, {_PERIOD}, '9', '', 0, sum(ifnull(inv.recoverable_standard_rated_expenses, 0))
+		from `tab{doctype}` inv
+		where {condition} and not ({reverse_charge})
+		group by inv.company, {_PERIOD}
+	"""
+
+
+SOURCE_QUERIES = {
+	"Sales Invoice": _sales_query,
+	"POS Invoice": _sales_query,
+	"Purchase Invoice": _purchase_query,
+}
+
+
+def _bucket_name(company, period_start, box, emirate):
+	return hashlib.md5(f"{company}|{period_start}|{box}|{emirate}".encode()).hexdigest()[:20]
+
+
+def _add_to_totals(rows, sign=1):
+	"""Add (or with sign=-1 subtract) aggregated rows to the running totals in one upsert."""
+	rows = [r for r in rows if flt(r.amount) or flt(r.vat_amount)]
+	if not rows:
+		return
+
+	timestamp, user = now(), frappe.session.user
+	values = []
+	for r in rows:
+		period_start = str(r.period_start)
+		values.extend(
+			(
+				_bucket_name(r.company, period_start, r.box, r.emirate),
+				r.company,
+				period_start,
+				r.box,
+				r.emirate,
+				sign * flt(r.amount),
+				sign * flt(r.vat_amount),
+				timestamp,
+				timestamp,
+				user,
+				user,
+			)
+		)
+
+	placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)"] * len(rows))
+	frappe.db.sql(
+		f"""
+		insert into `tabVAT Return Total`
+			(name, company, period_start, box, emirate, amount, vat_amount, creation, modified, owner, modified_by)
+		values {placeholders}
+		on duplicate key update
+			amount = amount + values(amount),
+			vat_amount = vat_amount + values(vat_amount),
+			modified = values(modified)
+		""",
+		values,
+	)
+
+
+def _aggregate(doctype, condition, values):
+	return frappe.db.sql(SOURCE_QUERIES[doctype](doctype, condition), values, as_dict=True)
+
+
+# ---- hooks ----
+
+
+def on_submit(doc, method=None):
+	"""Sales / POS / Purchase Invoice on_submit: add the invoice to its period totals."""
+	_add_to_totals(_aggregate(doc.doctype, "inv.name = %(name)s", {"name": doc.name}))
+
+
+def on_cancel(doc, method=None):
+	_add_to_totals(_aggregate(doc.doctype, "inv.name = %(name)s", {"name": doc.name}), sign=-1)
+
+
+# ---- rebuild ----
+
+
+def rebuild_vat_totals(from_date, to_date, company=None):
+	"""Recompute the running totals of whole months covering from_date … to_date from the ledger."""
+	from_date, to_date = get_first_day(getdate(from_date)), get_last_day(getdate(to_date))
+	values = {"from_date": from_date, "to_date": to_date, "company": company}
+
+	filters = {"period_start": ["between", [from_date, to_date]]}
+	if company:
+		filters["company"] = company
+	frappe.db.delete(TOTALS_DOCTYPE, filters)
+
+	condition = "inv.docstatus = 1 and inv.posting_date between %(from_date)s and %(to_date)s"
+	if company:
+		condition += " and inv.company = %(company)s"
+	for doctype in SOURCE_QUERIES:
+		_add_to_totals(_aggregate(doctype, condition, values))
+	frappe.db.commit()
+
+
+@frappe.whitelist()
+def enqueue_rebuild_vat_totals(from_date, to_date, company=None):
+	frappe.only_for(("Accounts Manager", "System Manager"))
+	frappe.enqueue(
+		"bs_space.vat_return.rebuild_vat_totals",
+		queue="long",
+		from_date=from_date,
+		to_date=to_date,
+		company=company,
+	)
+
+
+# ---- returns ----
+
+
+def _line(box, amount=0.0, vat_amount=0.0, label=None):
+	return frappe._dict(
+		box=box, label=label or _(BOX_LABELS[box]), amount=flt(amount, 2), vat_amount=flt(vat_amount, 2)
+	)
+
+
+def build_vat_return(rows):
+	"""Lay out aggregated (box, emirate, amount, vat_amount) rows as a VAT 201 return."""
+	totals = {}
+	for r in rows:
+		key = EMIRATE_BOXES.get(r.emirate, "1") if r.box == "1" else r.box
+		amount, vat_amount = totals.get(key, (0.0, 0.0))
+		totals[key] = (amount + flt(r.amount), vat_amount + flt(r.vat_amount))
+
+	output = [
+		_line(sub_box, *totals.get(sub_box, (0, 0)), label=_("{0} - {1}").format(_(BOX_LABELS["1"]), emirate))
+		for emirate, sub_box in EMIRATE_BOXES.items()
+	]
+	if "1" in totals:
+		# box 1 lines without an emirate on the invoice
+		output.append(_line("1", *totals["1"], label=_("{0} - emirate not set").format(_(BOX_LABELS["1"]))))
+	output.extend(_line(box, *totals.get(box, (0, 0))) for box in OUTPUT_BOXES[1:])
+	output_total = _line("8", sum(l.amount for l in output), sum(l.vat_amount for l in output))
+
+	inputs = [_line(box, *totals.get(box, (0, 0))) for box in INPUT_BOXES]
+	input_total = _line("11", sum(l.amount for l in inputs), sum(l.vat_amount for l in inputs))
+
+	return [
+		*output,
+		output_total,
+		*inputs,
+		input_total,
+		_line("12", vat_amount=output_total.vat_amount),
+		_line("13", vat_amount=input_total.vat_amount),
+		_line("14", vat_amount=output_total.vat_amount - input_total.vat_amount),
+	]
+
+
+def _read_totals(from_date, to_date, companies=None):
+	filters = {"period_start": ["between", [get_first_day(getdate(from_date)), getdate(to_date)]]}
+	if companies:
+		filters["company"] = ["in", companies]
+	return frappe.get_all(
+		TOTALS_DOCTYPE,
+		filters=filters,
+		fields=["company", "box", "emirate", "sum(amount) as amount", "sum(vat_amount) as vat_amount"],
+		group_by="company, box, emirate",
+	)
+
+
+@frappe.whitelist()
+@read_from_replica()
+def get_vat_return(company, from_date, to_date):
+	"""VAT 201 return of one company, read from the pre-aggregated totals."""
+	frappe.has_permission(TOTALS_DOCTYPE, "read", throw=True)
+	return build_vat_return(_read_totals(from_date, to_date, [company]))
+
+
+@frappe.whitelist()
+@read_from_replica()
+def get_portfolio_vat_returns(from_date, to_date, companies=None):
+	"""VAT 201 returns of many (default: all) companies from a single grouped read."""
+	frappe.has_permission(TOTALS_DOCTYPE, "read", throw=True)
+	companies = frappe.parse_json(companies) if isinstance(companies, str) else companies
+
+	by_company = {}
+	for row in _read_totals(from_date, to_date, companies):
+		by_company.setdefault(row.company, []).append(row)
+	return {company: build_vat_return(rows) for company, rows in by_company.items()}